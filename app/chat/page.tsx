@@ -293,6 +293,7 @@ export default function ChatPage() {
     }
 
     const userMessageContent = currentMessage
+    const filesToAttach = uploadedFiles
     setCurrentMessage("")
     setUploadedFiles([])
     setIsSending(true)
@@ -302,7 +303,8 @@ export default function ChatPage() {
 
     try {
       // Add user message to backend immediately
-      const userMessage = await addMessage(conversationId, "user", userMessageContent)
+      const attachments = await Promise.all(filesToAttach.map(upload => qlippyAPI.uploadAttachment(upload.file)))
+      const userMessage = await addMessage(conversationId, "user", userMessageContent, attachments.map(attachment => attachment.id))
       console.log('User message added to backend:', userMessage)
       
       // Force refresh the active conversation to ensure the message is visible
@@ -27,9 +27,12 @@ import {
   SidebarInset,
   SidebarProvider,
 } from "@/components/ui/sidebar"
-import { qlippyAPI, Conversation, SearchResult } from "@/lib/api"
+import { qlippyAPI, Conversation, SearchResult, TitleSuggestions } from "@/lib/api"
 import { useRouter } from "next/navigation"
 
+// Shorter queries only get title suggestions; full-text search scans every message
+const MIN_FULL_SEARCH_LENGTH = 3
+
 interface SearchFilters {
   showUserMessages: boolean;
   showAssistantMessages: boolean;
@@ -40,6 +43,7 @@ export default function SearchPage() {
   const router = useRouter()
   const [searchQuery, setSearchQuery] = React.useState("")
   const [searchResults, setSearchResults] = React.useState<SearchResult | null>(null)
+  const [suggestions, setSuggestions] = React.useState<TitleSuggestions | null>(null)
   const [isSearching, setIsSearching] = React.useState(false)
   const [showDeleteDialog, setShowDeleteDialog] = React.useState(false)
   const [conversationToDelete, setConversationToDelete] = React.useState<string | null>(null)
@@ -77,7 +81,7 @@ export default function SearchPage() {
       clearTimeout(searchTimeoutRef.current)
     }
 
-    if (searchQuery.trim()) {
+    if (searchQuery.trim().length >= MIN_FULL_SEARCH_LENGTH) {
       searchTimeoutRef.current = setTimeout(() => {
         performSearch(searchQuery)
       }, 300) // 300ms debounce
@@ -92,6 +96,30 @@ export default function SearchPage() {
     }
   }, [searchQuery, performSearch])
 
+  // Title suggestions on every keystroke
+  React.useEffect(() => {
+    const prefix = searchQuery.trim()
+    if (!prefix) {
+      setSuggestions(null)
+      return
+    }
+
+    let cancelled = false
+    qlippyAPI.suggestTitles(prefix)
+      .then(result => {
+        if (!cancelled) setSuggestions(result)
+      })
+      .catch(error => console.error('Suggestions failed:', error))
+
+    return () => {
+      cancelled = true
+    }
+  }, [searchQuery])
+
+  const completeTerm = (term: string) => {
+    setSearchQuery(searchQuery.replace(/\S*$/, term) + ' ')
+  }
+
   const handleDeleteClick = (conversationId: string, event: React.MouseEvent) => {
     event.stopPropagation()
     setConversationToDelete(conversationId)
@@ -247,6 +275,43 @@ export default function SearchPage() {
                   )}
                 </div>
 
+                {/* Title Suggestions */}
+                {suggestions && !searchResults && (suggestions.terms.length > 0 || suggestions.conversations.length > 0) && (
+                  <Card>
+                    <CardContent className="p-2 space-y-1">
+                      {suggestions.terms.length > 0 && (
+                        <div className="flex flex-wrap gap-2 px-2 py-1">
+                          {suggestions.terms.map(term => (
+                            <Badge
+                              key={term}
+                              variant="outline"
+                              className="cursor-pointer"
+                              onClick={() => completeTerm(term)}
+                            >
+                              {term}
+                            </Badge>
+                          ))}
+                        </div>
+                      )}
+                      {suggestions.conversations.map(conversation => (
+                        <button
+                          key={conversation.id}
+                          className="w-full flex items-center justify-between gap-2 rounded px-2 py-1.5 text-left hover:bg-muted/50"
+                          onClick={() => handleConversationClick(conversation.id)}
+                        >
+                          <span className="flex items-center gap-2 truncate">
+                            <MessageSquare className="h-4 w-4 shrink-0 text-muted-foreground" />
+                            {highlightText(conversation.title, suggestions.prefix)}
+                          </span>
+                          <span className="text-xs text-muted-foreground shrink-0">
+                            {formatTimestamp(conversation.last_updated)}
+                          </span>
+                        </button>
+                      ))}
+                    </CardContent>
+                  </Card>
+                )}
+
                 {/* Filters */}
                 <div className="flex items-center gap-2">
                   <Button
@@ -334,7 +399,7 @@ export default function SearchPage() {
                   </div>
                 )}
 
-                {searchQuery && !isSearching && filteredResults.length === 0 && (
+                {searchResults && !isSearching && filteredResults.length === 0 && (
                   <Card>
                     <CardContent className="text-center py-12">
                       <Search className="h-16 w-16 mx-auto text-muted-foreground/50 mb-4" />
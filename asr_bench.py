@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Qlippy ASR Benchmark
+Replays a directory of WAV files through the transcription path and reports
+real-time factor, latency percentiles, throughput, peak memory and word error
+rate. A reference transcript for recording.wav is read from recording.txt
+next to it, if present.
+
+Modes:
+- direct: load the engine in this process and transcribe each file in turn
+- ws: start a local voice server (uvicorn) and stream the files over
+  /ws/record from N concurrent clients
+
+Everything runs offline against the local machine. Engine settings are the
+server's QLIPPY_* environment variables (e.g. QLIPPY_ASR_ENGINE=stub).
+
+Usage: python asr_bench.py recordings/ [--mode direct|ws|both] [--clients 4] [--rounds 1] [--realtime] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+from voice_client import read_wav, stream_wav
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def latency_summary(values):
+    return {
+        "p50_ms": round(percentile(values, 0.50) * 1000, 1) if values else None,
+        "p95_ms": round(percentile(values, 0.95) * 1000, 1) if values else None,
+        "p99_ms": round(percentile(values, 0.99) * 1000, 1) if values else None,
+        "max_ms": round(max(values) * 1000, 1) if values else None
+    }
+
+
+def normalize(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """(edit distance in words, reference word count)"""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            ))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def load_corpus(directory):
+    corpus = []
+    for path in sorted(Path(directory).glob("*.wav")):
+        pcm, sample_rate = read_wav(str(path))
+        reference = path.with_suffix(".txt")
+        corpus.append({
+            "name": path.name,
+            "path": str(path),
+            "samples": np.frombuffer(pcm, dtype="<i2"),
+            "sample_rate": sample_rate,
+            "duration": len(pcm) / 2 / sample_rate,
+            "reference": reference.read_text().strip() if reference.exists() else None
+        })
+    return corpus
+
+
+def wer_summary(results):
+    errors = words = 0
+    for result in results:
+        if result.get("errors") is not None:
+            errors += result["errors"]
+            words += result["reference_words"]
+    return round(errors / words, 4) if words else None
+
+
+def score(result, item, text):
+    result["text"] = text
+    if item["reference"] is not None:
+        result["errors"], result["reference_words"] = word_errors(item["reference"], text)
+    return result
+
+
+def peak_rss_mb(usage):
+    # ru_maxrss is KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss / scale, 1)
+
+
+# Direct mode
+
+def bench_direct(corpus, rounds):
+    import server
+
+    started = time.perf_counter()
+    engine = server.load_engine()
+    load_seconds = time.perf_counter() - started
+
+    results = []
+    wall_started = time.perf_counter()
+    for _ in range(rounds):
+        for item in corpus:
+            started = time.perf_counter()
+            text = server.run_transcription(engine, (item["samples"], item["sample_rate"]))
+            elapsed = time.perf_counter() - started
+            results.append(score({"file": item["name"], "latency": elapsed, "rtf": elapsed / item["duration"]}, item, text))
+    wall = time.perf_counter() - wall_started
+
+    audio_seconds = sum(item["duration"] for item in corpus) * rounds
+    return {
+        "mode": "direct",
+        "engine": engine.describe(),
+        "load_seconds": round(load_seconds, 2),
+        "files": len(results),
+        "audio_seconds": round(audio_seconds, 2),
+        "rtf": round(sum(r["latency"] for r in results) / audio_seconds, 4),
+        "latency": latency_summary([r["latency"] for r in results]),
+        "throughput_audio_seconds_per_second": round(audio_seconds / wall, 2),
+        "peak_rss_mb": peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF)),
+        "wer": wer_summary(results),
+        "results": results
+    }
+
+
+# Websocket mode
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_health(base_url, process, timeout=300):
+    """
+    Wait until the server answers and its model is loaded, so no timed request
+    pays for the load. Returns (health, seconds until it answered, seconds
+    until the model was ready).
+    """
+    started = time.perf_counter()
+    deadline = time.time() + timeout
+    delay = 0.05
+    answered = None
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Voice server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=1) as response:
+                health = json.load(response)
+        except OSError:
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+            continue
+        if answered is None:
+            answered = time.perf_counter() - started
+            if not health["ready"]:
+                # Loads the model if QLIPPY_ASR_PRELOAD=false left it unloaded
+                urllib.request.urlopen(urllib.request.Request(f"{base_url}/warmup", method="POST"), timeout=5).close()
+        if health["ready"]:
+            return health, answered, time.perf_counter() - started
+        if health["asr_state"] == "error":
+            raise RuntimeError(f"Voice server failed to load its model: {health['asr_pool']['load_error']}")
+        time.sleep(0.1)
+    raise RuntimeError(f"Voice server model not ready after {timeout}s")
+
+
+class TreeRSSSampler:
+    """Polls the summed RSS of a process and its children (server plus ASR workers)"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Peak RSS in MB, or None if sampling never started"""
+        if not self._thread.is_alive():
+            return None
+        self._stop.set()
+        self._thread.join()
+        return round(self.peak_kb / 1024, 1)
+
+    def sample(self):
+        try:
+            output = subprocess.run(["ps", "-A", "-o", "pid=,ppid=,rss="], capture_output=True, text=True).stdout
+        except OSError:
+            return
+        children, rss = {}, {}
+        for line in output.splitlines():
+            pid, ppid, kb = (int(field) for field in line.split())
+            children.setdefault(ppid, []).append(pid)
+            rss[pid] = kb
+        total, stack = 0, [self.pid]
+        while stack:
+            pid = stack.pop()
+            total += rss.get(pid, 0)
+            stack.extend(children.get(pid, []))
+        self.peak_kb = max(self.peak_kb, total)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+
+async def run_clients(corpus, url, clients, rounds, realtime):
+    jobs = asyncio.Queue()
+    for _ in range(rounds):
+        for item in corpus:
+            jobs.put_nowait(item)
+
+    results = []
+
+    async def client():
+        while not jobs.empty():
+            item = jobs.get_nowait()
+            marks = {}
+            started = time.perf_counter()
+            message = await stream_wav(
+                item["path"], url, realtime,
+                on_stop=lambda: marks.setdefault("stop", time.perf_counter())
+            )
+            finished = time.perf_counter()
+            result = {
+                "file": item["name"],
+                "status": message["status"],
+                # End of speech is when the last audio frame went out
+                "latency": finished - marks.get("stop", finished),
+                "total": finished - started
+            }
+            results.append(score(result, item, message.get("transcription", "")) if message["status"] == "final" else result)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return results
+
+
+def bench_ws(corpus, clients, rounds, realtime):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    sampler = TreeRSSSampler(process.pid)
+    try:
+        health, startup_seconds, load_seconds = wait_for_health(f"http://127.0.0.1:{port}", process)
+        sampler.start()
+
+        wall_started = time.perf_counter()
+        results = asyncio.run(run_clients(corpus, f"ws://127.0.0.1:{port}/ws/record", clients, rounds, realtime))
+        wall = time.perf_counter() - wall_started
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5) as response:
+            health = json.load(response)
+    finally:
+        peak_rss = sampler.stop()
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    completed = [r for r in results if r["status"] == "final"]
+    audio_seconds = sum(item["duration"] for item in corpus) * rounds
+    return {
+        "mode": "ws",
+        "engine": health["asr_engine"],
+        "clients": clients,
+        "realtime": realtime,
+        "startup_seconds": round(startup_seconds, 2),
+        "load_seconds": round(load_seconds, 2),
+        "files": len(results),
+        "failed": len(results) - len(completed),
+        "audio_seconds": round(audio_seconds, 2),
+        "end_of_speech_latency": latency_summary([r["latency"] for r in completed]),
+        "throughput_audio_seconds_per_second": round(audio_seconds / wall, 2),
+        "throughput_requests_per_second": round(len(completed) / wall, 2),
+        "peak_rss_mb": peak_rss,
+        "wer": wer_summary(completed),
+        "pool": health["asr_pool"],
+        "results": results
+    }
+
+
+def print_report(report):
+    print(f"\n=== {report['mode']} ({report['engine']['engine']} {report['engine']['model']}) ===")
+    print(f"Files:       {report['files']} ({report['audio_seconds']}s of audio), model load {report['load_seconds']}s")
+    if "startup_seconds" in report:
+        print(f"Startup:     server answered after {report['startup_seconds']}s, model ready after {report['load_seconds']}s")
+    if "rtf" in report:
+        print(f"RTF:         {report['rtf']}")
+        latency = report["latency"]
+    else:
+        print(f"Clients:     {report['clients']}{' (real time)' if report['realtime'] else ''}, failed {report['failed']}")
+        print(f"Requests/s:  {report['throughput_requests_per_second']}")
+        latency = report["end_of_speech_latency"]
+    print(f"Latency:     p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  p99 {latency['p99_ms']}ms  max {latency['max_ms']}ms")
+    print(f"Throughput:  {report['throughput_audio_seconds_per_second']}s of audio per second")
+    print(f"Peak RSS:    {report['peak_rss_mb']} MB")
+    print(f"WER:         {report['wer'] if report['wer'] is not None else 'n/a (no reference transcripts)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Qlippy speech-to-text")
+    parser.add_argument("directory", help="directory of 16-bit mono WAV files (with optional .txt references)")
+    parser.add_argument("--mode", choices=["direct", "ws", "both"], default="both")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent websocket clients")
+    parser.add_argument("--rounds", type=int, default=1, help="times to replay the directory")
+    parser.add_argument("--realtime", action="store_true", help="stream audio at real-time speed")
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.directory)
+    if not corpus:
+        sys.exit(f"No WAV files in {args.directory}")
+
+    reports = []
+    if args.mode in ("direct", "both"):
+        reports.append(bench_direct(corpus, args.rounds))
+        print_report(reports[-1])
+    if args.mode in ("ws", "both"):
+        reports.append(bench_ws(corpus, args.clients, args.rounds, args.realtime))
+        print_report(reports[-1])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\nFull report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Speech-to-text engines for the Qlippy voice server.
+Every engine takes float32 16 kHz mono audio and returns the transcribed
+text, so backends can be swapped without touching the websocket protocol.
+
+- whisper: openai-whisper (PyTorch)
+- faster-whisper: CTranslate2 with int8 quantization, much faster on CPU
+- stub: no model at all, for tests and load tests
+"""
+
+import os
+import time
+
+INITIAL_PROMPT = "The following is a voice command or message:"
+
+
+class ASREngine:
+    name = "base"
+    supports_batching = False  # True when transcribe_batch is faster than a loop
+
+    def __init__(self, model_size="base", compute_type="int8", threads=None, beam_size=1, language="en"):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.threads = threads or max(1, (os.cpu_count() or 1) // 2)
+        self.beam_size = beam_size
+        self.language = language
+        self.model = None
+
+    def load(self):
+        """Load the model; returns self so it can be used as a pool's load_model result"""
+        raise NotImplementedError
+
+    def transcribe(self, audio):
+        raise NotImplementedError
+
+    def transcribe_batch(self, audios):
+        """Transcribe several clips; engines that can decode them together override this"""
+        return [self.transcribe(audio) for audio in audios]
+
+    def unload(self):
+        self.model = None
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def describe(self):
+        return {
+            "engine": self.name,
+            "model": self.model_size,
+            "compute_type": self.compute_type,
+            "threads": self.threads,
+            "beam_size": self.beam_size,
+            "batching": self.supports_batching
+        }
+
+
+class WhisperEngine(ASREngine):
+    name = "whisper"
+    supports_batching = True
+
+    def load(self):
+        import torch
+        import whisper
+
+        torch.set_num_threads(self.threads)
+        self.model = whisper.load_model(self.model_size, device="cpu")
+        return self
+
+    def transcribe(self, audio):
+        result = self.model.transcribe(
+            audio,
+            language=self.language,
+            initial_prompt=INITIAL_PROMPT,
+            condition_on_previous_text=False,
+            beam_size=self.beam_size if self.beam_size > 1 else None,
+            fp16=False
+        )
+        return result["text"].strip()
+
+    def transcribe_batch(self, audios):
+        """
+        Decode up to 30 s clips as one padded mel batch: a single encoder pass
+        and a shared greedy (or beam) decode instead of one per clip.
+        """
+        if len(audios) == 1:
+            return [self.transcribe(audios[0])]
+        import torch
+        import whisper
+
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio)), self.model.dims.n_mels)
+            for audio in audios
+        ])
+        options = whisper.DecodingOptions(
+            language=self.language,
+            prompt=INITIAL_PROMPT,
+            without_timestamps=True,
+            beam_size=self.beam_size if self.beam_size > 1 else None,
+            fp16=False
+        )
+        results = whisper.decode(self.model, mels, options)
+        return [result.text.strip() for result in results]
+
+    def describe(self):
+        # PyTorch always runs full precision on CPU
+        return dict(super().describe(), compute_type="float32")
+
+
+class FasterWhisperEngine(ASREngine):
+    name = "faster-whisper"
+
+    def load(self):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(
+            self.model_size,
+            device="cpu",
+            compute_type=self.compute_type,
+            cpu_threads=self.threads,
+            num_workers=1
+        )
+        return self
+
+    def transcribe(self, audio):
+        segments, _ = self.model.transcribe(
+            audio,
+            language=self.language,
+            initial_prompt=INITIAL_PROMPT,
+            condition_on_previous_text=False,
+            beam_size=self.beam_size
+        )
+        # Segments are generated lazily; joining them runs the decode
+        return "".join(segment.text for segment in segments).strip()
+
+
+class StubEngine(ASREngine):
+    """
+    Returns canned text. QLIPPY_ASR_STUB_RTF simulates compute time per second
+    of audio and QLIPPY_ASR_STUB_LOAD_SECONDS a slow model load.
+    """
+    name = "stub"
+
+    def load(self):
+        time.sleep(float(os.environ.get("QLIPPY_ASR_STUB_LOAD_SECONDS", 0)))
+        self.model = True
+        return self
+
+    supports_batching = True
+
+    def transcribe(self, audio):
+        self._simulate(len(audio))
+        return self._text(audio)
+
+    def transcribe_batch(self, audios):
+        # A padded batch costs about as much as its longest clip
+        self._simulate(max(len(audio) for audio in audios))
+        return [self._text(audio) for audio in audios]
+
+    def _simulate(self, samples):
+        delay = samples / 16000 * float(os.environ.get("QLIPPY_ASR_STUB_RTF", 0))
+        if delay:
+            time.sleep(delay)
+
+    def _text(self, audio):
+        return os.environ.get("QLIPPY_ASR_STUB_TEXT") or f"stub transcription of {len(audio) / 16000:.2f} seconds"
+
+
+ENGINES = {
+    WhisperEngine.name: WhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+    StubEngine.name: StubEngine
+}
+
+
+def create_engine(name, **options):
+    try:
+        engine_class = ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown ASR engine '{name}' (choose from {', '.join(ENGINES)})")
+    return engine_class(**options)
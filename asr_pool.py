@@ -0,0 +1,503 @@
+"""
+Transcription worker pool for the Qlippy voice server.
+Runs N model replicas in worker processes so transcription never blocks the
+event loop and uses more than one core. On Linux, when no other thread is
+running once the model has loaded (the load at startup), the model is loaded
+once in the parent, on a short-lived thread so the event loop keeps serving,
+and the workers are forked afterwards, sharing the weights copy-on-write.
+Otherwise, and for every replacement worker started while other threads are
+running, the workers are spawned and each loads its own replica.
+
+Jobs that arrive close together are micro-batched: a dispatcher waits up to
+batch_delay for more jobs (up to max_batch_size) and hands them to its
+replica as one batch.
+
+The model is loaded in the background (warm_up) or on the first job, and
+unloaded again after idle_timeout seconds without work, so an idle assistant
+does not hold hundreds of MB. State: unloaded, loading, ready, unloading or
+error.
+"""
+
+import asyncio
+import gc
+import multiprocessing
+import os
+import stat
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolSaturated(Exception):
+    """Raised when the job queue stays full for longer than the admission timeout"""
+
+
+def default_replicas(threads_per_replica=2):
+    return max(1, (os.cpu_count() or 1) // threads_per_replica)
+
+
+def _fork_is_safe():
+    """
+    fork copies only the calling thread, so a child forked while another thread
+    holds a lock (a logging or executor lock, say) can deadlock on it. Only
+    Linux gets fork here: macOS system libraries aren't fork-safe either.
+    """
+    return sys.platform.startswith("linux") and threading.active_count() == 1
+
+
+def _close_inherited_sockets(keep):
+    """
+    A worker forked while the server is running inherits its listening and
+    client sockets; holding them open would stop client connections from
+    closing when the server closes them. Spawned workers inherit nothing.
+    """
+    if not os.path.isdir("/dev/fd"):
+        return
+    for name in os.listdir("/dev/fd"):
+        fd = int(name)
+        if fd == keep:
+            continue
+        try:
+            if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                os.close(fd)
+        except OSError:
+            pass
+
+
+def _worker_main(conn, model, load_model, run, run_batch):
+    if model is None:
+        model = load_model()
+    else:
+        _close_inherited_sockets(keep=conn.fileno())
+    # Tell the pool this replica can take jobs
+    conn.send((None, True, "ready"))
+
+    while True:
+        try:
+            batch = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if batch is None:
+            return
+        batch_id, payloads = batch
+        try:
+            if run_batch is not None and len(payloads) > 1:
+                results = run_batch(model, payloads)
+            else:
+                results = [run(model, payload) for payload in payloads]
+            conn.send((batch_id, True, results))
+        except Exception as e:
+            conn.send((batch_id, False, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, context, model, load_model, run, run_batch):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, model, load_model, run, run_batch),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        """Block until the replica has its model; False on timeout, EOFError if it died"""
+        if not self.conn.poll(timeout):
+            return False
+        self.conn.recv()
+        self.ready = True
+        return True
+
+    def wait_result(self, timeout):
+        """Block until the worker answers; None on timeout, EOFError if it died"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self.conn.poll(max(0.0, deadline - time.monotonic())):
+                return None
+            message = self.conn.recv()
+            if message[0] is not None:
+                return message
+            # Readiness notice from a replica that was replaced mid-flight
+            self.ready = True
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+
+    def shutdown(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class _Job:
+    def __init__(self, job_id, audio, future):
+        self.id = job_id
+        self.audio = audio
+        self.future = future
+        self.submitted_at = time.perf_counter()
+
+
+class TranscriptionPool:
+    def __init__(self, load_model, run, run_batch=None, replicas=None, max_queue=32, job_timeout=60.0,
+                 admission_timeout=5.0, threads_per_replica=2, max_batch_size=1, batch_delay=0.005,
+                 idle_timeout=None, load_timeout=600.0):
+        """
+        load_model() builds a model replica, run(model, payload) transcribes one
+        job and run_batch(model, payloads) a list of them in one pass. All must
+        be module-level functions so spawned workers can import them. Without
+        run_batch, batches are transcribed one job at a time. With idle_timeout
+        set, the replicas and model are released after that many idle seconds.
+        """
+        self.load_model = load_model
+        self.run = run
+        self.run_batch = run_batch
+        self.replicas = replicas or default_replicas(threads_per_replica)
+        self.max_batch_size = max_batch_size if run_batch is not None else 1
+        self.batch_delay = batch_delay
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.admission_timeout = admission_timeout
+        self.idle_timeout = idle_timeout
+        self.load_timeout = load_timeout
+        self.forked = False  # Whether the current replicas were forked; decided on each load, see _load
+        self._fork_context = multiprocessing.get_context("fork") if sys.platform.startswith("linux") else None
+        self._spawn_context = multiprocessing.get_context("spawn")
+        self._model = None
+        self._workers = []
+        self._dispatchers = []
+        self._queue = None
+        self._io = None
+        self._next_job_id = 0
+        self._lifecycle = None
+        self._idle_monitor = None
+        self._pending = 0  # transcribe() calls in progress, queued or running
+        self.state = "unloaded"
+        self.load_error = None
+        self.loads = 0
+        self.unloads = 0
+        self.load_seconds = None
+        self.last_used = time.monotonic()
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self._wait_times = deque(maxlen=200)
+        self.batches = 0
+        self._batch_sizes = deque(maxlen=200)
+        self._fill_waits = deque(maxlen=200)
+        self._compute_times = deque(maxlen=200)
+
+    def start(self):
+        """Set up the queue and idle monitor (call from the event loop); the model loads on warm_up() or first use"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._io = ThreadPoolExecutor(max_workers=self.replicas, thread_name_prefix="asr-io")
+        self._lifecycle = asyncio.Lock()
+        if self.idle_timeout:
+            self._idle_monitor = asyncio.create_task(self._evict_when_idle())
+
+    async def stop(self):
+        if self._idle_monitor:
+            self._idle_monitor.cancel()
+        await self.unload(force=True)
+        if self._io:
+            self._io.shutdown(wait=False)
+
+    async def warm_up(self):
+        """Load the model if it is not loaded yet, and count it as activity so it is not evicted straight away"""
+        self.last_used = time.monotonic()
+        await self.ensure_loaded()
+
+    async def ensure_loaded(self):
+        if self.state == "ready":
+            return
+        async with self._lifecycle:
+            if self.state != "ready":
+                await self._load()
+
+    async def _load(self):
+        self.state = "loading"
+        self.load_error = None
+        started = time.perf_counter()
+        try:
+            self.forked = False
+            if _fork_is_safe():
+                # Load once, then fork so replicas share the weights copy-on-write.
+                # The loader thread has exited by the time we check again and fork.
+                self._model = await self._load_on_thread()
+                self.forked = _fork_is_safe()
+                if not self.forked:
+                    # Another thread started meanwhile: spawned replicas load their own
+                    self._model = None
+            loop = asyncio.get_running_loop()
+            for slot in range(self.replicas):
+                self._workers.append(self._spawn_worker())
+            ready = await asyncio.gather(*(
+                loop.run_in_executor(self._io, worker.wait_ready, self.load_timeout) for worker in self._workers
+            ))
+            if not all(ready):
+                raise RuntimeError(f"Model replicas not ready after {self.load_timeout:.0f}s")
+        except BaseException as e:
+            self.state = "error"
+            self.load_error = f"{type(e).__name__}: {e}"
+            await self._release()
+            raise
+
+        for slot in range(self.replicas):
+            self._dispatchers.append(asyncio.create_task(self._dispatch(slot)))
+        self.loads += 1
+        self.load_seconds = round(time.perf_counter() - started, 3)
+        self.last_used = time.monotonic()
+        self.state = "ready"
+
+    async def unload(self, force=False):
+        """Stop the replicas and drop the model; unless forced, only when no job is pending. Returns True if unloaded."""
+        if self._lifecycle is None:
+            return False
+        async with self._lifecycle:
+            if self.state != "ready" or (self._pending and not force):
+                return False
+            self.state = "unloading"
+            await self._release()
+            self.unloads += 1
+            self.state = "unloaded"
+            return True
+
+    async def _release(self):
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+        while not self._queue.empty():
+            self._fail([self._queue.get_nowait()], RuntimeError("Transcription pool stopped"))
+        workers, self._workers = self._workers, []
+        await asyncio.gather(*(asyncio.to_thread(worker.shutdown) for worker in workers))
+        self._model = None
+        gc.collect()
+
+    async def _evict_when_idle(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout / 4, 30))
+            idle = time.monotonic() - self.last_used
+            if self.state == "ready" and not self._pending and idle >= self.idle_timeout:
+                if await self.unload():
+                    print(f"Unloaded ASR model after {idle:.0f}s idle")
+
+    async def _load_on_thread(self):
+        """load_model() on a thread of its own that has exited when this returns, without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        loaded = loop.create_future()
+
+        def settle(method, value):
+            if not loaded.done():
+                method(value)
+
+        def load():
+            try:
+                model = self.load_model()
+            except BaseException as e:
+                loop.call_soon_threadsafe(settle, loaded.set_exception, e)
+            else:
+                loop.call_soon_threadsafe(settle, loaded.set_result, model)
+
+        thread = threading.Thread(target=load, name="asr-load", daemon=True)
+        thread.start()
+        model = await loaded
+        thread.join()  # It exits right after handing over the model
+        return model
+
+    def _spawn_worker(self):
+        # Replacements start while the asr-io threads exist, so only a fork-safe moment gets fork
+        if self.forked and _fork_is_safe():
+            return _Worker(self._fork_context, self._model, self.load_model, self.run, self.run_batch)
+        return _Worker(self._spawn_context, None, self.load_model, self.run, self.run_batch)
+
+    async def transcribe(self, audio):
+        """Queue a job and wait for its result. Cancelling the caller cancels the job."""
+        loop = asyncio.get_running_loop()
+        self._next_job_id += 1
+        job = _Job(self._next_job_id, audio, loop.create_future())
+        self._pending += 1
+        try:
+            # Reloads the model on demand after an idle eviction
+            await self.ensure_loaded()
+            try:
+                await asyncio.wait_for(self._queue.put(job), self.admission_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise PoolSaturated(f"Transcription queue full ({self.max_queue} jobs waiting)")
+
+            try:
+                return await job.future
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+        finally:
+            self._pending -= 1
+            self.last_used = time.monotonic()
+
+    async def _collect_batch(self, jobs):
+        """Wait for one job, then up to batch_delay for more to batch with it"""
+        while not jobs:
+            job = await self._queue.get()
+            if job.future.done():
+                # Caller went away while the job was queued
+                self.cancelled += 1
+                continue
+            jobs.append(job)
+
+        fill_started = time.perf_counter()
+        deadline = fill_started + self.batch_delay
+        while len(jobs) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                job = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if job.future.done():
+                self.cancelled += 1
+                continue
+            jobs.append(job)
+        if self.max_batch_size > 1:
+            self._fill_waits.append(time.perf_counter() - fill_started)
+
+    async def _dispatch(self, slot):
+        while True:
+            jobs = []
+            try:
+                await self._collect_batch(jobs)
+                await self._run_batch(slot, jobs)
+            except asyncio.CancelledError:
+                self._fail(jobs, RuntimeError("Transcription pool stopped"))
+                raise
+
+    async def _run_batch(self, slot, jobs):
+        loop = asyncio.get_running_loop()
+        dispatched_at = time.perf_counter()
+        for job in jobs:
+            self._wait_times.append(dispatched_at - job.submitted_at)
+        self._batch_sizes.append(len(jobs))
+        self.batches += 1
+
+        worker = self._workers[slot]
+        self.busy += 1
+        try:
+            try:
+                worker.conn.send((jobs[0].id, [job.audio for job in jobs]))
+            except OSError as e:
+                # The replica died while idle
+                self._fail(jobs, RuntimeError(f"Transcription worker crashed: {e}"))
+                await self._replace_worker(slot)
+                return
+            waiter = loop.run_in_executor(self._io, worker.wait_result, self.job_timeout)
+            waiting = {job.future for job in jobs}
+            while waiting and not waiter.done():
+                await asyncio.wait(waiting | {waiter}, return_when=asyncio.FIRST_COMPLETED)
+                waiting = {future for future in waiting if not future.done()}
+
+            if not waiter.done():
+                # Every caller in the batch went away: kill the replica and fork a fresh one
+                self.cancelled += len(jobs)
+                await self._replace_worker(slot, waiter)
+                return
+
+            try:
+                result = waiter.result()
+            except (EOFError, OSError) as e:
+                self._fail(jobs, RuntimeError(f"Transcription worker crashed: {e}"))
+                await self._replace_worker(slot, waiter)
+                return
+
+            if result is None:
+                self.timed_out += len(jobs)
+                self._fail(jobs, asyncio.TimeoutError(
+                    f"Transcription took longer than {self.job_timeout:.0f}s"), count=False)
+                await self._replace_worker(slot, waiter)
+                return
+
+            self._compute_times.append(time.perf_counter() - dispatched_at)
+            _, ok, values = result
+            if not ok:
+                self._fail(jobs, RuntimeError(values))
+                return
+            for job, value in zip(jobs, values):
+                if job.future.done():
+                    self.cancelled += 1
+                else:
+                    self.completed += 1
+                    job.future.set_result(value)
+        finally:
+            self.busy -= 1
+
+    def _fail(self, jobs, error, count=True):
+        for job in jobs:
+            if not job.future.done():
+                if count:
+                    self.failed += 1
+                job.future.set_exception(error)
+
+    async def _replace_worker(self, slot, waiter=None):
+        worker = self._workers[slot]
+        worker.kill()
+        if waiter is not None:
+            # The I/O thread wakes up with EOF once the process is gone
+            await asyncio.gather(waiter, return_exceptions=True)
+        worker.conn.close()
+        self._workers[slot] = self._spawn_worker()
+
+    def stats(self):
+        def percentile(samples, p):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+        def summary(samples):
+            return {"p50": percentile(samples, 0.5), "p95": percentile(samples, 0.95), "max": percentile(samples, 1.0)}
+
+        sizes = list(self._batch_sizes)
+        compute = list(self._compute_times)
+
+        return {
+            "state": self.state,
+            "load_error": self.load_error,
+            "load_seconds": self.load_seconds,
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "idle_timeout": self.idle_timeout,
+            "replicas": self.replicas,
+            "start_method": "fork" if self.forked else "spawn",
+            "busy_workers": self.busy,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "wait_ms": summary(self._wait_times),
+            "batching": {
+                "max_batch_size": self.max_batch_size,
+                "batch_delay_ms": self.batch_delay * 1000,
+                "batches": self.batches,
+                "mean_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else None,
+                "fill_wait_ms": summary(self._fill_waits),
+                "compute_ms": summary(compute),
+                "jobs_per_compute_second": round(sum(sizes) / sum(compute), 2) if compute and sum(compute) else None
+            },
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,110 @@
+"""
+In-memory audio helpers for the Qlippy voice server.
+Audio stays in NumPy arrays from websocket ingest to model input: no temp
+files, no ffmpeg, and every conversion is vectorized.
+"""
+
+import numpy as np
+
+MODEL_SAMPLE_RATE = 16000  # What Whisper expects
+
+
+class PCMBuffer:
+    """Growable int16 buffer that PCM16 bytes are written into directly"""
+
+    def __init__(self, capacity=MODEL_SAMPLE_RATE * 10):
+        self._data = np.empty(capacity, dtype=np.int16)
+        self._odd_byte = b""
+        self.offset = 0  # Stream position of self._data[0]
+        self.length = 0
+
+    @property
+    def end(self):
+        """Stream position just past the last buffered sample"""
+        return self.offset + self.length
+
+    def append(self, data):
+        if self._odd_byte:
+            data = self._odd_byte + data
+            self._odd_byte = b""
+        if len(data) % 2:
+            self._odd_byte = data[-1:]
+            data = data[:-1]
+        samples = np.frombuffer(data, dtype="<i2")
+        needed = self.length + len(samples)
+        if needed > len(self._data):
+            grown = np.empty(max(needed, len(self._data) * 2), dtype=np.int16)
+            grown[:self.length] = self._data[:self.length]
+            self._data = grown
+        self._data[self.length:needed] = samples
+        self.length = needed
+
+    def view(self, start, end):
+        """Samples between two stream positions, without copying"""
+        return self._data[start - self.offset:end - self.offset]
+
+    def discard_before(self, position):
+        """
+        Drop samples before a stream position. The remainder is moved to a new
+        array so views handed out earlier stay valid.
+        """
+        drop = position - self.offset
+        if drop <= 0:
+            return
+        remaining = self.length - drop
+        fresh = np.empty(max(len(self._data), remaining), dtype=np.int16)
+        fresh[:remaining] = self._data[drop:self.length]
+        self._data = fresh
+        self.offset = position
+        self.length = remaining
+
+
+def pcm16_to_float32(samples, gain=1.0):
+    """int16 samples to float32 in [-1, 1] with gain applied in the same pass"""
+    audio = samples.astype(np.float32)
+    audio *= gain / 32768.0
+    np.clip(audio, -1.0, 1.0, out=audio)
+    return audio
+
+
+def _lowpass(audio, cutoff, taps=63):
+    """Windowed-sinc FIR low-pass; cutoff is a fraction of the sample rate"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff * n) * np.hamming(taps)
+    kernel /= kernel.sum()
+    return np.convolve(audio, kernel.astype(np.float32), mode="same")
+
+
+def resample(audio, source_rate, target_rate=MODEL_SAMPLE_RATE):
+    """Resample float32 audio; anti-aliased when downsampling"""
+    if source_rate == target_rate or len(audio) == 0:
+        return audio
+    if source_rate > target_rate:
+        audio = _lowpass(audio, 0.5 * target_rate / source_rate)
+    duration = len(audio) / source_rate
+    target_length = int(round(duration * target_rate))
+    positions = np.arange(target_length, dtype=np.float64) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def prepare_for_model(samples, sample_rate, gain=1.0):
+    """int16 samples at any rate to the float32 16 kHz array the model takes"""
+    return resample(pcm16_to_float32(samples, gain), sample_rate)
+
+
+def amplitude_stats(frames):
+    """Max and summed absolute amplitude of an int16 array, without overflow"""
+    magnitudes = np.abs(frames.astype(np.int32))
+    return int(magnitudes.max()), int(magnitudes.sum())
+
+
+def frame_rms(frames):
+    """RMS energy of each row of a (frames, frame_len) int16 array"""
+    as_float = frames.astype(np.float32)
+    return np.sqrt(np.einsum("ij,ij->i", as_float, as_float) / frames.shape[1])
+
+
+def frame_zcr(frames):
+    """Zero-crossing rate (crossings per sample) of each row of an int16 frame array"""
+    signs = np.signbit(frames)
+    return np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
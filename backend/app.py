@@ -4,14 +4,41 @@ import os
 from config import config
 from models import db
 from routes import api
+from metrics import init_metrics
+from profiling import init_profiling
+from maintenance import init_maintenance
+from backup import init_backups
+from tracing import init_tracing
+from plugin_runtime import init_plugin_runtime
+from suggest import init_suggest
+from write_queue import init_write_queue
+from attachments import init_attachments
+from ingest import init_ingestion
+from retrieval import init_retrieval
+from sharding import init_sharding
 
 def create_app(config_name='default'):
-    app = Flask(__name__)
+    # QLIPPY_INSTANCE_PATH (absolute) keeps the database and files elsewhere, e.g. for tests
+    app = Flask(__name__, instance_path=os.environ.get('QLIPPY_INSTANCE_PATH'))
     app.config.from_object(config[config_name])
     
     # Initialize extensions
     db.init_app(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
+    init_metrics(app, db)
+    init_profiling(app)
+    init_tracing(app)
+    init_plugin_runtime(app)
+    init_suggest(app)
+    init_attachments(app)
+    init_ingestion(app)
+    init_retrieval(app)
+    
+    # Start background SQLite maintenance and backups (before any table is created)
+    init_maintenance(app, db)
+    init_backups(app, db)
+    init_write_queue(app, db)
+    init_sharding(app, db)
     
     # Register blueprints
     app.register_blueprint(api, url_prefix='/api')
@@ -22,7 +49,6 @@ def create_app(config_name='default'):
     
     return app
 
-app = create_app()
-
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
+    app = create_app()
+    app.run(debug=True, host='0.0.0.0', port=5001, use_reloader=app.config['USE_RELOADER']) 
\ No newline at end of file
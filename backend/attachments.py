@@ -0,0 +1,189 @@
+"""
+Content-addressed attachment storage for the Qlippy backend.
+Uploads are streamed to a temp file in chunks while being hashed, then
+moved to blobs/<first two hex digits>/<sha256>; a file uploaded twice is
+stored once. Attachment rows (see models.Attachment) point at blobs by
+hash, so a blob is garbage once no row references it. Blob storage is kept
+under a quota, collecting garbage first when an upload would exceed it.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+TEMP_FILE_MAX_AGE = 60 * 60  # Older temp files are left over from uploads that died mid-stream
+# Served inline; anything else (HTML, SVG, ...) is sent as a download so it can't run in the app's origin
+INLINE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'audio/', 'video/', 'application/pdf', 'text/plain')
+
+
+def is_inline(content_type):
+    return content_type.startswith(INLINE_TYPES)
+
+
+class AttachmentTooLarge(Exception):
+    """Raised when an upload is bigger than the per-file limit"""
+
+
+class QuotaExceeded(Exception):
+    """Raised when a new blob would not fit in the storage quota"""
+
+
+class AttachmentStore:
+    def __init__(self, root, quota_bytes, max_file_bytes, grace_seconds=600):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.quota_bytes = quota_bytes
+        self.max_file_bytes = max_file_bytes
+        # Unreferenced blobs younger than this may belong to an upload whose row isn't committed yet
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._usage = None
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def _blobs(self):
+        for shard in os.scandir(self.blob_dir):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.is_file():
+                        yield entry
+
+    def usage(self):
+        """Bytes used by blobs (scanned once, then tracked)"""
+        with self._lock:
+            return self._tracked_usage()
+
+    def _tracked_usage(self):
+        # Caller holds _lock
+        if self._usage is None:
+            self._usage = sum(entry.stat().st_size for entry in self._blobs())
+        return self._usage
+
+    def _reserve(self, size):
+        """Count size against the quota if it fits, checked and added under one lock so concurrent uploads can't overshoot"""
+        with self._lock:
+            if self._tracked_usage() + size > self.quota_bytes:
+                return False
+            self._usage += size
+            return True
+
+    def receive(self, stream):
+        """
+        Copy a stream to a temp file in chunks while hashing it.
+        Returns (sha256, size, temp path). Raises AttachmentTooLarge.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while chunk := stream.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        raise AttachmentTooLarge(f'Attachments are limited to {self.max_file_bytes} bytes')
+                    hasher.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return hasher.hexdigest(), size, temp_path
+
+    def store(self, temp_path, sha256, size, collect_garbage=None):
+        """
+        Move a received temp file into place, or drop it if the blob already
+        exists. collect_garbage() is called once if the blob would exceed the
+        quota. Returns True if a new blob was stored. Raises QuotaExceeded.
+        """
+        path = self.blob_path(sha256)
+        if os.path.exists(path):
+            os.unlink(temp_path)
+            os.utime(path)  # Restart its grace period in case it was about to be collected
+            return False
+
+        reserved = self._reserve(size)
+        if not reserved and collect_garbage is not None:
+            collect_garbage()
+            reserved = self._reserve(size)
+        if not reserved:
+            os.unlink(temp_path)
+            raise QuotaExceeded(f'Attachment storage is full ({self.usage()} of {self.quota_bytes} bytes used)')
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._lock:
+                # The same file may have been stored by a concurrent upload since the check above
+                duplicate = os.path.exists(path)
+                if duplicate:
+                    self._usage -= size
+                else:
+                    os.replace(temp_path, path)
+        except BaseException:
+            with self._lock:
+                self._usage -= size
+            os.unlink(temp_path)
+            raise
+        if duplicate:
+            os.unlink(temp_path)
+            os.utime(path)
+            return False
+        return True
+
+    def collect(self, referenced):
+        """Delete blobs whose hash is not in referenced (past their grace period) and stale temp files"""
+        cutoff = time.time() - self.grace_seconds
+        removed, freed = 0, 0
+        for entry in self._blobs():
+            if entry.name in referenced:
+                continue
+            stat = entry.stat()
+            if stat.st_mtime > cutoff:
+                continue
+            try:
+                os.unlink(entry.path)
+            except OSError as e:
+                logger.error("Failed to remove blob %s: %s", entry.name, e)
+                continue
+            removed += 1
+            freed += stat.st_size
+        temp_cutoff = time.time() - TEMP_FILE_MAX_AGE
+        for entry in os.scandir(self.tmp_dir):
+            if entry.is_file() and entry.stat().st_mtime < temp_cutoff:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+        with self._lock:
+            if self._usage is not None:
+                self._usage -= freed
+        return {'blobs_removed': removed, 'bytes_freed': freed}
+
+    def report(self):
+        return {
+            'usage_bytes': self.usage(),
+            'quota_bytes': self.quota_bytes,
+            'max_file_bytes': self.max_file_bytes
+        }
+
+
+def init_attachments(app):
+    """Create the blob store under instance/<UPLOAD_FOLDER>"""
+    store = AttachmentStore(
+        os.path.join(app.instance_path, app.config['UPLOAD_FOLDER']),
+        quota_bytes=app.config['ATTACHMENT_QUOTA_MB'] * 1024 * 1024,
+        max_file_bytes=app.config['MAX_CONTENT_LENGTH'],
+        grace_seconds=app.config['ATTACHMENT_GC_GRACE_SECONDS']
+    )
+    app.extensions['attachments'] = store
+    return store
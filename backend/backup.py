@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Online backups for the Qlippy database.
+Copies the live SQLite database with the incremental backup API a few pages
+at a time, sleeping between steps so writers are never blocked for long.
+A write from another connection restarts the copy; after max_restarts of
+those the rest is copied in one step, holding writers off until it is done.
+Each snapshot is integrity-checked, optionally gzip-compressed, and only the
+newest N snapshots are kept.
+
+Run with: python backup.py [--compress] [--keep N]
+"""
+
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from maintenance import is_reloader_parent, sqlite_database_path
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = 'qlippy-'
+
+
+def list_snapshots(backup_dir):
+    """Snapshots in backup_dir, newest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for entry in os.scandir(backup_dir):
+        if entry.name.startswith(SNAPSHOT_PREFIX) and entry.name.endswith(('.db', '.db.gz')):
+            stat = entry.stat()
+            snapshots.append({
+                'name': entry.name,
+                'path': entry.path,
+                'bytes': stat.st_size,
+                'created_at': datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+            })
+    snapshots.sort(key=lambda snapshot: snapshot['name'], reverse=True)
+    return snapshots
+
+
+def rotate_snapshots(backup_dir, keep):
+    """Delete all but the newest `keep` snapshots, returning the deleted names"""
+    removed = []
+    for snapshot in list_snapshots(backup_dir)[keep:]:
+        try:
+            os.unlink(snapshot['path'])
+            removed.append(snapshot['name'])
+        except OSError as e:
+            logger.error("Failed to remove old backup %s: %s", snapshot['name'], e)
+    return removed
+
+
+def verify_snapshot(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    finally:
+        conn.close()
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback to give up on copying step by step"""
+
+
+def backup_database(db_path, backup_dir, pages_per_step=256, step_sleep=0.01, keep=7, compress=False, max_restarts=10):
+    """Take a verified online snapshot of db_path and rotate old ones. Returns a report dict."""
+    os.makedirs(backup_dir, exist_ok=True)
+    timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    snapshot_path = os.path.join(backup_dir, f'{SNAPSHOT_PREFIX}{timestamp}.db')
+    partial_path = snapshot_path + '.partial'
+
+    step_pauses = []
+    last_step = [time.perf_counter()]
+    restarts = [0]
+    last_remaining = [None]
+
+    def progress(status, remaining, total):
+        now = time.perf_counter()
+        # Time spent inside the step is how long writers could have been held up
+        step_pauses.append(now - last_step[0])
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            # Another connection wrote to the database and the copy started over
+            restarts[0] += 1
+            if restarts[0] > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining[0] = remaining
+        time.sleep(step_sleep)
+        last_step[0] = time.perf_counter()
+
+    started = time.perf_counter()
+    single_step = False
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(partial_path)
+    try:
+        try:
+            source.backup(target, pages=pages_per_step, progress=progress)
+        except _TooManyRestarts:
+            logger.warning(
+                "Backup of %s restarted %d times under writes, copying the rest in one step", db_path, restarts[0]
+            )
+            single_step = True
+            step_started = time.perf_counter()
+            source.backup(target)
+            step_pauses.append(time.perf_counter() - step_started)
+        page_count = target.execute('PRAGMA page_count').fetchone()[0]
+        page_size = target.execute('PRAGMA page_size').fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+    copy_seconds = time.perf_counter() - started
+
+    if not verify_snapshot(partial_path):
+        os.unlink(partial_path)
+        raise RuntimeError(f'Backup snapshot {snapshot_path} failed integrity check')
+    os.replace(partial_path, snapshot_path)
+
+    if compress:
+        with open(snapshot_path, 'rb') as src, gzip.open(snapshot_path + '.gz.partial', 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(snapshot_path + '.gz.partial', snapshot_path + '.gz')
+        os.unlink(snapshot_path)
+        snapshot_path += '.gz'
+
+    copied_bytes = page_count * page_size
+    report = {
+        'snapshot': os.path.basename(snapshot_path),
+        'bytes': os.path.getsize(snapshot_path),
+        'pages': page_count,
+        'steps': len(step_pauses),
+        'restarts': restarts[0],
+        'single_step': single_step,
+        'max_pause_ms': round(max(step_pauses, default=0.0) * 1000, 3),
+        'mean_pause_ms': round(sum(step_pauses) / len(step_pauses) * 1000, 3) if step_pauses else 0.0,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+        'throughput_mb_s': round(copied_bytes / copy_seconds / (1024 * 1024), 3) if copy_seconds else None,
+        'verified': True,
+        'compressed': compress,
+        'rotated_out': rotate_snapshots(backup_dir, keep),
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    logger.info(
+        "Backup %s: %d pages in %d steps, max pause %.1f ms, %.2f MB/s",
+        report['snapshot'], page_count, report['steps'], report['max_pause_ms'], report['throughput_mb_s'] or 0
+    )
+    return report
+
+
+class BackupScheduler:
+    def __init__(self, db_path, backup_dir, interval, pages_per_step=256, step_sleep=0.01, keep=7, compress=False,
+                 max_restarts=10):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+        self.keep = keep
+        self.compress = compress
+        self.last_report = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not self.interval:
+            return
+        self._thread = threading.Thread(target=self._loop, name='qlippy-backup', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run()
+            except Exception as e:
+                logger.error("Scheduled backup failed: %s", e)
+
+    def run(self):
+        with self._lock:
+            try:
+                self.last_report = backup_database(
+                    self.db_path,
+                    self.backup_dir,
+                    pages_per_step=self.pages_per_step,
+                    step_sleep=self.step_sleep,
+                    keep=self.keep,
+                    compress=self.compress,
+                    max_restarts=self.max_restarts
+                )
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            return self.last_report
+
+    def status(self):
+        return {
+            'interval_seconds': self.interval,
+            'keep': self.keep,
+            'compress': self.compress,
+            'last_report': self.last_report,
+            'last_error': self.last_error,
+            'snapshots': [
+                {key: value for key, value in snapshot.items() if key != 'path'}
+                for snapshot in list_snapshots(self.backup_dir)
+            ]
+        }
+
+
+def init_backups(app, db):
+    """Set up online backups for file-backed SQLite databases"""
+    with app.app_context():
+        db_path = sqlite_database_path(db.engine)
+    if db_path is None:
+        return None
+
+    scheduler = BackupScheduler(
+        db_path,
+        os.path.join(app.instance_path, app.config['BACKUP_DIR']),
+        interval=app.config['BACKUP_INTERVAL_SECONDS'],
+        pages_per_step=app.config['BACKUP_PAGES_PER_STEP'],
+        step_sleep=app.config['BACKUP_STEP_SLEEP_MS'] / 1000.0,
+        keep=app.config['BACKUP_KEEP'],
+        compress=app.config['BACKUP_COMPRESS'],
+        max_restarts=app.config['BACKUP_MAX_RESTARTS']
+    )
+    app.extensions['backup'] = scheduler
+    if not app.testing and not is_reloader_parent(app):
+        scheduler.start()
+    return scheduler
+
+
+if __name__ == '__main__':
+    from config import Config
+
+    keep = Config.BACKUP_KEEP
+    if '--keep' in sys.argv:
+        keep = int(sys.argv[sys.argv.index('--keep') + 1])
+    compress = '--compress' in sys.argv or Config.BACKUP_COMPRESS
+
+    db_path = 'instance/qlippy.db'
+    if not os.path.exists(db_path):
+        print(f"❌ Database file not found at {db_path}")
+        sys.exit(1)
+
+    print("💾 Backing up Qlippy database (safe while the server is running)...")
+    try:
+        report = backup_database(
+            db_path,
+            os.path.join('instance', Config.BACKUP_DIR),
+            pages_per_step=Config.BACKUP_PAGES_PER_STEP,
+            step_sleep=Config.BACKUP_STEP_SLEEP_MS / 1000.0,
+            keep=keep,
+            compress=compress,
+            max_restarts=Config.BACKUP_MAX_RESTARTS
+        )
+    except Exception as e:
+        print(f"❌ Backup failed: {e}")
+        sys.exit(1)
+
+    print(f"✅ Backup written: {report['snapshot']} ({report['bytes']} bytes, verified)")
+    print(f"   {report['steps']} steps, max pause {report['max_pause_ms']} ms, {report['throughput_mb_s']} MB/s")
+    if report['single_step']:
+        print(f"⚠️  Restarted {report['restarts']} times under writes; finished in one step")
+    if report['rotated_out']:
+        print(f"🗑️  Removed old backups: {', '.join(report['rotated_out'])}")
@@ -16,17 +16,103 @@ class Config:
     # Database settings
     DB_AUTOCOMMIT = True
     
+    # Werkzeug auto-reloader in debug mode (run.py; start.py turns it off)
+    USE_RELOADER = os.environ.get('QLIPPY_RELOAD', 'true').lower() == 'true'
+    
     # Security settings
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     
-    # File upload settings
+    # File upload settings (attachments are stored in instance/<UPLOAD_FOLDER>)
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'uploads'
+    ATTACHMENT_QUOTA_MB = int(os.environ.get('ATTACHMENT_QUOTA_MB', 1024))
+    ATTACHMENT_UNSENT_HOURS = 24  # Uploads never attached to a message are collected after this
+    ATTACHMENT_GC_GRACE_SECONDS = 600
+    ATTACHMENT_CACHE_MAX_AGE = 7 * 24 * 60 * 60
     
     # Logging settings
     LOG_LEVEL = 'INFO'
     LOG_FILE = 'qlippy.log'
+    
+    # Metrics settings
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    SLOW_QUERY_LOG_SIZE = 100
+    
+    # Profiling settings (requests are profiled when they send the token
+    # in the X-Qlippy-Profile header or ?_profile= query flag)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.0))
+    PROFILE_DIR = 'profiles'
+    PROFILE_MAX_FILES = 50
+    
+    # SQLite maintenance settings (tasks only run once the API has been idle)
+    MAINTENANCE_ENABLED = os.environ.get('MAINTENANCE_ENABLED', 'true').lower() == 'true'
+    MAINTENANCE_IDLE_SECONDS = 30
+    MAINTENANCE_CHECK_INTERVAL = 15
+    MAINTENANCE_SLICE_MS = 50
+    MAINTENANCE_VACUUM_PAGES = 64
+    MAINTENANCE_TASK_INTERVALS = {
+        'optimize': 60 * 60,
+        'checkpoint': 5 * 60,
+        'incremental_vacuum': 10 * 60,
+        'integrity_check': 24 * 60 * 60
+    }
+    
+    # Online backup settings (BACKUP_INTERVAL_SECONDS = 0 disables scheduled backups)
+    BACKUP_DIR = 'backups'
+    BACKUP_INTERVAL_SECONDS = int(os.environ.get('BACKUP_INTERVAL_SECONDS', 6 * 60 * 60))
+    BACKUP_KEEP = 7
+    BACKUP_COMPRESS = os.environ.get('BACKUP_COMPRESS', 'false').lower() == 'true'
+    BACKUP_PAGES_PER_STEP = 256
+    BACKUP_STEP_SLEEP_MS = 10
+    BACKUP_MAX_RESTARTS = 10  # Copies restarted by writes before the rest is copied in one step
+    
+    # Voice-turn tracing (spans are kept in memory and appended to instance/traces.jsonl)
+    TRACE_MAX_TURNS = 200
+    TRACE_LOG_ENABLED = os.environ.get('TRACE_LOG_ENABLED', 'true').lower() == 'true'
+    TRACE_LOG_FILE = 'traces.jsonl'
+    
+    # Plugin runtime (plugin code lives in instance/plugins/<slug>.py and runs in worker processes)
+    PLUGIN_DIR = 'plugins'
+    PLUGIN_WORKERS = int(os.environ.get('PLUGIN_WORKERS', 2))
+    PLUGIN_CALL_TIMEOUT = float(os.environ.get('PLUGIN_CALL_TIMEOUT', 10))
+    # Address space, not resident memory: a worker starts at about 64 MB (spawning re-imports the app's
+    # modules) and glibc reserves 64 MB of address space per thread arena, so a plugin using a threaded
+    # library (numpy, an HTTP client pool) needs headroom well beyond what it actually touches
+    PLUGIN_MEMORY_LIMIT_MB = int(os.environ.get('PLUGIN_MEMORY_LIMIT_MB', 1024))
+    # Lower it to keep one slow plugin from taking every worker
+    PLUGIN_MAX_CALLS_PER_PLUGIN = int(os.environ.get('PLUGIN_MAX_CALLS_PER_PLUGIN', PLUGIN_WORKERS))
+    PLUGIN_CACHE_SIZE = 500
+    PLUGIN_MAX_CALLS_PER_TURN = 16
+    
+    # Group commit: conversation and message writes go through one writer thread
+    # that commits everything queued within WRITE_QUEUE_WINDOW_MS in one transaction
+    WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE_ENABLED', 'false').lower() == 'true'
+    WRITE_QUEUE_WINDOW_MS = float(os.environ.get('WRITE_QUEUE_WINDOW_MS', 2))
+    WRITE_QUEUE_MAX_BATCH = 64
+    WRITE_QUEUE_TIMEOUT = 10
+    
+    # Search suggestions (in-memory title index)
+    SUGGEST_MAX_RESULTS = 20
+    
+    # Document ingestion (attachments are chunked by worker processes; extra
+    # extractor modules are imported in each worker, see extractors.py)
+    INGEST_AUTO = os.environ.get('INGEST_AUTO', 'true').lower() == 'true'
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    INGEST_CHUNK_CHARS = 1200
+    INGEST_CHUNK_OVERLAP = 200
+    INGEST_EXTRACTOR_MODULES = [m for m in os.environ.get('INGEST_EXTRACTOR_MODULES', '').split(',') if m]
+    RETRIEVAL_CACHE_CHUNKS = 50000
+    RETRIEVAL_MAX_RESULTS = 20
+    
+    # Per-space databases: each space's conversations live in instance/<SPACE_DB_DIR>/<space id>.db
+    # and the main database keeps the catalog (see sharding.py)
+    SPACE_SHARDING_ENABLED = os.environ.get('SPACE_SHARDING_ENABLED', 'false').lower() == 'true'
+    SPACE_DB_DIR = 'spaces'
+    SPACE_ATTACH_LIMIT = 10  # SQLite's default limit on attached databases per connection
+    SPACE_QUERY_WORKERS = 4
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,105 @@
+"""
+Text extraction and chunking for document ingestion.
+Runs inside the ingestion worker processes, so it only imports the standard
+library at module level. Extractors are registered per content type and
+file extension; modules listed in INGEST_EXTRACTOR_MODULES are imported in
+every worker and can register more with @register_extractor.
+"""
+
+import importlib
+import os
+
+
+class ExtractionError(Exception):
+    """Raised when a document's text can't be extracted"""
+
+
+_extractors = []  # (name, content types, extensions, function)
+
+
+def register_extractor(name, content_types=(), extensions=()):
+    """Register fn(path) -> text for the given content types and file extensions"""
+    def decorator(fn):
+        _extractors.insert(0, (name, tuple(content_types), tuple(ext.lower() for ext in extensions), fn))
+        return fn
+    return decorator
+
+
+def find_extractor(content_type, filename):
+    """(name, fn) of the extractor for a file, or None if the type isn't supported"""
+    extension = os.path.splitext(filename)[1].lower()
+    for name, content_types, extensions, fn in _extractors:
+        if content_type in content_types or extension in extensions:
+            return name, fn
+    return None
+
+
+def load_extractor_modules(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+@register_extractor('text', ('text/plain', 'text/csv'), ('.txt', '.log', '.csv'))
+def extract_text(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8', errors='replace')
+
+
+@register_extractor('markdown', ('text/markdown', 'text/x-markdown'), ('.md', '.markdown'))
+def extract_markdown(path):
+    # Markdown is kept as written: headings and lists help the chunks read well
+    return extract_text(path)
+
+
+@register_extractor('pdf', ('application/pdf',), ('.pdf',))
+def extract_pdf(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractionError('PDF extraction needs pypdf (pip install pypdf)')
+    try:
+        reader = PdfReader(path)
+        return '\n\n'.join(page.extract_text() or '' for page in reader.pages)
+    except Exception as e:
+        raise ExtractionError(f'Could not read PDF: {e}')
+
+
+# Preferred cut points near the end of a chunk, best first
+_BOUNDARIES = ('\n\n', '\n', '. ', ' ')
+
+
+def chunk_text(text, size=1200, overlap=200):
+    """
+    Split text into chunks of about size characters, each starting overlap
+    characters before the previous one ended. Chunks end at a paragraph,
+    line, sentence or word boundary in their last quarter where there is one.
+    Returns (start, end, text) with offsets into text.
+    """
+    overlap = min(overlap, size // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            window_start = start + size * 3 // 4
+            for boundary in _BOUNDARIES:
+                cut = text.rfind(boundary, window_start, end)
+                if cut != -1:
+                    end = cut + len(boundary)
+                    break
+        if text[start:end].strip():
+            chunks.append((start, end, text[start:end]))
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def extract_chunks(path, content_type, filename, chunk_size, overlap):
+    """Worker entry point: extract a file's text and chunk it"""
+    extractor = find_extractor(content_type, filename)
+    if extractor is None:
+        return {'extractor': None, 'chars': 0, 'chunks': []}
+    name, fn = extractor
+    text = fn(path)
+    return {'extractor': name, 'chars': len(text), 'chunks': chunk_text(text, chunk_size, overlap)}
@@ -0,0 +1,217 @@
+"""
+Document ingestion for the Qlippy backend.
+Attachments are turned into retrievable chunks by a pool of worker
+processes (see extractors.py): each file's text is extracted, split into
+overlapping chunks and stored with its offsets. Chunks are keyed by content
+hash, so a file that was already ingested (in any conversation) is skipped.
+A job reports its progress while it runs; the conversation's chunks are
+then searchable through retrieval.py.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from extractors import ExtractionError, extract_chunks, load_extractor_modules
+from models import db, Document, DocumentChunk
+from write_queue import write
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 100
+
+
+class IngestJob:
+    def __init__(self, documents):
+        self.id = uuid.uuid4().hex
+        self.documents = documents  # sha256 -> {'filename', 'content_type'}
+        self.status = 'queued'
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.chunks = 0
+        self.errors = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def describe(self):
+        total = len(self.documents)
+        finished = self.processed + self.skipped + self.failed
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': total,
+            'processed': self.processed,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'progress': round(finished / total, 3) if total else 1.0,
+            'chunks': self.chunks,
+            'errors': self.errors,
+            'elapsed_seconds': round(elapsed, 3)
+        }
+
+
+def _save_document(sha256, result=None, error=None):
+    document = Document.query.get(sha256)
+    if document is None:
+        document = Document(sha256=sha256)
+        db.session.add(document)
+    document.chunks = []
+    document.ingested_at = datetime.utcnow()
+    if error is not None:
+        document.status, document.error = 'error', error
+        document.chunk_count = document.chars = 0
+        return 0
+    document.status = 'done' if result['extractor'] else 'unsupported'
+    document.extractor = result['extractor']
+    document.chars = result['chars']
+    document.chunk_count = len(result['chunks'])
+    document.error = None
+    document.chunks = [
+        DocumentChunk(sha256=sha256, chunk_index=i, start_offset=start, end_offset=end, text=text)
+        for i, (start, end, text) in enumerate(result['chunks'])
+    ]
+    return document.chunk_count
+
+
+class IngestionManager:
+    def __init__(self, app, blob_path, workers=2, chunk_size=1200, overlap=200, extractor_modules=()):
+        self.app = app
+        self.blob_path = blob_path
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.extractor_modules = tuple(extractor_modules)
+        self.on_ingested = None  # Called with each sha256 whose chunks changed
+        self.jobs = {}
+        self._in_flight = set()  # Hashes some job is extracting right now
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked: the app has threads and open database connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=load_extractor_modules,
+                    initargs=(self.extractor_modules,)
+                )
+            return self._executor
+
+    def submit(self, attachments):
+        """Start a job for attachment dicts (sha256, filename, content_type); returns the job"""
+        documents = {}
+        for attachment in attachments:
+            documents.setdefault(attachment['sha256'], {
+                'filename': attachment['filename'],
+                'content_type': attachment['content_type']
+            })
+        job = IngestJob(documents)
+        with self._lock:
+            finished = sorted((j for j in self.jobs.values() if j.finished_at), key=lambda j: j.finished_at)
+            for old in finished[:max(0, len(self.jobs) - MAX_JOBS + 1)]:
+                del self.jobs[old.id]
+            self.jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job,), name=f'ingest-{job.id[:8]}', daemon=True).start()
+        return job
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            with self.app.app_context():
+                self._ingest(job)
+            job.status = 'done'
+        except Exception as e:
+            logger.exception("Ingestion job %s failed", job.id)
+            job.status = 'error'
+            job.errors.append(str(e))
+        finally:
+            job.finished_at = time.time()
+
+    def _ingest(self, job):
+        # Unchanged content was ingested before (or is being ingested by another job); failed documents are retried
+        already = {
+            sha256 for (sha256,) in db.session.query(Document.sha256).filter(
+                Document.sha256.in_(list(job.documents)), Document.status != 'error'
+            )
+        }
+        db.session.remove()
+        with self._lock:
+            already |= self._in_flight & set(job.documents)
+            claimed = set(job.documents) - already
+            self._in_flight |= claimed
+        job.skipped = len(already)
+        try:
+            self._extract(job, claimed)
+        finally:
+            with self._lock:
+                self._in_flight -= claimed
+
+    def _extract(self, job, claimed):
+        pool = self._pool()
+        futures = {}
+        for sha256 in claimed:
+            info = job.documents[sha256]
+            path = self.blob_path(sha256)
+            if not os.path.exists(path):
+                job.failed += 1
+                job.errors.append(f"{info['filename']}: file is missing")
+                continue
+            future = pool.submit(extract_chunks, path, info['content_type'], info['filename'],
+                                 self.chunk_size, self.overlap)
+            futures[future] = sha256
+
+        # Store each file as soon as it is done so the job reports progress as it goes
+        for future in as_completed(futures):
+            sha256 = futures[future]
+            result, error = None, None
+            try:
+                result = future.result()
+            except ExtractionError as e:
+                error = str(e)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            try:
+                chunks = write(self.app, db, _save_document, sha256, result, error)
+            finally:
+                db.session.remove()
+
+            if error is not None:
+                job.failed += 1
+                job.errors.append(f"{job.documents[sha256]['filename']}: {error}")
+                continue
+            job.processed += 1
+            job.chunks += chunks
+            if self.on_ingested is not None:
+                self.on_ingested(sha256)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def init_ingestion(app):
+    """Create the ingestion manager; its worker processes start with the first job"""
+    store = app.extensions['attachments']
+    manager = IngestionManager(
+        app,
+        store.blob_path,
+        workers=app.config['INGEST_WORKERS'],
+        chunk_size=app.config['INGEST_CHUNK_CHARS'],
+        overlap=app.config['INGEST_CHUNK_OVERLAP'],
+        extractor_modules=app.config['INGEST_EXTRACTOR_MODULES']
+    )
+    app.extensions['ingestion'] = manager
+    return manager
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Background SQLite maintenance for the Qlippy backend.
+Runs PRAGMA optimize, passive WAL checkpoints, incremental vacuum and
+periodic integrity checks while the API is idle, in short time slices so
+request handling is never blocked for long.
+
+Run directly to switch an existing database to incremental auto-vacuum:
+    python maintenance.py --enable-incremental-vacuum
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+from werkzeug.serving import is_running_from_reloader
+
+logger = logging.getLogger(__name__)
+
+# Seconds between runs of each task
+DEFAULT_TASK_INTERVALS = {
+    'optimize': 60 * 60,
+    'checkpoint': 5 * 60,
+    'incremental_vacuum': 10 * 60,
+    'integrity_check': 24 * 60 * 60
+}
+
+
+def is_reloader_parent(app):
+    """
+    True in the watcher process of the Werkzeug reloader, which never serves
+    requests. Only when the reloader is really used (USE_RELOADER): with it
+    off, the one process serves even in debug mode.
+    """
+    return app.debug and app.config['USE_RELOADER'] and not is_running_from_reloader()
+
+
+def sqlite_database_path(engine):
+    """Return the file path of a SQLite engine, or None for other/in-memory databases"""
+    if engine.url.get_backend_name() != 'sqlite':
+        return None
+    database = engine.url.database
+    if not database or database == ':memory:':
+        return None
+    return database
+
+
+def enable_incremental_auto_vacuum(engine):
+    """Make newly created SQLite databases use incremental auto-vacuum"""
+    @event.listens_for(engine, 'connect')
+    def set_auto_vacuum(dbapi_connection, connection_record):
+        # Only takes effect before the first table is created
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.close()
+
+
+class MaintenanceScheduler:
+    def __init__(self, engine, metrics=None, idle_seconds=30, check_interval=15,
+                 slice_seconds=0.05, vacuum_pages_per_step=64, task_intervals=None):
+        self.engine = engine
+        self.metrics = metrics
+        self.idle_seconds = idle_seconds
+        self.check_interval = check_interval
+        self.slice_seconds = slice_seconds
+        self.vacuum_pages_per_step = vacuum_pages_per_step
+        self.task_intervals = dict(DEFAULT_TASK_INTERVALS, **(task_intervals or {}))
+        self._last_run = {task: 0.0 for task in self.task_intervals}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {
+            'runs': {task: 0 for task in self.task_intervals},
+            'last_run': {task: None for task in self.task_intervals},
+            'last_duration_ms': {task: None for task in self.task_intervals},
+            'pages_reclaimed': 0,
+            'bytes_reclaimed': 0,
+            'last_checkpoint': None,
+            'last_integrity_check': None,
+            'skipped_busy': 0
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='qlippy-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def is_idle(self):
+        if self.metrics is None:
+            return True
+        if self.metrics.in_flight > 0:
+            return False
+        last_request_at = self.metrics.last_request_at
+        return last_request_at is None or time.time() - last_request_at >= self.idle_seconds
+
+    def _loop(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.run_due_tasks()
+            except Exception as e:
+                logger.error("Maintenance run failed: %s", e)
+
+    def run_due_tasks(self, force=False):
+        """Run every task whose interval has elapsed, stopping as soon as requests arrive"""
+        with self._lock:
+            now = time.time()
+            for task, interval in self.task_intervals.items():
+                if not force and now - self._last_run[task] < interval:
+                    continue
+                if not force and not self.is_idle():
+                    self.stats['skipped_busy'] += 1
+                    return
+                started = time.perf_counter()
+                getattr(self, f'_run_{task}')(force)
+                self._last_run[task] = time.time()
+                self.stats['runs'][task] += 1
+                self.stats['last_run'][task] = datetime.utcnow().isoformat()
+                self.stats['last_duration_ms'][task] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _run_optimize(self, force):
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA optimize')
+            conn.commit()
+
+    def _run_checkpoint(self, force):
+        with self.engine.connect() as conn:
+            busy, wal_pages, checkpointed = conn.exec_driver_sql('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        self.stats['last_checkpoint'] = {
+            'busy': bool(busy),
+            'wal_pages': wal_pages,
+            'checkpointed_pages': checkpointed
+        }
+
+    def _run_incremental_vacuum(self, force):
+        with self.engine.connect() as conn:
+            if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+                return
+            page_size = conn.exec_driver_sql('PRAGMA page_size').scalar()
+            # Free a few pages per step and give way as soon as a request arrives
+            while force or self.is_idle():
+                slice_started = time.perf_counter()
+                free_before = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+                if free_before == 0:
+                    break
+                while time.perf_counter() - slice_started < self.slice_seconds:
+                    conn.exec_driver_sql(f'PRAGMA incremental_vacuum({self.vacuum_pages_per_step})')
+                    conn.commit()
+                    if conn.exec_driver_sql('PRAGMA freelist_count').scalar() == 0:
+                        break
+                free_after = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+                reclaimed = free_before - free_after
+                self.stats['pages_reclaimed'] += reclaimed
+                self.stats['bytes_reclaimed'] += reclaimed * page_size
+                if reclaimed == 0:
+                    break
+                time.sleep(0.01)
+
+    def _run_integrity_check(self, force):
+        with self.engine.connect() as conn:
+            problems = [row[0] for row in conn.exec_driver_sql('PRAGMA integrity_check(10)').fetchall()]
+        ok = problems == ['ok']
+        self.stats['last_integrity_check'] = {
+            'ok': ok,
+            'problems': [] if ok else problems,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        if not ok:
+            logger.error("SQLite integrity check failed: %s", problems)
+
+    def report(self):
+        """Current maintenance stats plus on-disk storage figures"""
+        with self.engine.connect() as conn:
+            page_size = conn.exec_driver_sql('PRAGMA page_size').scalar()
+            storage = {
+                'page_count': conn.exec_driver_sql('PRAGMA page_count').scalar(),
+                'freelist_count': conn.exec_driver_sql('PRAGMA freelist_count').scalar(),
+                'page_size': page_size,
+                'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(
+                    conn.exec_driver_sql('PRAGMA auto_vacuum').scalar()),
+                'journal_mode': conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+            }
+        path = sqlite_database_path(self.engine)
+        if path:
+            wal_path = path + '-wal'
+            storage['file_bytes'] = os.path.getsize(path) if os.path.exists(path) else 0
+            storage['wal_bytes'] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        return {'idle': self.is_idle(), 'storage': storage, **self.stats}
+
+
+def init_maintenance(app, db):
+    """Start the maintenance scheduler for file-backed SQLite databases"""
+    with app.app_context():
+        engine = db.engine
+    if sqlite_database_path(engine) is None:
+        return None
+
+    enable_incremental_auto_vacuum(engine)
+
+    if not app.config['MAINTENANCE_ENABLED'] or app.testing:
+        return None
+
+    scheduler = MaintenanceScheduler(
+        engine,
+        metrics=app.extensions.get('metrics'),
+        idle_seconds=app.config['MAINTENANCE_IDLE_SECONDS'],
+        check_interval=app.config['MAINTENANCE_CHECK_INTERVAL'],
+        slice_seconds=app.config['MAINTENANCE_SLICE_MS'] / 1000.0,
+        vacuum_pages_per_step=app.config['MAINTENANCE_VACUUM_PAGES'],
+        task_intervals=app.config['MAINTENANCE_TASK_INTERVALS']
+    )
+    app.extensions['maintenance'] = scheduler
+    if not is_reloader_parent(app):
+        scheduler.start()
+    return scheduler
+
+
+def enable_incremental_vacuum_offline(db_path):
+    """Convert an existing database to incremental auto-vacuum (rewrites the whole file)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    if '--enable-incremental-vacuum' not in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+
+    db_path = 'instance/qlippy.db'
+    if not os.path.exists(db_path):
+        print(f"❌ Database file not found at {db_path}")
+        sys.exit(1)
+
+    print("🧹 Converting database to incremental auto-vacuum (stop the server first)...")
+    if enable_incremental_vacuum_offline(db_path):
+        print("✅ Incremental auto-vacuum enabled")
+    else:
+        print("❌ Failed to enable incremental auto-vacuum")
+        sys.exit(1)
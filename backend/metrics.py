@@ -0,0 +1,199 @@
+"""
+Request and SQL instrumentation for the Qlippy backend.
+Collects per-route latency histograms, SQL statement counts, DB time and
+response sizes, and renders them in Prometheus text format.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds (upper bounds, +Inf is implicit)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    def __init__(self, slow_query_threshold=0.1, slow_query_log_size=100):
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_queries = deque(maxlen=slow_query_log_size)
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.last_request_at = None
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._requests = {}
+        self._sql_statements = {}
+        self._db_seconds = {}
+        self._response_bytes = {}
+
+    def record_request(self, method, route, status, duration, sql_count, db_time, size):
+        key = (method, route, str(status))
+        route_key = (method, route)
+        with self._lock:
+            if route_key not in self._latency:
+                self._latency[route_key] = Histogram()
+            self._latency[route_key].observe(duration)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._sql_statements[route_key] = self._sql_statements.get(route_key, 0) + sql_count
+            self._db_seconds[route_key] = self._db_seconds.get(route_key, 0.0) + db_time
+            self._response_bytes[route_key] = self._response_bytes.get(route_key, 0) + size
+
+    def record_slow_query(self, statement, duration, route):
+        entry = {
+            'statement': statement,
+            'duration_ms': round(duration * 1000, 3),
+            'route': route,
+            'timestamp': time.time()
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+        logger.warning("Slow query (%.1f ms) on %s: %s", duration * 1000, route, statement)
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.last_request_at = time.time()
+
+    def instrument(self, engine):
+        """Count and time the SQL statements run on an engine"""
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            duration = time.perf_counter() - conn.info['query_start'].pop()
+            route = None
+            if has_request_context():
+                g.sql_count = g.get('sql_count', 0) + 1
+                g.db_time = g.get('db_time', 0.0) + duration
+                route = _current_route()
+            if duration >= self.slow_query_threshold:
+                self.record_slow_query(statement, duration, route)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            lines.append('# HELP qlippy_http_requests_total Total HTTP requests.')
+            lines.append('# TYPE qlippy_http_requests_total counter')
+            for (method, route, status), value in sorted(self._requests.items()):
+                lines.append(f'qlippy_http_requests_total{{method="{method}",route="{route}",status="{status}"}} {value}')
+
+            lines.append('# HELP qlippy_http_request_duration_seconds Request latency per route.')
+            lines.append('# TYPE qlippy_http_request_duration_seconds histogram')
+            for (method, route), hist in sorted(self._latency.items()):
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'qlippy_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'qlippy_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f'qlippy_http_request_duration_seconds_sum{{{labels}}} {hist.total:.6f}')
+                lines.append(f'qlippy_http_request_duration_seconds_count{{{labels}}} {hist.count}')
+
+            lines.append('# HELP qlippy_sql_statements_total SQL statements executed per route.')
+            lines.append('# TYPE qlippy_sql_statements_total counter')
+            for (method, route), value in sorted(self._sql_statements.items()):
+                lines.append(f'qlippy_sql_statements_total{{method="{method}",route="{route}"}} {value}')
+
+            lines.append('# HELP qlippy_db_seconds_total Time spent in the database per route.')
+            lines.append('# TYPE qlippy_db_seconds_total counter')
+            for (method, route), value in sorted(self._db_seconds.items()):
+                lines.append(f'qlippy_db_seconds_total{{method="{method}",route="{route}"}} {value:.6f}')
+
+            lines.append('# HELP qlippy_http_response_bytes_total Response body bytes per route.')
+            lines.append('# TYPE qlippy_http_response_bytes_total counter')
+            for (method, route), value in sorted(self._response_bytes.items()):
+                lines.append(f'qlippy_http_response_bytes_total{{method="{method}",route="{route}"}} {value}')
+
+            lines.append('# HELP qlippy_slow_queries_logged Slow queries currently held in the log.')
+            lines.append('# TYPE qlippy_slow_queries_logged gauge')
+            lines.append(f'qlippy_slow_queries_logged {len(self.slow_queries)}')
+
+            lines.append('# HELP qlippy_http_requests_in_flight Requests currently being handled.')
+            lines.append('# TYPE qlippy_http_requests_in_flight gauge')
+            lines.append(f'qlippy_http_requests_in_flight {self.in_flight}')
+
+        lines.append('# HELP qlippy_uptime_seconds Seconds since the backend started.')
+        lines.append('# TYPE qlippy_uptime_seconds gauge')
+        lines.append(f'qlippy_uptime_seconds {time.time() - self.started_at:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _current_route():
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+
+def init_metrics(app, db):
+    """Attach request middleware and SQLAlchemy hooks to the app"""
+    metrics = Metrics(
+        slow_query_threshold=app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000.0,
+        slow_query_log_size=app.config['SLOW_QUERY_LOG_SIZE']
+    )
+    app.extensions['metrics'] = metrics
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.db_time = 0.0
+        g.metrics_in_flight = True
+        metrics.request_started()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        duration = time.perf_counter() - started
+        size = response.calculate_content_length() or 0
+        metrics.record_request(
+            request.method,
+            _current_route(),
+            response.status_code,
+            duration,
+            g.get('sql_count', 0),
+            g.get('db_time', 0.0),
+            size
+        )
+        response.headers['Server-Timing'] = f"app;dur={duration * 1000:.1f}, db;dur={g.get('db_time', 0.0) * 1000:.1f}"
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        if g.pop('metrics_in_flight', False):
+            metrics.request_finished()
+
+    with app.app_context():
+        metrics.instrument(db.engine)
+
+    return metrics
@@ -47,6 +47,13 @@ class Conversation(db.Model):
         data['messages'] = [message.to_dict() for message in self.messages]
         return data
 
+class SpaceLocation(db.Model):
+    """Catalog entry for a conversation, message or attachment stored in its space's database (see sharding.py)"""
+    __tablename__ = 'space_locations'
+    
+    row_id = db.Column(db.String(36), primary_key=True)
+    space_id = db.Column(db.String(36), nullable=False, index=True)
+
 class Message(db.Model):
     __tablename__ = 'messages'
     
@@ -55,6 +62,8 @@ class Message(db.Model):
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Loaded with one extra query per batch of messages rather than one per message
+    attachments = db.relationship('Attachment', backref='message', lazy='selectin', cascade='all, delete-orphan')
 
     def to_dict(self):
         return {
@@ -62,7 +71,31 @@ class Message(db.Model):
             'role': self.role,
             'content': self.content,
             'timestamp': self.timestamp.isoformat(),
-            'conversation_id': self.conversation_id
+            'conversation_id': self.conversation_id,
+            'attachments': [attachment.to_dict() for attachment in self.attachments]
+        }
+
+class Attachment(db.Model):
+    __tablename__ = 'attachments'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    # Uploaded before the message is sent, so unlinked until then
+    message_id = db.Column(db.String(36), db.ForeignKey('messages.id'), index=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)  # Names the blob on disk
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'message_id': self.message_id,
+            'sha256': self.sha256,
+            'filename': self.filename,
+            'content_type': self.content_type,
+            'size': self.size,
+            'created_at': self.created_at.isoformat()
         }
 
 class Plugin(db.Model):
@@ -81,4 +114,48 @@ class Plugin(db.Model):
             'description': self.description,
             'enabled': self.enabled,
             'created_at': self.created_at.isoformat()
-        } 
\ No newline at end of file
+        } 
+
+class Document(db.Model):
+    """Ingestion state of an attachment's content, shared by every attachment with the same hash"""
+    __tablename__ = 'documents'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    status = db.Column(db.String(20), nullable=False)  # 'done', 'unsupported' or 'error'
+    extractor = db.Column(db.String(50))
+    chars = db.Column(db.Integer, default=0)
+    chunk_count = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    ingested_at = db.Column(db.DateTime, default=datetime.utcnow)
+    chunks = db.relationship('DocumentChunk', backref='document', lazy=True, cascade='all, delete-orphan', order_by='DocumentChunk.chunk_index')
+
+    def to_dict(self):
+        return {
+            'sha256': self.sha256,
+            'status': self.status,
+            'extractor': self.extractor,
+            'chars': self.chars,
+            'chunk_count': self.chunk_count,
+            'error': self.error,
+            'ingested_at': self.ingested_at.isoformat()
+        }
+
+class DocumentChunk(db.Model):
+    __tablename__ = 'document_chunks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), db.ForeignKey('documents.sha256'), nullable=False, index=True)
+    chunk_index = db.Column(db.Integer, nullable=False)
+    start_offset = db.Column(db.Integer, nullable=False)  # Character offsets into the extracted text
+    end_offset = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sha256': self.sha256,
+            'chunk_index': self.chunk_index,
+            'start': self.start_offset,
+            'end': self.end_offset,
+            'text': self.text
+        }
@@ -0,0 +1,404 @@
+"""
+Out-of-process plugin runtime for the Qlippy backend.
+A plugin's code is a Python module named after the plugin (slugified) in
+instance/plugins/; each public top-level function is a tool. Nothing is
+imported at startup: a plugin is located the first time one of its tools
+is called, and its module is only ever imported inside a worker process.
+
+Calls run in a small pool of worker processes with an address-space limit.
+A call that outlives its timeout has its worker killed and replaced, so one
+slow or runaway plugin can't stall a chat turn. Independent calls from one
+turn run concurrently. A module may declare, as plain literals:
+
+    TIMEOUT = 5                    # seconds per call (default PLUGIN_CALL_TIMEOUT)
+    CACHE_TTL = {'forecast': 300}  # idempotent tools and how long to cache them
+"""
+
+import ast
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+WORKER_START_TIMEOUT = 30
+
+
+class PluginError(Exception):
+    """Raised when a plugin call can't be made or fails"""
+
+
+class PluginTimeout(PluginError):
+    """Raised when a plugin call outlives its timeout"""
+
+
+def plugin_slug(name):
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def _worker_main(conn, memory_limit_mb):
+    # Runs in a spawned process. Spawning re-imports the parent's main module
+    # (run.py, and with it the app's modules) before this runs, so the worker
+    # starts with Flask and SQLAlchemy imported but none of the app's threads,
+    # connections or state. The memory limit applies on top of that baseline.
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            pass  # Not supported on this platform
+    import importlib.util
+
+    modules = {}  # path -> (mtime, module)
+    conn.send(('ready', True, None))
+    while True:
+        try:
+            call = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if call is None:
+            return
+        call_id, path, tool, args = call
+        try:
+            mtime = os.path.getmtime(path)
+            cached = modules.get(path)
+            if cached is None or cached[0] != mtime:
+                spec = importlib.util.spec_from_file_location(f'qlippy_plugin_{len(modules)}', path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                modules[path] = cached = (mtime, module)
+            function = getattr(cached[1], tool, None)
+            if tool.startswith('_') or not callable(function):
+                raise AttributeError(f'Plugin has no tool named {tool!r}')
+            result = function(**args)
+            json.dumps(result)  # Results go back to the API as JSON
+            conn.send((call_id, True, result))
+        except BaseException as e:
+            if isinstance(e, KeyboardInterrupt):
+                return
+            conn.send((call_id, False, f'{type(e).__name__}: {e}'))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, memory_limit_mb),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        if not self.conn.poll(WORKER_START_TIMEOUT):
+            self.kill()
+            raise PluginError('Plugin worker did not start')
+        self.conn.recv()
+
+    def call(self, call_id, path, tool, args, timeout):
+        """Run one call; returns (ok, result) or None on timeout, EOFError if the worker died"""
+        self.conn.send((call_id, path, tool, args))
+        if not self.conn.poll(timeout):
+            return None
+        _, ok, result = self.conn.recv()
+        return ok, result
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+
+    def shutdown(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.kill()
+
+
+class _PluginStats:
+    def __init__(self, samples):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cache_hits = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=samples)  # ms, calls that ran
+
+    def report(self):
+        ordered = sorted(self.latencies)
+        report = {
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'cache_hits': self.cache_hits,
+            'last_error': self.last_error
+        }
+        if ordered:
+            report.update({
+                'p50_ms': _percentile(ordered, 0.50),
+                'p95_ms': _percentile(ordered, 0.95),
+                'max_ms': ordered[-1]
+            })
+        return report
+
+
+class PluginRuntime:
+    def __init__(self, plugin_dir, workers=2, call_timeout=10.0, memory_limit_mb=1024,
+                 max_calls_per_plugin=None, cache_size=500, samples_per_plugin=500):
+        self.plugin_dir = plugin_dir
+        self.workers = max(1, workers)
+        self.call_timeout = call_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_calls_per_plugin = max(1, max_calls_per_plugin or self.workers)
+        self.cache_size = cache_size
+        self.samples_per_plugin = samples_per_plugin
+        self._context = multiprocessing.get_context('spawn')  # Never fork the app and its threads
+        self._lock = threading.Lock()
+        self._idle = []
+        self._started = 0
+        self._worker_free = threading.Condition(self._lock)
+        self._plugin_slots = {}  # plugin -> semaphore of max_calls_per_plugin concurrent calls
+        self._manifests = {}  # path -> (mtime, manifest)
+        self._cache = OrderedDict()  # (plugin, tool, args) -> (expires, result)
+        self._stats = {}
+        self._next_call_id = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers * 2, thread_name_prefix='plugin-call')
+
+    # Discovery
+
+    def module_path(self, name):
+        """Path of a plugin's module, or None if it has no code"""
+        path = os.path.join(self.plugin_dir, plugin_slug(name) + '.py')
+        return path if os.path.isfile(path) else None
+
+    def manifest(self, path):
+        """TIMEOUT and CACHE_TTL of a plugin module, read from its source without running it"""
+        mtime = os.path.getmtime(path)
+        cached = self._manifests.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        manifest = {'timeout': self.call_timeout, 'cache_ttl': {}}
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in tree.body:
+            if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+                continue
+            target = node.targets[0]
+            if not isinstance(target, ast.Name) or target.id not in ('TIMEOUT', 'CACHE_TTL'):
+                continue
+            try:
+                value = ast.literal_eval(node.value)
+            except ValueError:
+                continue
+            if target.id == 'TIMEOUT' and isinstance(value, (int, float)) and value > 0:
+                manifest['timeout'] = min(float(value), self.call_timeout * 6)
+            elif target.id == 'CACHE_TTL' and isinstance(value, dict):
+                manifest['cache_ttl'] = {str(tool): float(ttl) for tool, ttl in value.items()}
+        self._manifests[path] = (mtime, manifest)
+        return manifest
+
+    # Worker pool
+
+    def _acquire_worker(self, deadline):
+        with self._lock:
+            while not self._idle and self._started >= self.workers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._worker_free.wait(remaining):
+                    raise PluginTimeout('No plugin worker became free in time')
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        try:
+            return _Worker(self._context, self.memory_limit_mb)
+        except Exception:
+            self._discard_worker(None)
+            raise
+
+    def _release_worker(self, worker):
+        with self._lock:
+            self._idle.append(worker)
+            self._worker_free.notify()
+
+    def _discard_worker(self, worker):
+        if worker is not None:
+            worker.kill()
+        with self._lock:
+            self._started -= 1
+            self._worker_free.notify()
+
+    def _slots(self, plugin):
+        with self._lock:
+            if plugin not in self._plugin_slots:
+                self._plugin_slots[plugin] = threading.BoundedSemaphore(self.max_calls_per_plugin)
+            return self._plugin_slots[plugin]
+
+    # Calls
+
+    def _record(self, plugin, duration_ms=None, error=None, timeout=False, cache_hit=False):
+        with self._lock:
+            stats = self._stats.get(plugin)
+            if stats is None:
+                stats = self._stats[plugin] = _PluginStats(self.samples_per_plugin)
+            stats.calls += 1
+            if cache_hit:
+                stats.cache_hits += 1
+            if duration_ms is not None:
+                stats.latencies.append(round(duration_ms, 3))
+            if error is not None:
+                stats.errors += 1
+                stats.timeouts += int(timeout)
+                stats.last_error = error
+
+    def _cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry
+
+    def _cache_put(self, key, ttl, result):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def call(self, plugin, tool, args=None):
+        """
+        Run one tool call and return its result. Raises PluginTimeout or
+        PluginError. Results of tools listed in CACHE_TTL are cached.
+        """
+        args = args or {}
+        if not isinstance(args, dict):
+            raise PluginError('Tool arguments must be an object')
+        path = self.module_path(plugin)
+        if path is None:
+            self._record(plugin, error='No plugin code found')
+            raise PluginError(f'No code found for plugin {plugin!r} (expected {plugin_slug(plugin)}.py)')
+        try:
+            manifest = self.manifest(path)
+        except (OSError, SyntaxError, ValueError) as e:
+            self._record(plugin, error=str(e))
+            raise PluginError(f'Plugin {plugin!r} could not be read: {e}')
+
+        ttl = manifest['cache_ttl'].get(tool)
+        cache_key = None
+        if ttl:
+            try:
+                cache_key = (plugin, tool, json.dumps(args, sort_keys=True))
+            except TypeError:
+                raise PluginError('Tool arguments must be JSON')
+            entry = self._cache_get(cache_key)
+            if entry is not None:
+                self._record(plugin, cache_hit=True)
+                return entry[1]
+
+        # Time waiting for the plugin's slot and a worker counts against the timeout
+        timeout = manifest['timeout']
+        started = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        slots = self._slots(plugin)
+        if not slots.acquire(timeout=timeout):
+            self._record(plugin, error='Timed out waiting for earlier calls', timeout=True)
+            raise PluginTimeout(f'Plugin {plugin!r} is busy with earlier calls')
+        try:
+            try:
+                worker = self._acquire_worker(deadline)
+            except PluginTimeout as e:
+                self._record(plugin, error=str(e), timeout=True)
+                raise
+            with self._lock:
+                self._next_call_id += 1
+                call_id = self._next_call_id
+            try:
+                outcome = worker.call(call_id, path, tool, args, max(0.0, deadline - time.monotonic()))
+            except (EOFError, BrokenPipeError, OSError):
+                self._discard_worker(worker)
+                self._record(plugin, (time.perf_counter() - started) * 1000, error='Worker crashed')
+                logger.warning("Plugin %s crashed its worker on %s", plugin, tool)
+                raise PluginError(f'Plugin {plugin!r} crashed its worker (memory limit is {self.memory_limit_mb} MB)')
+            if outcome is None:
+                self._discard_worker(worker)
+                self._record(plugin, (time.perf_counter() - started) * 1000, error='Timed out', timeout=True)
+                logger.warning("Plugin %s timed out on %s after %.1fs; worker replaced", plugin, tool, timeout)
+                raise PluginTimeout(f'Plugin {plugin!r} did not finish within {timeout:g}s')
+            self._release_worker(worker)
+        finally:
+            slots.release()
+
+        ok, result = outcome
+        duration_ms = (time.perf_counter() - started) * 1000
+        if not ok:
+            self._record(plugin, duration_ms, error=result)
+            raise PluginError(result)
+        self._record(plugin, duration_ms)
+        if cache_key is not None:
+            self._cache_put(cache_key, ttl, result)
+        return result
+
+    def call_many(self, calls):
+        """
+        Run independent calls ({'plugin', 'tool', 'args'}) concurrently.
+        Returns one result per call, in order; a failed call doesn't fail the others.
+        """
+        def run(call):
+            started = time.perf_counter()
+            try:
+                result = {'ok': True, 'result': self.call(call['plugin'], call['tool'], call.get('args'))}
+            except PluginTimeout as e:
+                result = {'ok': False, 'error': str(e), 'timeout': True}
+            except PluginError as e:
+                result = {'ok': False, 'error': str(e)}
+            result['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            return result
+
+        return list(self._executor.map(run, calls))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': {'max': self.workers, 'running': self._started, 'idle': len(self._idle)},
+                'cache_entries': len(self._cache),
+                'plugins': {name: stats.report() for name, stats in sorted(self._stats.items())}
+            }
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+        for worker in idle:
+            worker.shutdown()
+        self._executor.shutdown(wait=False)
+
+
+def init_plugin_runtime(app):
+    """Create the plugin runtime; workers are only started by the first call"""
+    plugin_dir = os.path.join(app.instance_path, app.config['PLUGIN_DIR'])
+    os.makedirs(plugin_dir, exist_ok=True)
+    runtime = PluginRuntime(
+        plugin_dir,
+        workers=app.config['PLUGIN_WORKERS'],
+        call_timeout=app.config['PLUGIN_CALL_TIMEOUT'],
+        memory_limit_mb=app.config['PLUGIN_MEMORY_LIMIT_MB'],
+        max_calls_per_plugin=app.config['PLUGIN_MAX_CALLS_PER_PLUGIN'],
+        cache_size=app.config['PLUGIN_CACHE_SIZE']
+    )
+    app.extensions['plugins'] = runtime
+    return runtime
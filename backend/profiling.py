@@ -0,0 +1,130 @@
+"""
+On-demand request profiling for the Qlippy backend.
+A request is profiled with cProfile when it carries the profiling token
+(header or query flag) or is picked by the configured sampling rate.
+Nothing is registered when profiling is disabled, so there is no overhead.
+One request is profiled at a time (Python 3.12+ allows only one active
+profiler per process); others that ask meanwhile run unprofiled.
+"""
+
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Qlippy-Profile'
+PROFILE_QUERY_FLAG = '_profile'
+PROFILE_SKIPPED_HEADER = 'X-Qlippy-Profile-Skipped'
+
+_active = threading.Lock()  # Held while a request is being profiled
+
+
+def _token_matches(app):
+    token = app.config['PROFILING_TOKEN']
+    if not token:
+        return False
+    supplied = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_FLAG)
+    if not supplied:
+        return False
+    # Bytes: compare_digest rejects str with non-ASCII characters
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _should_profile(app):
+    if _token_matches(app):
+        return True
+    sample_rate = app.config['PROFILING_SAMPLE_RATE']
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _prune_profiles(profile_dir, max_profiles):
+    profiles = sorted(
+        (entry for entry in os.scandir(profile_dir) if entry.name.endswith('.prof')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in profiles[:max(0, len(profiles) - max_profiles)]:
+        for path in (entry.path, entry.path[:-len('.prof')] + '.json'):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def init_profiling(app):
+    """Register profiling hooks if profiling is enabled in config"""
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    profile_dir = os.path.join(app.instance_path, app.config['PROFILE_DIR'])
+    os.makedirs(profile_dir, exist_ok=True)
+
+    @app.before_request
+    def start_profiler():
+        if not _should_profile(app):
+            return
+        if not _active.acquire(blocking=False):
+            g.profile_skipped = 'another request is being profiled'
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler or a debugger holds the process's profiling hook
+            _active.release()
+            g.profile_skipped = str(e)
+            return
+        g.profiler = profiler
+        g.profile_started = time.perf_counter()
+
+    @app.after_request
+    def save_profile(response):
+        skipped = g.pop('profile_skipped', None)
+        if skipped is not None:
+            response.headers[PROFILE_SKIPPED_HEADER] = skipped
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        _active.release()
+        duration = time.perf_counter() - g.pop('profile_started')
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        timestamp = datetime.utcnow()
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        name = f"{timestamp.strftime('%Y%m%dT%H%M%S%f')}_{request.method}_{slug}"
+
+        try:
+            profiler.dump_stats(os.path.join(profile_dir, name + '.prof'))
+            with open(os.path.join(profile_dir, name + '.json'), 'w') as f:
+                json.dump({
+                    'method': request.method,
+                    'route': route,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'duration_ms': round(duration * 1000, 3),
+                    'timestamp': timestamp.isoformat()
+                }, f, indent=2)
+            _prune_profiles(profile_dir, app.config['PROFILE_MAX_FILES'])
+            response.headers['X-Qlippy-Profile-File'] = name + '.prof'
+        except OSError as e:
+            logger.error("Failed to write profile %s: %s", name, e)
+
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # after_request is skipped if the response could not be built
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _active.release()
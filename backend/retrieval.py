@@ -0,0 +1,110 @@
+"""
+Chunk retrieval for the Qlippy backend.
+Ranks the ingested chunks of a conversation's attachments against a prompt
+with BM25. Each document's inverted index is built from its chunks the
+first time it is searched and kept in an LRU cache bounded by chunk count,
+so a lookup only scores the postings of the prompt's words.
+"""
+
+import heapq
+import math
+import threading
+from collections import Counter, OrderedDict
+
+from models import DocumentChunk
+from suggest import tokenize
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class _DocumentIndex:
+    __slots__ = ('chunks', 'postings', 'lengths')
+
+    def __init__(self, rows):
+        self.chunks = {}  # chunk id -> (chunk_index, start, end, text)
+        self.postings = {}  # word -> [(chunk id, term frequency)]
+        self.lengths = {}  # chunk id -> words
+        for row in rows:
+            words = tokenize(row.text)
+            self.chunks[row.id] = (row.chunk_index, row.start_offset, row.end_offset, row.text)
+            self.lengths[row.id] = len(words)
+            for word, count in Counter(words).items():
+                self.postings.setdefault(word, []).append((row.id, count))
+
+
+class ChunkRetriever:
+    def __init__(self, max_cached_chunks=50000):
+        self.max_cached_chunks = max_cached_chunks
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()  # sha256 -> _DocumentIndex, least recently used first
+        self._cached_chunks = 0
+
+    def _index(self, sha256):
+        with self._lock:
+            index = self._indexes.get(sha256)
+            if index is not None:
+                self._indexes.move_to_end(sha256)
+                return index
+
+        index = _DocumentIndex(DocumentChunk.query.filter_by(sha256=sha256).all())
+        with self._lock:
+            if sha256 not in self._indexes:
+                self._indexes[sha256] = index
+                self._cached_chunks += len(index.chunks)
+                while self._cached_chunks > self.max_cached_chunks and len(self._indexes) > 1:
+                    _, evicted = self._indexes.popitem(last=False)
+                    self._cached_chunks -= len(evicted.chunks)
+        return index
+
+    def invalidate(self, sha256):
+        """Forget a document's index after it was (re-)ingested or deleted"""
+        with self._lock:
+            index = self._indexes.pop(sha256, None)
+            if index is not None:
+                self._cached_chunks -= len(index.chunks)
+
+    def search(self, sha256s, query, limit=5):
+        """Top chunks of the given documents for query, best first"""
+        words = set(tokenize(query))
+        indexes = {sha256: self._index(sha256) for sha256 in sha256s}
+        indexes = {sha256: index for sha256, index in indexes.items() if index.chunks}
+        if not words or not indexes:
+            return []
+
+        total_chunks = sum(len(index.chunks) for index in indexes.values())
+        average_length = sum(sum(index.lengths.values()) for index in indexes.values()) / total_chunks or 1
+        scores = {}
+        for word in words:
+            postings = [(sha256, index, index.postings.get(word, ())) for sha256, index in indexes.items()]
+            frequency = sum(len(entries) for _, _, entries in postings)
+            if not frequency:
+                continue
+            idf = math.log(1 + (total_chunks - frequency + 0.5) / (frequency + 0.5))
+            for sha256, index, entries in postings:
+                for chunk_id, count in entries:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * index.lengths[chunk_id] / average_length)
+                    key = (sha256, chunk_id)
+                    scores[key] = scores.get(key, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+
+        results = []
+        for (sha256, chunk_id), score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+            chunk_index, start, end, text = indexes[sha256].chunks[chunk_id]
+            results.append({
+                'sha256': sha256,
+                'chunk_index': chunk_index,
+                'start': start,
+                'end': end,
+                'text': text,
+                'score': round(score, 4)
+            })
+        return results
+
+
+def init_retrieval(app):
+    retriever = ChunkRetriever(max_cached_chunks=app.config['RETRIEVAL_CACHE_CHUNKS'])
+    app.extensions['retrieval'] = retriever
+    ingestion = app.extensions.get('ingestion')
+    if ingestion is not None:
+        ingestion.on_ingested = retriever.invalidate
+    return retriever
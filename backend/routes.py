@@ -1,89 +1,129 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime
-from models import db, Conversation, Message, Plugin, Space
+from flask import Blueprint, request, jsonify, current_app, Response, send_file
+from datetime import datetime, timedelta
+from sqlalchemy import text
+import mimetypes
+import os
+import time
+import uuid
+from models import db, Conversation, SpaceLocation, Message, Plugin, Space, Attachment, Document
+from attachments import AttachmentTooLarge, QuotaExceeded, is_inline
+from tracing import parse_span
+from plugin_runtime import PluginError, PluginTimeout
+from write_queue import WriteQueueTimeout, write
 
 api = Blueprint('api', __name__)
 
+@api.errorhandler(WriteQueueTimeout)
+def write_queue_timeout(e):
+    # The write was cancelled before it ran, so the client can safely retry
+    return jsonify({'error': str(e)}), 503
+
 # Conversation routes
 @api.route('/conversations', methods=['GET'])
 def get_conversations():
+    space_id = request.args.get('space')
+    shards = _shards()
+    if shards is not None:
+        # One query per batch of attached databases rather than one per conversation
+        try:
+            if space_id:
+                # Filed under the space's folder: in its database, or in the catalog if it isn't a space
+                rows = shards.list_conversations([space_id], folder=space_id)
+            else:
+                rows = shards.list_conversations()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify([_conversation_row(row) for row in rows])
+    
+    query = Conversation.query
+    if space_id:
+        query = query.filter_by(folder=space_id)
     conversations = []
-    for conv in Conversation.query.all():
+    for conv in query.all():
         # Get the last message for preview
         last_message = Message.query.filter_by(conversation_id=conv.id).order_by(Message.timestamp.desc()).first()
         
         conv_data = conv.to_dict()
-        conv_data['last_message_preview'] = (
-            last_message.content[:100] + '...' 
-            if last_message and len(last_message.content) > 100 
-            else (last_message.content if last_message else '')
-        )
+        conv_data['last_message_preview'] = _message_preview(last_message.content if last_message else '')
         conversations.append(conv_data)
     
     return jsonify(conversations)
 
+def _message_preview(content):
+    return content[:100] + '...' if len(content) > 100 else content
+
+def _conversation_row(row):
+    conversation_id, title, folder, last_updated, created_at, message_count, last_message = row
+    return {
+        'id': conversation_id,
+        'title': title,
+        'folder': folder,
+        'last_updated': datetime.fromisoformat(last_updated).isoformat(),
+        'created_at': datetime.fromisoformat(created_at).isoformat(),
+        'message_count': message_count,
+        'last_message_preview': _message_preview(last_message or '')
+    }
+
 @api.route('/conversations', methods=['POST'])
 def create_conversation():
     data = request.get_json()
     title = data.get('title', 'New Conversation')
     folder = data.get('folder')
     
-    conversation = Conversation(
-        title=title,
-        folder=folder
+    conversation_id = str(uuid.uuid4())
+    conversation = _write_located(
+        _folder_space(folder), [conversation_id], _create_conversation, conversation_id, title, folder
     )
-    db.session.add(conversation)
-    db.session.commit()
+    _index_conversation(conversation)
     
-    return jsonify(conversation.to_dict()), 201
+    return jsonify(conversation), 201
 
 @api.route('/conversations/<conversation_id>', methods=['GET'])
 def get_conversation(conversation_id):
-    conversation = Conversation.query.get(conversation_id)
+    conversation = _read_in(_space_of(conversation_id), _get_conversation_with_messages, conversation_id)
     if not conversation:
         return jsonify({'error': 'Conversation not found'}), 404
     
-    return jsonify(conversation.to_dict_with_messages())
+    return jsonify(conversation)
 
 @api.route('/conversations/<conversation_id>', methods=['PUT'])
 def update_conversation(conversation_id):
-    conversation = Conversation.query.get(conversation_id)
-    if not conversation:
-        return jsonify({'error': 'Conversation not found'}), 404
-    
     data = request.get_json()
     print(f"Updating conversation {conversation_id} with data: {data}")
     
-    if 'title' in data:
-        conversation.title = data['title']
-    if 'folder' in data:
-        print(f"Setting folder to: {data['folder']} (type: {type(data['folder'])})")
-        conversation.folder = data['folder']
-    
-    conversation.last_updated = datetime.utcnow()
-    db.session.commit()
+    space_id = _space_of(conversation_id)
+    new_space_id = _folder_space(data['folder']) if 'folder' in data else space_id
+    if new_space_id != space_id:
+        # Copy into the other space's database with the new values and delete here, in one transaction
+        changes = {column: data[column] for column in ('title', 'folder') if column in data}
+        changes['last_updated'] = datetime.utcnow()
+        if not _shards().move(conversation_id, space_id, new_space_id, changes):
+            return jsonify({'error': 'Conversation not found'}), 404
+        conversation = _read_in(new_space_id, _conversation_dict, conversation_id)
+    else:
+        conversation = _write_in(space_id, _update_conversation, conversation_id, data)
+    if not conversation:
+        return jsonify({'error': 'Conversation not found'}), 404
+    _index_conversation(conversation)
     
-    print(f"Conversation updated. New folder value: {conversation.folder}")
-    return jsonify(conversation.to_dict())
+    print(f"Conversation updated. New folder value: {conversation['folder']}")
+    return jsonify(conversation)
 
 @api.route('/conversations/<conversation_id>', methods=['DELETE'])
 def delete_conversation(conversation_id):
-    conversation = Conversation.query.get(conversation_id)
-    if not conversation:
+    space_id = _space_of(conversation_id)
+    deleted = _write_in(space_id, _delete_conversation, conversation_id)
+    if not deleted:
         return jsonify({'error': 'Conversation not found'}), 404
-    
-    db.session.delete(conversation)
-    db.session.commit()
+    if space_id is not None:
+        _write(_forget_rows, db.session, deleted)
+    current_app.extensions['suggest'].discard(conversation_id)
     
     return jsonify({'message': 'Conversation deleted successfully'})
 
 # Message routes
 @api.route('/conversations/<conversation_id>/messages', methods=['POST'])
 def add_message(conversation_id):
-    conversation = Conversation.query.get(conversation_id)
-    if not conversation:
-        return jsonify({'error': 'Conversation not found'}), 404
-    
     data = request.get_json()
     role = data.get('role')
     content = data.get('content')
@@ -94,42 +134,435 @@ def add_message(conversation_id):
     if role not in ['user', 'assistant']:
         return jsonify({'error': 'Role must be "user" or "assistant"'}), 400
     
+    space_id = _space_of(conversation_id)
+    attachment_ids = data.get('attachment_ids') or []
+    if attachment_ids:
+        # Uploads wait in the main database until they are sent
+        unlinked = Attachment.query.filter(Attachment.id.in_(attachment_ids), Attachment.message_id.is_(None)).count()
+        if unlinked != len(set(attachment_ids)):
+            return jsonify({'error': 'Unknown or already attached attachment ids'}), 400
+        if space_id is not None:
+            _shards().adopt_attachments(attachment_ids, space_id)
+    
+    message_id = str(uuid.uuid4())
+    result = _write_located(space_id, [message_id], _add_message, conversation_id, message_id, role, content, attachment_ids)
+    if not result:
+        return jsonify({'error': 'Conversation not found'}), 404
+    message, conversation = result
+    _index_conversation(conversation)
+    if message['attachments'] and current_app.config['INGEST_AUTO']:
+        current_app.extensions['ingestion'].submit(message['attachments'])
+    
+    return jsonify(message), 201
+
+@api.route('/messages/<message_id>', methods=['PUT'])
+def update_message(message_id):
+    data = request.get_json()
+    message = _write_in(_space_of(message_id), _update_message, message_id, data)
+    if not message:
+        return jsonify({'error': 'Message not found'}), 404
+    
+    return jsonify(message)
+
+@api.route('/messages/<message_id>', methods=['DELETE'])
+def delete_message(message_id):
+    space_id = _space_of(message_id)
+    deleted = _write_in(space_id, _delete_message, message_id)
+    if not deleted:
+        return jsonify({'error': 'Message not found'}), 404
+    if space_id is not None:
+        _write(_forget_rows, db.session, deleted)
+    
+    return jsonify({'message': 'Message deleted successfully'})
+
+# Conversation and message mutations. They run on the group-commit writer
+# thread when the write queue is enabled, so they return plain dicts rather
+# than objects bound to the writer's session. Each takes the session of the
+# database it changes: with per-space databases (see sharding.py) that is the
+# database of the conversation's space.
+def _write(fn, *args):
+    return write(current_app, db, fn, *args)
+
+def _shards():
+    return current_app.extensions.get('shards')
+
+def _write_in(space_id, fn, *args):
+    """
+    Run fn(session, *args) against the database of a space (None: the main
+    database) and commit. A space's writes go through its own group-commit
+    writer when the write queue is enabled (see sharding.py).
+    """
+    shards = _shards()
+    if shards is None or space_id is None:
+        return _write(fn, db.session, *args)
+    return shards.write(space_id, fn, *args)
+
+def _write_located(space_id, row_ids, fn, *args):
+    """
+    _write_in for new rows: records row_ids in the catalog first so nothing
+    lists a row that can't be found, and removes them again if the write
+    fails or finds nothing to write to.
+    """
+    if space_id is None:
+        return _write_in(None, fn, *args)
+    _write(_locate_rows, db.session, row_ids, space_id)
+    try:
+        result = _write_in(space_id, fn, *args)
+    except Exception:
+        _write(_forget_rows, db.session, row_ids)
+        raise
+    if not result:
+        _write(_forget_rows, db.session, row_ids)
+    return result
+
+def _read_in(space_id, fn, *args):
+    shards = _shards()
+    if shards is None or space_id is None:
+        return fn(db.session, *args)
+    return shards.read(space_id, fn, *args)
+
+def _read_everywhere(fn, *args):
+    """fn(session, *args) on the main database and every space database (in parallel), as a list"""
+    results = [fn(db.session, *args)]
+    shards = _shards()
+    if shards is not None:
+        results.extend(shards.fan_out(fn, *args).values())
+    return results
+
+def _write_everywhere(fn, *args):
+    results = [_write(fn, db.session, *args)]
+    shards = _shards()
+    if shards is not None:
+        results.extend(shards.fan_out(fn, *args, commit=True).values())
+    return results
+
+def _space_of(row_id):
+    """Space whose database holds a conversation, message or attachment; None for the main database"""
+    if _shards() is None:
+        return None
+    return db.session.query(SpaceLocation.space_id).filter_by(row_id=row_id).scalar()
+
+def _folder_space(folder):
+    """Space database for conversations filed under folder; None (the main database) for folders that aren't spaces"""
+    if _shards() is None or not folder or not db.session.get(Space, folder):
+        return None
+    return folder
+
+def _index_conversation(conversation):
+    current_app.extensions['suggest'].put(
+        conversation['id'], conversation['title'], datetime.fromisoformat(conversation['last_updated'])
+    )
+
+def _get_row(session, model, row_id):
+    return session.get(model, row_id)
+
+def _get_conversation_with_messages(session, conversation_id):
+    conversation = session.get(Conversation, conversation_id)
+    return conversation.to_dict_with_messages() if conversation else None
+
+def _locate_rows(session, row_ids, space_id):
+    for row_id in row_ids:
+        session.merge(SpaceLocation(row_id=row_id, space_id=space_id))
+
+def _forget_rows(session, row_ids):
+    session.query(SpaceLocation).filter(SpaceLocation.row_id.in_(row_ids)).delete(synchronize_session=False)
+
+def _create_conversation(session, conversation_id, title, folder):
+    conversation = Conversation(
+        id=conversation_id,
+        title=title,
+        folder=folder
+    )
+    session.add(conversation)
+    session.flush()
+    return conversation.to_dict()
+
+def _conversation_dict(session, conversation_id):
+    conversation = session.get(Conversation, conversation_id)
+    return conversation.to_dict() if conversation else None
+
+def _update_conversation(session, conversation_id, data):
+    conversation = session.get(Conversation, conversation_id)
+    if not conversation:
+        return None
+    
+    if 'title' in data:
+        conversation.title = data['title']
+    if 'folder' in data:
+        print(f"Setting folder to: {data['folder']} (type: {type(data['folder'])})")
+        conversation.folder = data['folder']
+    
+    conversation.last_updated = datetime.utcnow()
+    return conversation.to_dict()
+
+def _delete_row(session, model, row_id):
+    row = session.get(model, row_id)
+    if not row:
+        return False
+    session.delete(row)
+    return True
+
+def _delete_conversation(session, conversation_id):
+    """Delete a conversation with its messages and attachments; returns all their ids, or None if not found"""
+    conversation = session.get(Conversation, conversation_id)
+    if not conversation:
+        return None
+    deleted = [conversation.id]
+    for message in conversation.messages:
+        deleted += [message.id] + [attachment.id for attachment in message.attachments]
+    session.delete(conversation)
+    return deleted
+
+def _delete_message(session, message_id):
+    """Delete a message with its attachments; returns their ids, or None if not found"""
+    message = session.get(Message, message_id)
+    if not message:
+        return None
+    deleted = [message.id] + [attachment.id for attachment in message.attachments]
+    session.delete(message)
+    return deleted
+
+def _add_message(session, conversation_id, message_id, role, content, attachment_ids=()):
+    conversation = session.get(Conversation, conversation_id)
+    if not conversation:
+        return None
+    
     message = Message(
+        id=message_id,
         conversation_id=conversation_id,
         role=role,
         content=content
     )
+    if attachment_ids:
+        message.attachments = session.query(Attachment).filter(
+            Attachment.id.in_(attachment_ids), Attachment.message_id.is_(None)
+        ).all()
     
-    db.session.add(message)
+    session.add(message)
     conversation.last_updated = datetime.utcnow()
-    db.session.commit()
-    
-    return jsonify(message.to_dict()), 201
+    session.flush()
+    return message.to_dict(), {
+        'id': conversation.id,
+        'title': conversation.title,
+        'last_updated': conversation.last_updated.isoformat()
+    }
 
-@api.route('/messages/<message_id>', methods=['PUT'])
-def update_message(message_id):
-    message = Message.query.get(message_id)
+def _update_message(session, message_id, data):
+    message = session.get(Message, message_id)
     if not message:
-        return jsonify({'error': 'Message not found'}), 404
+        return None
     
-    data = request.get_json()
     if 'content' in data:
         message.content = data['content']
+    return message.to_dict()
+
+def _create_attachment(session, sha256, filename, content_type, size):
+    attachment = Attachment(
+        sha256=sha256,
+        filename=filename,
+        content_type=content_type,
+        size=size
+    )
+    session.add(attachment)
+    session.flush()
+    return attachment.to_dict()
+
+def _delete_unsent_attachments(session, cutoff):
+    return session.query(Attachment).filter(
+        Attachment.message_id.is_(None), Attachment.created_at < cutoff
+    ).delete(synchronize_session=False)
+
+def _delete_unreferenced_documents(session, referenced):
+    documents = session.query(Document).filter(Document.sha256.notin_(referenced)).all()
+    for document in documents:
+        session.delete(document)
+    return [document.sha256 for document in documents]
+
+def _referenced_blobs(session):
+    return {sha256 for (sha256,) in session.query(Attachment.sha256).distinct()}
+
+# Attachment routes
+def _collect_attachment_garbage():
+    """Drop attachments that were uploaded but never sent, then blobs and chunks nothing points to"""
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config['ATTACHMENT_UNSENT_HOURS'])
+    attachments_removed = sum(_write_everywhere(_delete_unsent_attachments, cutoff))
+    referenced = set().union(*_read_everywhere(_referenced_blobs))
+    report = current_app.extensions['attachments'].collect(referenced)
+    report['attachments_removed'] = attachments_removed
+    documents_removed = _write(_delete_unreferenced_documents, db.session, list(referenced))
+    for sha256 in documents_removed:
+        current_app.extensions['retrieval'].invalidate(sha256)
+    report['documents_removed'] = len(documents_removed)
+    return report
+
+@api.route('/attachments', methods=['POST'])
+def upload_attachment():
+    """
+    Upload a file, either as the raw request body (name in ?filename=) or
+    as the "file" field of a multipart form. Link it to a message by passing
+    its id in attachment_ids when adding the message.
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'Expected a "file" field'}), 400
+        stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream = request.stream
+        filename = request.args.get('filename')
+        content_type = request.mimetype
     
-    db.session.commit()
+    filename = os.path.basename(filename or '')[:255]
+    if not filename:
+        return jsonify({'error': 'filename is required'}), 400
+    if not content_type or content_type == 'application/octet-stream':
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    
+    store = current_app.extensions['attachments']
+    try:
+        sha256, size, temp_path = store.receive(stream)
+    except AttachmentTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    if size == 0:
+        os.unlink(temp_path)
+        return jsonify({'error': 'Attachment is empty'}), 400
+    
+    try:
+        store.store(temp_path, sha256, size, collect_garbage=_collect_attachment_garbage)
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e)}), 507
     
-    return jsonify(message.to_dict())
+    return jsonify(_write(_create_attachment, db.session, sha256, filename, content_type, size)), 201
 
-@api.route('/messages/<message_id>', methods=['DELETE'])
-def delete_message(message_id):
-    message = Message.query.get(message_id)
-    if not message:
-        return jsonify({'error': 'Message not found'}), 404
+@api.route('/attachments/<attachment_id>', methods=['GET'])
+def download_attachment(attachment_id):
+    attachment = _read_in(_space_of(attachment_id), _get_row, Attachment, attachment_id)
+    if not attachment:
+        return jsonify({'error': 'Attachment not found'}), 404
     
-    db.session.delete(message)
-    db.session.commit()
+    path = current_app.extensions['attachments'].blob_path(attachment.sha256)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Attachment data is missing'}), 404
     
-    return jsonify({'message': 'Message deleted successfully'})
+    # send_file answers Range and If-None-Match/If-Modified-Since requests and
+    # hands the file to the server's wsgi.file_wrapper (sendfile where supported)
+    response = send_file(
+        path,
+        mimetype=attachment.content_type,
+        as_attachment=not is_inline(attachment.content_type),
+        download_name=attachment.filename,
+        conditional=True,
+        etag=attachment.sha256,
+        last_modified=attachment.created_at,
+        max_age=current_app.config['ATTACHMENT_CACHE_MAX_AGE']
+    )
+    response.cache_control.immutable = True  # The content behind an id never changes
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+@api.route('/attachments/<attachment_id>', methods=['DELETE'])
+def delete_attachment(attachment_id):
+    space_id = _space_of(attachment_id)
+    if not _write_in(space_id, _delete_row, Attachment, attachment_id):
+        return jsonify({'error': 'Attachment not found'}), 404
+    if space_id is not None:
+        _write(_forget_rows, db.session, [attachment_id])
+    
+    return jsonify({'message': 'Attachment deleted successfully'})
+
+@api.route('/attachments/stats', methods=['GET'])
+def get_attachment_stats():
+    store = current_app.extensions['attachments']
+    counts = _read_everywhere(_count_attachments)
+    return jsonify({
+        **store.report(),
+        'attachments': sum(total for total, _ in counts),
+        'unsent': sum(unsent for _, unsent in counts)
+    })
+
+def _count_attachments(session):
+    return (
+        session.query(Attachment).count(),
+        session.query(Attachment).filter(Attachment.message_id.is_(None)).count()
+    )
+
+@api.route('/attachments/gc', methods=['POST'])
+def collect_attachment_garbage():
+    return jsonify(_collect_attachment_garbage())
+
+# Document ingestion and retrieval routes
+@api.route('/ingest', methods=['POST'])
+def start_ingestion():
+    """Chunk attachments for retrieval, by attachment_ids or all of a conversation_id's; returns the job"""
+    data = request.get_json() or {}
+    attachment_ids = data.get('attachment_ids') or []
+    conversation_id = data.get('conversation_id')
+    if attachment_ids:
+        attachments = [a for found in _read_everywhere(_attachments_by_id, attachment_ids) for a in found]
+        if len(attachments) != len(set(attachment_ids)):
+            return jsonify({'error': 'Unknown attachment ids'}), 400
+    elif conversation_id:
+        attachments = _read_in(_space_of(conversation_id), _conversation_attachments, conversation_id)
+        if attachments is None:
+            return jsonify({'error': 'Conversation not found'}), 404
+    else:
+        return jsonify({'error': 'attachment_ids or conversation_id is required'}), 400
+    
+    job = current_app.extensions['ingestion'].submit(attachments)
+    return jsonify(job.describe()), 202
+
+@api.route('/ingest', methods=['GET'])
+def get_ingestion_jobs():
+    manager = current_app.extensions['ingestion']
+    jobs = sorted(manager.jobs.values(), key=lambda job: job.created_at, reverse=True)
+    return jsonify({
+        'workers': manager.workers,
+        'jobs': [job.describe() for job in jobs],
+        'documents': dict(db.session.query(Document.status, db.func.count()).group_by(Document.status).all())
+    })
+
+@api.route('/ingest/<job_id>', methods=['GET'])
+def get_ingestion_job(job_id):
+    job = current_app.extensions['ingestion'].jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.describe())
+
+def _attachments_by_id(session, attachment_ids):
+    return [a.to_dict() for a in session.query(Attachment).filter(Attachment.id.in_(attachment_ids))]
+
+def _conversation_attachments(session, conversation_id):
+    """Attachment dicts of a conversation's messages, or None if there is no such conversation"""
+    if not session.get(Conversation, conversation_id):
+        return None
+    attachments = session.query(Attachment).join(Message).filter(Message.conversation_id == conversation_id)
+    return [attachment.to_dict() for attachment in attachments]
+
+@api.route('/conversations/<conversation_id>/context', methods=['GET'])
+def get_conversation_context(conversation_id):
+    """Top chunks of the conversation's attachments for a prompt (?q=), for the model's context"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    
+    limit = min(request.args.get('k', 5, type=int), current_app.config['RETRIEVAL_MAX_RESULTS'])
+    started = time.perf_counter()
+    attachments = _read_in(_space_of(conversation_id), _conversation_attachments, conversation_id)
+    if attachments is None:
+        return jsonify({'error': 'Conversation not found'}), 404
+    filenames = {}
+    for attachment in attachments:
+        filenames.setdefault(attachment['sha256'], attachment['filename'])
+    chunks = current_app.extensions['retrieval'].search(filenames, query, limit)
+    for chunk in chunks:
+        chunk['filename'] = filenames[chunk['sha256']]
+    
+    return jsonify({
+        'query': query,
+        'chunks': chunks,
+        'took_ms': round((time.perf_counter() - started) * 1000, 3)
+    })
 
 # Plugin routes
 @api.route('/plugins', methods=['GET'])
@@ -187,6 +620,79 @@ def delete_plugin(plugin_id):
     
     return jsonify({'message': 'Plugin deleted successfully'})
 
+def _find_enabled_plugin(key):
+    plugin = Plugin.query.filter((Plugin.id == key) | (Plugin.name == key)).first()
+    if not plugin:
+        return None, 'Plugin not found'
+    if not plugin.enabled:
+        return None, 'Plugin is disabled'
+    return plugin, None
+
+@api.route('/plugins/<plugin_id>/call', methods=['POST'])
+def call_plugin(plugin_id):
+    plugin, error = _find_enabled_plugin(plugin_id)
+    if not plugin:
+        return jsonify({'error': error}), 404 if error == 'Plugin not found' else 409
+    
+    data = request.get_json(silent=True) or {}
+    if not data.get('tool'):
+        return jsonify({'error': 'Tool name is required'}), 400
+    if not isinstance(data.get('args') or {}, dict):
+        return jsonify({'error': 'Tool arguments must be an object'}), 400
+    
+    runtime = current_app.extensions['plugins']
+    started = time.perf_counter()
+    try:
+        result = runtime.call(plugin.name, data['tool'], data.get('args'))
+    except PluginTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    except PluginError as e:
+        return jsonify({'error': str(e)}), 502
+    
+    return jsonify({
+        'result': result,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3)
+    })
+
+@api.route('/plugins/calls', methods=['POST'])
+def call_plugins():
+    """Run the independent tool calls of one assistant turn concurrently"""
+    data = request.get_json(silent=True) or {}
+    calls = data.get('calls')
+    if not isinstance(calls, list) or not calls:
+        return jsonify({'error': 'Expected a list of calls'}), 400
+    if len(calls) > current_app.config['PLUGIN_MAX_CALLS_PER_TURN']:
+        return jsonify({'error': f"At most {current_app.config['PLUGIN_MAX_CALLS_PER_TURN']} calls per request"}), 400
+    
+    results = [None] * len(calls)
+    runnable = []
+    for i, call in enumerate(calls):
+        if not isinstance(call, dict) or not call.get('plugin') or not call.get('tool'):
+            results[i] = {'ok': False, 'error': 'Each call needs a plugin and a tool'}
+            continue
+        if not isinstance(call.get('args') or {}, dict):
+            results[i] = {'ok': False, 'error': 'Tool arguments must be an object'}
+            continue
+        plugin, error = _find_enabled_plugin(call['plugin'])
+        if not plugin:
+            results[i] = {'ok': False, 'error': error}
+            continue
+        runnable.append((i, {'plugin': plugin.name, 'tool': call['tool'], 'args': call.get('args')}))
+    
+    runtime = current_app.extensions['plugins']
+    started = time.perf_counter()
+    for (i, _), result in zip(runnable, runtime.call_many([call for _, call in runnable])):
+        results[i] = result
+    
+    return jsonify({
+        'results': results,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3)
+    })
+
+@api.route('/plugins/stats', methods=['GET'])
+def get_plugin_stats():
+    return jsonify(current_app.extensions['plugins'].stats())
+
 # Search routes
 @api.route('/search', methods=['GET'])
 def search_conversations():
@@ -194,16 +700,29 @@ def search_conversations():
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
     
+    # Search every database in parallel when spaces have their own
+    conversations = [conv for results in _read_everywhere(_search, query) for conv in results]
+    
+    # Sort by relevance (conversations with more matches first)
+    conversations.sort(key=lambda x: x['match_count'], reverse=True)
+    
+    return jsonify({
+        'query': query,
+        'results': conversations,
+        'total_results': len(conversations)
+    })
+
+def _search(session, query):
     # Search in conversations (title and messages)
     conversations = []
     
     # Search by conversation title
-    title_matches = Conversation.query.filter(
+    title_matches = session.query(Conversation).filter(
         Conversation.title.ilike(f'%{query}%')
     ).all()
     
     # Search by message content
-    message_matches = Message.query.filter(
+    message_matches = session.query(Message).filter(
         Message.content.ilike(f'%{query}%')
     ).all()
     
@@ -212,7 +731,7 @@ def search_conversations():
     for message in message_matches:
         conversation_ids.add(message.conversation_id)
     
-    content_matches = Conversation.query.filter(
+    content_matches = session.query(Conversation).filter(
         Conversation.id.in_(conversation_ids)
     ).all()
     
@@ -255,14 +774,24 @@ def search_conversations():
         conv_data['match_count'] = len(matching_messages)
         conversations.append(conv_data)
     
-    # Sort by relevance (conversations with more matches first)
-    conversations.sort(key=lambda x: x['match_count'], reverse=True)
+    return conversations
+
+@api.route('/search/suggest', methods=['GET'])
+def suggest_titles():
+    """Title autocomplete from the in-memory index: no database access once it is loaded"""
+    prefix = request.args.get('prefix', '').strip()
+    if not prefix:
+        return jsonify({'error': 'prefix is required'}), 400
     
-    return jsonify({
-        'query': query,
-        'results': conversations,
-        'total_results': len(conversations)
-    })
+    index = current_app.extensions['suggest']
+    if not index.loaded:
+        index.load(lambda: [row for rows in _read_everywhere(_conversation_titles) for row in rows])
+    
+    suggestions = index.suggest(prefix, request.args.get('limit', 8, type=int))
+    return jsonify({'prefix': prefix, **suggestions})
+
+def _conversation_titles(session):
+    return session.query(Conversation.id, Conversation.title, Conversation.last_updated).all()
 
 # Space routes
 @api.route('/spaces', methods=['GET'])
@@ -316,20 +845,200 @@ def delete_space(space_id):
         return jsonify({'error': 'Space not found'}), 404
     
     # Check if any conversations are using this space
-    conversations_using_space = Conversation.query.filter_by(folder=space_id).count()
+    shards = _shards()
+    conversations_using_space = _count_in_folder(db.session, space_id)
+    if shards is not None:
+        conversations_using_space += shards.read(space_id, _count_in_folder, space_id)
     if conversations_using_space > 0:
         return jsonify({'error': f'Cannot delete space. {conversations_using_space} conversation(s) are using this space.'}), 400
     
     db.session.delete(space)
     db.session.commit()
+    if shards is not None:
+        shards.drop(space_id)
     
     return jsonify({'message': 'Space deleted successfully'})
 
+def _count_in_folder(session, folder):
+    return session.query(Conversation).filter_by(folder=folder).count()
+
+# Per-space databases
+def _space_shards(space_id):
+    """(shards, error response) for routes that manage one space's database"""
+    shards = _shards()
+    if shards is None:
+        return None, (jsonify({'error': 'Per-space databases are not enabled'}), 404)
+    if not Space.query.get(space_id):
+        return None, (jsonify({'error': 'Space not found'}), 404)
+    return shards, None
+
+@api.route('/spaces/storage', methods=['GET'])
+def get_space_storage():
+    shards = _shards()
+    if shards is None:
+        return jsonify({'error': 'Per-space databases are not enabled'}), 404
+    
+    return jsonify(shards.report())
+
+@api.route('/spaces/<space_id>/backup', methods=['POST'])
+def backup_space(space_id):
+    shards, error = _space_shards(space_id)
+    if error:
+        return error
+    
+    config = current_app.config
+    try:
+        report = shards.backup(
+            space_id,
+            os.path.join(current_app.instance_path, config['BACKUP_DIR'], 'spaces'),
+            pages_per_step=config['BACKUP_PAGES_PER_STEP'],
+            step_sleep=config['BACKUP_STEP_SLEEP_MS'] / 1000.0,
+            keep=config['BACKUP_KEEP'],
+            compress=config['BACKUP_COMPRESS'],
+            max_restarts=config['BACKUP_MAX_RESTARTS']
+        )
+    except Exception as e:
+        return jsonify({'error': f'Backup failed: {str(e)}'}), 500
+    
+    return jsonify(report), 201
+
+@api.route('/spaces/<space_id>/maintenance', methods=['POST'])
+def maintain_space(space_id):
+    shards, error = _space_shards(space_id)
+    if error:
+        return error
+    
+    config = current_app.config
+    return jsonify(shards.maintain(
+        space_id,
+        slice_seconds=config['MAINTENANCE_SLICE_MS'] / 1000.0,
+        vacuum_pages_per_step=config['MAINTENANCE_VACUUM_PAGES']
+    ))
+
 # Health check
 @api.route('/health', methods=['GET'])
 def health_check():
+    # Ping the database so slow or locked storage shows up here
+    db_status = 'ok'
+    ping_started = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+    except Exception as e:
+        db_status = f'error: {str(e)}'
+    db_ping_ms = (time.perf_counter() - ping_started) * 1000
+    
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if db_status == 'ok' else 'degraded',
         'message': 'Qlippy API is running',
-        'timestamp': datetime.utcnow().isoformat()
-    }) 
\ No newline at end of file
+        'timestamp': datetime.utcnow().isoformat(),
+        'database': {
+            'status': db_status,
+            'ping_ms': round(db_ping_ms, 3)
+        }
+    })
+
+# Metrics
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    metrics = current_app.extensions['metrics']
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/metrics/slow-queries', methods=['GET'])
+def get_slow_queries():
+    metrics = current_app.extensions['metrics']
+    return jsonify({
+        'threshold_ms': metrics.slow_query_threshold * 1000,
+        'queries': list(metrics.slow_queries)
+    }) 
+
+# Database maintenance
+@api.route('/maintenance', methods=['GET'])
+def get_maintenance_stats():
+    scheduler = current_app.extensions.get('maintenance')
+    if not scheduler:
+        return jsonify({'error': 'Database maintenance is not enabled'}), 404
+    
+    return jsonify(scheduler.report())
+
+@api.route('/maintenance/run', methods=['POST'])
+def run_maintenance():
+    scheduler = current_app.extensions.get('maintenance')
+    if not scheduler:
+        return jsonify({'error': 'Database maintenance is not enabled'}), 404
+    
+    scheduler.run_due_tasks(force=True)
+    return jsonify(scheduler.report())
+
+# Group-commit writer
+@api.route('/write-queue', methods=['GET'])
+def get_write_queue_stats():
+    writer = current_app.extensions.get('write_queue')
+    if not writer:
+        return jsonify({'error': 'The write queue is not enabled'}), 404
+    
+    return jsonify(writer.report())
+
+# Backups
+@api.route('/backups', methods=['GET'])
+def get_backups():
+    scheduler = current_app.extensions.get('backup')
+    if not scheduler:
+        return jsonify({'error': 'Backups are not available for this database'}), 404
+    
+    return jsonify(scheduler.status())
+
+@api.route('/backups', methods=['POST'])
+def create_backup():
+    scheduler = current_app.extensions.get('backup')
+    if not scheduler:
+        return jsonify({'error': 'Backups are not available for this database'}), 404
+    
+    try:
+        report = scheduler.run()
+    except Exception as e:
+        return jsonify({'error': f'Backup failed: {str(e)}'}), 500
+    
+    return jsonify(report), 201
+
+# Voice-turn tracing
+@api.route('/traces', methods=['POST'])
+def add_trace_spans():
+    data = request.get_json(silent=True)
+    spans = data.get('spans') if isinstance(data, dict) else data
+    if not isinstance(spans, list) or not spans:
+        return jsonify({'error': 'Expected a list of spans'}), 400
+    
+    try:
+        spans = [parse_span(span) for span in spans]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    current_app.extensions['tracing'].add(spans)
+    return jsonify({'accepted': len(spans)}), 202
+
+@api.route('/traces', methods=['GET'])
+def get_traces():
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    return jsonify(current_app.extensions['tracing'].recent(limit))
+
+@api.route('/traces/stats', methods=['GET'])
+def get_trace_stats():
+    collector = current_app.extensions['tracing']
+    return jsonify({
+        'spans_received': collector.spans_received,
+        'stages': collector.stage_stats()
+    })
+
+@api.route('/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    collector = current_app.extensions['tracing']
+    if request.args.get('format') == 'text':
+        waterfall = collector.render_waterfall(trace_id)
+        if waterfall is None:
+            return jsonify({'error': 'Trace not found'}), 404
+        return Response(waterfall, mimetype='text/plain')
+    
+    waterfall = collector.waterfall(trace_id)
+    if waterfall is None:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify(waterfall)
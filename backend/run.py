@@ -2,10 +2,13 @@
 """
 Qlippy Backend Server
 Run this script to start the Flask backend server.
+Set QLIPPY_RELOAD=false to run without the auto-reloader (one process, one app).
 """
 
 import os
 import sys
+import time
+from werkzeug.serving import is_running_from_reloader
 from app import create_app
 
 def main():
@@ -13,16 +16,20 @@ def main():
     os.environ.setdefault('FLASK_ENV', 'development')
     
     # Create and run the app
+    started = time.perf_counter()
     app = create_app()
     
-    print("🚀 Starting Qlippy Backend Server...")
-    print("📍 Server will be available at: http://localhost:5000")
-    print("🔗 API endpoints available at: http://localhost:5000/api")
-    print("💾 Database: SQLite (qlippy.db)")
-    print("📊 Health check: http://localhost:5000/api/health")
-    print("\nPress Ctrl+C to stop the server\n")
+    # The reloader's watcher process re-runs this script, so only announce once
+    if not is_running_from_reloader():
+        print("🚀 Starting Qlippy Backend Server...")
+        print("📍 Server will be available at: http://localhost:5001")
+        print("🔗 API endpoints available at: http://localhost:5001/api")
+        print("💾 Database: SQLite (qlippy.db)")
+        print("📊 Health check: http://localhost:5001/api/health")
+        print(f"⏱️  App created in {(time.perf_counter() - started) * 1000:.0f} ms")
+        print("\nPress Ctrl+C to stop the server\n")
     
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    app.run(debug=True, host='0.0.0.0', port=5001, use_reloader=app.config['USE_RELOADER'])
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main() 
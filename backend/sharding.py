@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Per-space databases for the Qlippy backend.
+With SPACE_SHARDING_ENABLED, the conversations, messages and attachments of
+each space live in their own SQLite file (instance/spaces/<space id>.db),
+so a big space doesn't slow down queries on a small one and each space can
+be backed up and vacuumed on its own. The main database is the catalog: it
+keeps spaces, plugins, documents, uploads not sent yet, conversations
+without a space or filed under a folder that isn't a space, and
+space_locations, which maps the id of each conversation, message and
+attachment stored in a space file to its space.
+
+With the write queue enabled, every space database gets its own
+group-commit writer (see write_queue.py), so each file still has a single
+writer.
+
+Listing across spaces ATTACHes the databases to one connection per batch of
+attach_limit (SQLite allows 10 by default) and merges the batches. Other
+cross-space reads fan out to every space in parallel. Moving rows between
+databases copies and deletes them in one transaction over the attached
+files; the files keep SQLite's rollback journal, under which a transaction
+spanning attached databases commits atomically.
+
+Run directly to move the conversations already filed under a space out of
+the main database (stop the server first):
+    python sharding.py --split
+"""
+
+import heapq
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+from backup import backup_database
+from maintenance import MaintenanceScheduler, enable_incremental_auto_vacuum, sqlite_database_path
+from models import db
+from write_queue import WriteQueue
+
+logger = logging.getLogger(__name__)
+
+SHARDED_TABLES = ('conversations', 'messages', 'attachments')
+_SPACE_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# One SELECT per attached database, joined with UNION ALL
+_LIST_SQL = """
+    SELECT c.id, c.title, c.folder, c.last_updated AS last_updated, c.created_at,
+           (SELECT count(*) FROM {schema}.messages m WHERE m.conversation_id = c.id),
+           (SELECT m.content FROM {schema}.messages m WHERE m.conversation_id = c.id
+            ORDER BY m.timestamp DESC LIMIT 1)
+    FROM {schema}.conversations c {where}
+"""
+
+
+def _columns(table):
+    return ', '.join(db.metadata.tables[table].columns.keys())
+
+
+def _sql_value(value):
+    # SQLAlchemy's storage format for DateTime columns on SQLite, so moved rows sort with the rest
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f') if isinstance(value, datetime) else value
+
+
+class SpaceShards:
+    def __init__(self, catalog_path, directory, attach_limit=10, workers=4, metrics=None, app=None, write_queue=None):
+        self.catalog_path = catalog_path
+        self.directory = directory
+        self.attach_limit = max(1, attach_limit)
+        self.metrics = metrics
+        self.app = app
+        self.write_queue = write_queue  # WriteQueue options for per-space writers, or None to commit directly
+        self._engines = {}
+        self._writers = {}  # space id -> (scoped session, WriteQueue)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='space-db')
+        self.stats = {'moves': 0, 'fan_outs': 0, 'attached_queries': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, space_id):
+        """File of a space's database; None is the catalog"""
+        if space_id is None:
+            return self.catalog_path
+        if not _SPACE_ID.match(space_id):
+            raise ValueError(f'Invalid space id: {space_id!r}')
+        return os.path.join(self.directory, f'{space_id}.db')
+
+    def spaces(self):
+        """Ids of the spaces that have a database file"""
+        return sorted(name[:-3] for name in os.listdir(self.directory) if name.endswith('.db'))
+
+    def engine(self, space_id):
+        """Engine for a space's database, creating the file and its tables on first use"""
+        with self._lock:
+            engine = self._engines.get(space_id)
+            if engine is None:
+                engine = create_engine(f'sqlite:///{self.path(space_id)}')
+                enable_incremental_auto_vacuum(engine)
+                if self.metrics is not None:
+                    self.metrics.instrument(engine)
+                db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in SHARDED_TABLES])
+                self._engines[space_id] = engine
+            return engine
+
+    @contextmanager
+    def session(self, space_id):
+        session = Session(bind=self.engine(space_id))
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def read(self, space_id, fn, *args):
+        """Run fn(session, *args) against a space's database"""
+        with self.session(space_id) as session:
+            return fn(session, *args)
+
+    def _writer(self, space_id):
+        with self._lock:
+            writer = self._writers.get(space_id)
+        if writer is None:
+            session = scoped_session(sessionmaker(bind=self.engine(space_id)))
+            queue = WriteQueue(self.app, SimpleNamespace(session=session), **self.write_queue)
+            with self._lock:
+                writer = self._writers.setdefault(space_id, (session, queue))
+            if writer[1] is queue:
+                queue.start()
+        return writer
+
+    def write(self, space_id, fn, *args):
+        """
+        Run fn(session, *args) against a space's database and commit; returns
+        its result. Goes through the space's group-commit writer when the
+        write queue is enabled.
+        """
+        if self.write_queue is not None:
+            session, writer = self._writer(space_id)
+            return writer.run(fn, session, *args)
+        with self.session(space_id) as session:
+            result = fn(session, *args)
+            session.commit()
+            return result
+
+    def fan_out(self, fn, *args, commit=False):
+        """Run fn(session, *args) on every space database in parallel; returns {space id: result}"""
+        run = self.write if commit else self.read
+        futures = {space_id: self._pool.submit(run, space_id, fn, *args) for space_id in self.spaces()}
+        with self._lock:
+            self.stats['fan_outs'] += 1
+        return {space_id: future.result() for space_id, future in futures.items()}
+
+    def list_conversations(self, space_ids=None, folder=None):
+        """
+        (id, title, folder, last_updated, created_at, message count, last
+        message) rows from the catalog and the given spaces (default all),
+        newest first; only those filed under folder if one is given.
+        """
+        paths = [self.catalog_path]
+        paths += [self.path(space_id) for space_id in (self.spaces() if space_ids is None else space_ids)]
+        paths = [path for path in paths if os.path.exists(path)]
+        batches = [paths[i:i + self.attach_limit] for i in range(0, len(paths), self.attach_limit)]
+        with self._lock:
+            self.stats['attached_queries'] += len(batches)
+        rows = list(self._pool.map(self._list_batch, batches, [folder] * len(batches)))
+        return list(heapq.merge(*rows, key=lambda row: row[3] or '', reverse=True))
+
+    def _list_batch(self, paths, folder=None):
+        where = '' if folder is None else 'WHERE c.folder = ?'
+        with closing(sqlite3.connect(':memory:')) as conn:
+            for i, path in enumerate(paths):
+                conn.execute(f'ATTACH DATABASE ? AS s{i}', (path,))
+            sql = ' UNION ALL '.join(_LIST_SQL.format(schema=f's{i}', where=where) for i in range(len(paths)))
+            params = [] if folder is None else [folder] * len(paths)
+            return conn.execute(sql + ' ORDER BY last_updated DESC', params).fetchall()
+
+    @contextmanager
+    def _transaction(self, source, target):
+        """
+        Connection to source's database with target's attached as "target"
+        and the catalog reachable as "catalog", in one write transaction
+        """
+        for space_id in (source, target):
+            if space_id is not None:
+                self.engine(space_id)  # Create the file and tables
+        with closing(sqlite3.connect(self.path(source), isolation_level=None, timeout=30)) as conn:
+            conn.execute('ATTACH DATABASE ? AS target', (self.path(target),))
+            if source is not None and target is not None:
+                conn.execute('ATTACH DATABASE ? AS catalog', (self.catalog_path,))
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def move(self, conversation_id, source, target, changes=None):
+        """
+        Move a conversation with its messages and attachments from source's
+        database to target's (None is the catalog), set the conversation
+        columns in changes (e.g. its new folder) and update their catalog
+        entries, all in one transaction. Returns False if source doesn't hold it.
+        """
+        if source == target:
+            return True
+        changes = changes or {}
+        unknown = set(changes) - set(db.metadata.tables['conversations'].columns.keys())
+        if unknown:
+            raise ValueError(f'Unknown conversation columns: {sorted(unknown)}')
+        catalog = 'main' if source is None else 'target' if target is None else 'catalog'
+        messages = 'SELECT id FROM main.messages WHERE conversation_id = ?'
+        rows = f'SELECT ? UNION ALL {messages} UNION ALL SELECT id FROM main.attachments WHERE message_id IN ({messages})'
+        with self._transaction(source, target) as conn:
+            if conn.execute('SELECT 1 FROM main.conversations WHERE id = ?', (conversation_id,)).fetchone() is None:
+                return False
+            conn.execute(f'DELETE FROM {catalog}.space_locations WHERE row_id IN ({rows})', (conversation_id,) * 3)
+            if target is not None:
+                conn.execute(
+                    f'INSERT INTO {catalog}.space_locations (row_id, space_id) SELECT ids.*, ? FROM ({rows}) ids',
+                    (target,) + (conversation_id,) * 3
+                )
+            for table, where in (('conversations', 'id = ?'),
+                                 ('messages', 'conversation_id = ?'),
+                                 ('attachments', f'message_id IN ({messages})')):
+                conn.execute(
+                    f'INSERT INTO target.{table} ({_columns(table)}) '
+                    f'SELECT {_columns(table)} FROM main.{table} WHERE {where}', (conversation_id,)
+                )
+            if changes:
+                assignments = ', '.join(f'{column} = ?' for column in changes)
+                conn.execute(
+                    f'UPDATE target.conversations SET {assignments} WHERE id = ?',
+                    [_sql_value(value) for value in changes.values()] + [conversation_id]
+                )
+            conn.execute(f'DELETE FROM main.attachments WHERE message_id IN ({messages})', (conversation_id,))
+            conn.execute('DELETE FROM main.messages WHERE conversation_id = ?', (conversation_id,))
+            conn.execute('DELETE FROM main.conversations WHERE id = ?', (conversation_id,))
+        with self._lock:
+            self.stats['moves'] += 1
+        return True
+
+    def adopt_attachments(self, attachment_ids, space_id):
+        """Move uploads not sent yet from the catalog into a space's database and record where they went, in one transaction"""
+        placeholders = ', '.join('?' * len(attachment_ids))
+        where = f'id IN ({placeholders}) AND message_id IS NULL'
+        with self._transaction(None, space_id) as conn:
+            conn.execute(
+                f'INSERT OR REPLACE INTO main.space_locations (row_id, space_id) '
+                f'SELECT id, ? FROM main.attachments WHERE {where}', [space_id, *attachment_ids]
+            )
+            conn.execute(
+                f'INSERT INTO target.attachments ({_columns("attachments")}) '
+                f'SELECT {_columns("attachments")} FROM main.attachments WHERE {where}', list(attachment_ids)
+            )
+            conn.execute(f'DELETE FROM main.attachments WHERE {where}', list(attachment_ids))
+
+    def drop(self, space_id):
+        """Delete a space's database file"""
+        with self._lock:
+            engine = self._engines.pop(space_id, None)
+            writer = self._writers.pop(space_id, None)
+        if writer is not None:
+            writer[1].stop()
+            writer[0].remove()
+        if engine is not None:
+            engine.dispose()
+        path = self.path(space_id)
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            try:
+                os.unlink(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def backup(self, space_id, backup_dir, **options):
+        """Online backup of one space's database into backup_dir/<space id>"""
+        return backup_database(self.path(space_id), os.path.join(backup_dir, space_id), **options)
+
+    def maintain(self, space_id, **options):
+        """Run every maintenance task (optimize, checkpoint, vacuum, integrity check) on one space now"""
+        scheduler = MaintenanceScheduler(self.engine(space_id), **options)
+        scheduler.run_due_tasks(force=True)
+        return scheduler.report()
+
+    def split_catalog(self):
+        """Move conversations filed under an existing space out of the catalog; returns how many moved"""
+        with closing(sqlite3.connect(self.catalog_path)) as conn:
+            rows = conn.execute(
+                'SELECT id, folder FROM conversations WHERE folder IN (SELECT id FROM spaces)'
+            ).fetchall()
+        return sum(self.move(conversation_id, None, space_id) for conversation_id, space_id in rows)
+
+    def report(self):
+        spaces = []
+        for space_id in self.spaces():
+            path = self.path(space_id)
+            spaces.append({'space_id': space_id, 'file_bytes': os.path.getsize(path)})
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            'catalog_bytes': os.path.getsize(self.catalog_path) if os.path.exists(self.catalog_path) else 0,
+            'attach_limit': self.attach_limit,
+            'spaces': spaces,
+            **stats
+        }
+
+
+def init_sharding(app, db):
+    """Set up per-space databases if SPACE_SHARDING_ENABLED is set"""
+    if not app.config['SPACE_SHARDING_ENABLED']:
+        return None
+    with app.app_context():
+        catalog_path = sqlite_database_path(db.engine)
+    if catalog_path is None:
+        logger.warning("Space sharding needs a file-backed SQLite database; storing every space in one database")
+        return None
+
+    # Writers start on their space's first write, so the reloader's watcher never starts one
+    write_queue = None
+    if app.config['WRITE_QUEUE_ENABLED']:
+        write_queue = {
+            'window_seconds': app.config['WRITE_QUEUE_WINDOW_MS'] / 1000.0,
+            'max_batch': app.config['WRITE_QUEUE_MAX_BATCH'],
+            'timeout': app.config['WRITE_QUEUE_TIMEOUT']
+        }
+
+    shards = SpaceShards(
+        catalog_path,
+        os.path.join(app.instance_path, app.config['SPACE_DB_DIR']),
+        attach_limit=app.config['SPACE_ATTACH_LIMIT'],
+        workers=app.config['SPACE_QUERY_WORKERS'],
+        metrics=app.extensions.get('metrics'),
+        app=app,
+        write_queue=write_queue
+    )
+    app.extensions['shards'] = shards
+    return shards
+
+
+if __name__ == '__main__':
+    if '--split' not in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+
+    from config import Config
+
+    db_path = 'instance/qlippy.db'
+    if not os.path.exists(db_path):
+        print(f"❌ Database file not found at {db_path}")
+        sys.exit(1)
+
+    print("🗂️  Moving conversations into per-space databases (stop the server first)...")
+    shards = SpaceShards(db_path, os.path.join('instance', Config.SPACE_DB_DIR))
+    print(f"✅ Moved {shards.split_catalog()} conversation(s) to {shards.directory}")
@@ -0,0 +1,278 @@
+"""
+Search-as-you-type suggestions for the Qlippy backend.
+An in-memory trie over the words of conversation titles. Every node keeps
+its most recent conversations and most frequent words, so a prefix lookup
+is a walk down the trie plus a slice, however many conversations match.
+The index is built from the database on first use and kept current by the
+conversation routes; their updates made while it is being built are replayed
+on top of it.
+"""
+
+import heapq
+import re
+import threading
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+class _Node:
+    __slots__ = ('children', 'word', 'ids', 'top', 'top_stale', 'terms', 'terms_stale')
+
+    def __init__(self):
+        self.children = {}
+        self.word = None
+        self.ids = set()  # Conversations whose title has this exact word
+        self.top = []  # Most recent conversation ids in the subtree, newest first
+        self.top_stale = False
+        self.terms = []  # Most frequent words in the subtree, most frequent first
+        self.terms_stale = False
+
+
+def _offer(ranked, item, score, cap):
+    """Put item at its place in a short list ranked by score; returns False if it doesn't make the cut"""
+    if item in ranked:
+        ranked.remove(item)
+    elif len(ranked) >= cap and score(item) <= score(ranked[-1]):
+        return False
+    value = score(item)
+    if not ranked or value >= score(ranked[0]):
+        i = 0  # The usual case: a conversation that was just updated
+    else:
+        i = 1
+        while i < len(ranked) and score(ranked[i]) >= value:
+            i += 1
+    ranked.insert(i, item)
+    del ranked[cap:]
+    return True
+
+
+class TitleIndex:
+    def __init__(self, max_results=20):
+        self.max_results = max_results
+        self.cap = max_results * 2  # Slack so a few deletions don't force a rebuild of the node
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # One load at a time; others wait for it
+        self._pending = None  # (method, args) of updates made while a load reads the database
+        self._root = _Node()
+        self._titles = {}  # conversation id -> (title, last_updated isoformat)
+        self._recency = {}  # conversation id -> last_updated timestamp
+        self._words = {}  # conversation id -> set of words
+
+    def __len__(self):
+        return len(self._titles)
+
+    # Trie maintenance (callers hold the lock)
+
+    def _path(self, word, create=False):
+        node, path = self._root, []
+        for char in word:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[char] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def _term_score(self, node):
+        return (len(node.ids), node.word)
+
+    def _insert(self, conversation_id):
+        recency = self._recency.__getitem__
+        for word in self._words[conversation_id]:
+            path = self._path(word, create=True)
+            terminal = path[-1]
+            terminal.word = word
+            terminal.ids.add(conversation_id)
+            for node in path:
+                _offer(node.top, conversation_id, recency, self.cap)
+                if not node.terms_stale:
+                    _offer(node.terms, terminal, self._term_score, self.cap)
+
+    def _remove(self, conversation_id):
+        for word in self._words.pop(conversation_id, ()):
+            path = self._path(word)
+            terminal = path[-1]
+            terminal.ids.discard(conversation_id)
+            for node in path:
+                if conversation_id in node.top:
+                    # A full list may have been hiding the next most recent conversation
+                    node.top_stale = node.top_stale or len(node.top) >= self.cap
+                    node.top.remove(conversation_id)
+                if terminal in node.terms:
+                    node.terms_stale = node.terms_stale or len(node.terms) >= self.cap
+                    node.terms.remove(terminal)
+                    if terminal.ids and not node.terms_stale:
+                        _offer(node.terms, terminal, self._term_score, self.cap)
+        self._titles.pop(conversation_id, None)
+        self._recency.pop(conversation_id, None)
+
+    def _refresh(self, node):
+        """
+        Rebuild a node's lists after deletions left them incomplete. The top
+        of a subtree is the top of its own conversations and its children's
+        lists, so only stale children are rebuilt first.
+        """
+        top_candidates = set(node.ids) if node.top_stale else None
+        term_candidates = ([node] if node.ids else []) if node.terms_stale else None
+        for child in node.children.values():
+            if child.top_stale or child.terms_stale:
+                self._refresh(child)
+            if top_candidates is not None:
+                top_candidates.update(child.top)
+            if term_candidates is not None:
+                term_candidates.extend(child.terms)
+        if top_candidates is not None:
+            node.top = heapq.nlargest(self.cap, top_candidates, key=self._recency.__getitem__)
+            node.top_stale = False
+        if term_candidates is not None:
+            node.terms = heapq.nlargest(self.cap, term_candidates, key=self._term_score)
+            node.terms_stale = False
+
+    # Updates from the conversation routes
+
+    def load(self, read_rows):
+        """
+        Build the index from the (id, title, last_updated) rows read_rows()
+        returns, unless another request already did. The rows are read outside
+        the lock, so updates made meanwhile are recorded and replayed on top:
+        an update is either in the rows or replayed, and replaying one that is
+        in them as well changes nothing.
+        """
+        with self._load_lock:
+            if self.loaded:
+                return
+            with self._lock:
+                self._pending = []
+            try:
+                rows = read_rows()
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                self._build(rows)
+                for method, args in self._pending:
+                    method(*args)
+                self._pending = None
+                self.loaded = True
+
+    def _build(self, rows):
+        # Callers hold the lock
+        self._root = _Node()
+        self._titles, self._recency, self._words = {}, {}, {}
+        for conversation_id, title, last_updated in rows:
+            self._titles[conversation_id] = (title, last_updated.isoformat())
+            self._recency[conversation_id] = last_updated.timestamp()
+            self._words[conversation_id] = set(tokenize(title))
+            for word in self._words[conversation_id]:
+                terminal = self._path(word, create=True)[-1]
+                terminal.word = word
+                terminal.ids.add(conversation_id)
+        # Fill every node's lists bottom-up in one pass
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            node.top_stale = node.terms_stale = True
+            stack.extend(node.children.values())
+        self._refresh(self._root)
+
+    def _set(self, conversation_id, title, last_updated):
+        self._titles[conversation_id] = (title, last_updated.isoformat())
+        self._recency[conversation_id] = last_updated.timestamp()
+        self._words[conversation_id] = set(tokenize(title))
+        self._insert(conversation_id)
+
+    def put(self, conversation_id, title, last_updated):
+        """Add a conversation, or update its title and recency"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._put, (conversation_id, title, last_updated)))
+            if self.loaded:
+                self._put(conversation_id, title, last_updated)
+
+    def _put(self, conversation_id, title, last_updated):
+        current = self._titles.get(conversation_id)
+        if current is not None and current[0] == title:
+            # Same words: only the recency moves, which re-ranks in place
+            self._titles[conversation_id] = (title, last_updated.isoformat())
+            self._recency[conversation_id] = last_updated.timestamp()
+            self._insert(conversation_id)
+            return
+        if current is not None:
+            self._remove(conversation_id)
+        self._set(conversation_id, title, last_updated)
+
+    def discard(self, conversation_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._discard, (conversation_id,)))
+            if self.loaded:
+                self._discard(conversation_id)
+
+    def _discard(self, conversation_id):
+        if conversation_id in self._titles:
+            self._remove(conversation_id)
+
+    # Lookups
+
+    def _conversation(self, conversation_id):
+        title, last_updated = self._titles[conversation_id]
+        return {'id': conversation_id, 'title': title, 'last_updated': last_updated}
+
+    def suggest(self, prefix, limit=8):
+        """
+        Most recent conversations with a title word starting with the last
+        word of prefix (and containing the earlier words), and the most
+        frequent title words that complete it.
+        """
+        words = tokenize(prefix)
+        limit = max(1, min(limit, self.max_results))
+        if not words:
+            return {'conversations': [], 'terms': []}
+        last = words[-1]
+        with self._lock:
+            path = self._path(last)
+            if path is None:
+                return {'conversations': [], 'terms': []}
+            node = path[-1]
+            if node.top_stale or node.terms_stale:
+                self._refresh(node)
+            terms = [term.word for term in node.terms[:limit]]
+
+            if len(words) == 1:
+                return {
+                    'conversations': [self._conversation(cid) for cid in node.top[:limit]],
+                    'terms': terms
+                }
+
+            # Earlier words must be complete: start from the rarest one's conversations
+            candidates = None
+            for word in words[:-1]:
+                word_path = self._path(word)
+                ids = word_path[-1].ids if word_path else set()
+                if candidates is None or len(ids) < len(candidates):
+                    candidates = ids
+            required = set(words[:-1])
+            matches = [
+                cid for cid in candidates
+                if required <= self._words[cid] and any(word.startswith(last) for word in self._words[cid])
+            ]
+            top = heapq.nlargest(limit, matches, key=self._recency.__getitem__)
+            return {
+                'conversations': [self._conversation(cid) for cid in top],
+                'terms': terms
+            }
+
+
+def init_suggest(app):
+    """Create the (empty) title index; it is loaded by the first suggestion request"""
+    index = TitleIndex(max_results=app.config['SUGGEST_MAX_RESULTS'])
+    app.extensions['suggest'] = index
+    return index
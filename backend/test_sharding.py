@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-space databases (sharding.py)
+Run with: python -m pytest test_sharding.py
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import db, Attachment, Conversation, Message, SpaceLocation
+from sharding import SpaceShards
+
+
+class SpaceShardsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog_path = os.path.join(self.directory, 'qlippy.db')
+        engine = create_engine(f'sqlite:///{self.catalog_path}')
+        db.metadata.create_all(engine)
+        engine.dispose()
+        self.shards = SpaceShards(self.catalog_path, os.path.join(self.directory, 'spaces'))
+
+    def tearDown(self):
+        for space_id in self.shards.spaces():
+            self.shards.drop(space_id)
+        shutil.rmtree(self.directory)
+
+    def add_conversation(self, space_id, conversation_id, folder=None, last_updated=None):
+        """A conversation with one message and one attachment; returns the ids of all three"""
+        def add(session):
+            session.add(Conversation(
+                id=conversation_id, title=f'Chat {conversation_id}', folder=folder,
+                last_updated=last_updated or datetime.utcnow()
+            ))
+            session.add(Message(id=f'{conversation_id}-m', conversation_id=conversation_id, role='user', content='hi'))
+            session.add(Attachment(
+                id=f'{conversation_id}-a', message_id=f'{conversation_id}-m', sha256='0' * 64,
+                filename='notes.txt', content_type='text/plain', size=5
+            ))
+        if space_id is None:
+            engine = create_engine(f'sqlite:///{self.catalog_path}')
+            with closing(Session(bind=engine)) as session:
+                add(session)
+                session.commit()
+            engine.dispose()
+        else:
+            self.shards.write(space_id, add)
+        return [conversation_id, f'{conversation_id}-m', f'{conversation_id}-a']
+
+    def rows(self, space_id):
+        """(conversation ids, folders, message ids, attachment ids) in a space's database (None: the catalog)"""
+        with closing(sqlite3.connect(self.shards.path(space_id))) as conn:
+            conversations = conn.execute('SELECT id, folder FROM conversations ORDER BY id').fetchall()
+            return (
+                [row[0] for row in conversations],
+                [row[1] for row in conversations],
+                [row[0] for row in conn.execute('SELECT id FROM messages ORDER BY id')],
+                [row[0] for row in conn.execute('SELECT id FROM attachments ORDER BY id')]
+            )
+
+    def locations(self):
+        with closing(sqlite3.connect(self.catalog_path)) as conn:
+            return dict(conn.execute(f'SELECT row_id, space_id FROM {SpaceLocation.__tablename__}'))
+
+    def test_move_to_a_space_and_back(self):
+        ids = self.add_conversation(None, 'c1')
+        moved_at = datetime(2030, 1, 1, 12, 0, 0)
+
+        self.assertTrue(self.shards.move('c1', None, 'work', {'folder': 'work', 'last_updated': moved_at}))
+        self.assertEqual(self.rows(None), ([], [], [], []))
+        self.assertEqual(self.rows('work'), (['c1'], ['work'], ['c1-m'], ['c1-a']))
+        self.assertEqual(self.locations(), dict.fromkeys(ids, 'work'))
+        # The new values were written in a format SQLAlchemy reads back
+        conversation = self.shards.read('work', lambda session: session.get(Conversation, 'c1').to_dict())
+        self.assertEqual(conversation['last_updated'], moved_at.isoformat())
+        self.assertEqual(conversation['message_count'], 1)
+
+        self.assertTrue(self.shards.move('c1', 'work', None, {'folder': None}))
+        self.assertEqual(self.rows('work'), ([], [], [], []))
+        self.assertEqual(self.rows(None), (['c1'], [None], ['c1-m'], ['c1-a']))
+        self.assertEqual(self.locations(), {})
+        self.assertEqual(self.shards.stats['moves'], 2)
+
+    def test_move_between_spaces(self):
+        ids = self.add_conversation('home', 'c1', folder='home')
+
+        self.assertTrue(self.shards.move('c1', 'home', 'work', {'folder': 'work'}))
+        self.assertEqual(self.rows('home'), ([], [], [], []))
+        self.assertEqual(self.rows('work'), (['c1'], ['work'], ['c1-m'], ['c1-a']))
+        self.assertEqual(self.locations(), dict.fromkeys(ids, 'work'))
+
+    def test_move_of_a_missing_conversation(self):
+        self.assertFalse(self.shards.move('missing', None, 'work'))
+        self.assertEqual(self.locations(), {})
+        self.assertEqual(self.shards.stats['moves'], 0)
+
+    def test_list_by_space(self):
+        self.add_conversation(None, 'c1', last_updated=datetime(2030, 1, 1))
+        self.add_conversation('home', 'c2', folder='home', last_updated=datetime(2030, 1, 3))
+        self.add_conversation('work', 'c3', folder='work', last_updated=datetime(2030, 1, 2))
+        self.add_conversation(None, 'c4')
+        self.shards.move('c4', None, 'work', {'folder': 'work', 'last_updated': datetime(2030, 1, 4)})
+
+        def listed(**options):
+            return [row[0] for row in self.shards.list_conversations(**options)]
+
+        # Newest first across databases, the catalog always included
+        self.assertEqual(listed(), ['c4', 'c2', 'c3', 'c1'])
+        self.assertEqual(listed(space_ids=['work']), ['c4', 'c3', 'c1'])
+        self.assertEqual(listed(space_ids=['home']), ['c2', 'c1'])
+        self.assertEqual(listed(folder='work'), ['c4', 'c3'])
+        row = self.shards.list_conversations(space_ids=['home'], folder='home')[0]
+        self.assertEqual(row[:3], ('c2', 'Chat c2', 'home'))
+        self.assertEqual(row[5:], (1, 'hi'))
+
+    def test_listing_in_batches_of_attached_databases(self):
+        self.shards.attach_limit = 2
+        for i in range(5):
+            self.add_conversation(f's{i}', f'c{i}', folder=f's{i}', last_updated=datetime(2030, 1, 1 + i))
+
+        self.assertEqual([row[0] for row in self.shards.list_conversations()], ['c4', 'c3', 'c2', 'c1', 'c0'])
+        self.assertEqual(self.shards.stats['attached_queries'], 3)
+
+    def test_failed_copy_rolls_back(self):
+        ids = self.add_conversation(None, 'c1')
+        # The same attachment id already in the target makes the copy fail after
+        # the locations were written and the conversation and message were copied
+        self.shards.write('work', lambda session: session.add(Attachment(
+            id='c1-a', sha256='1' * 64, filename='other.txt', content_type='text/plain', size=1
+        )))
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.shards.move('c1', None, 'work', {'folder': 'work'})
+        self.assertEqual(self.rows(None), (['c1'], [None], ['c1-m'], ['c1-a']))
+        self.assertEqual(self.rows('work'), ([], [], [], ['c1-a']))
+        self.assertEqual(self.locations(), {})
+        self.assertEqual(self.shards.stats['moves'], 0)
+
+        # Nothing was left half done: once the conflict is gone the move goes through
+        self.shards.write('work', lambda session: session.delete(session.get(Attachment, 'c1-a')))
+        self.assertTrue(self.shards.move('c1', None, 'work', {'folder': 'work'}))
+        self.assertEqual(self.locations(), dict.fromkeys(ids, 'work'))
+
+    def test_unknown_columns_are_rejected(self):
+        self.add_conversation(None, 'c1')
+
+        with self.assertRaises(ValueError):
+            self.shards.move('c1', None, 'work', {'owner': 'me'})
+        self.assertEqual(self.rows(None)[0], ['c1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
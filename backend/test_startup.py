@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for which background threads the app starts, depending on how it is launched
+Run with: python -m pytest test_startup.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Builds the app the way run.py does and reports its background threads
+PROBE = """
+import json, threading
+from app import create_app
+app = create_app()
+print(json.dumps({
+    'threads': sorted(thread.name for thread in threading.enumerate()),
+    'space_writers': app.extensions['shards'].write_queue is not None
+}))
+"""
+
+
+def start_app(**env):
+    with tempfile.TemporaryDirectory() as instance_path:
+        environ = dict(
+            os.environ,
+            QLIPPY_INSTANCE_PATH=instance_path,
+            WRITE_QUEUE_ENABLED='true',
+            SPACE_SHARDING_ENABLED='true',
+            INGEST_AUTO='false',
+            **env
+        )
+        environ.pop('WERKZEUG_RUN_MAIN', None)
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=environ,
+            capture_output=True, text=True, timeout=120, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class StartupTest(unittest.TestCase):
+    def test_start_py_runs_background_threads_in_its_only_process(self):
+        # start.py: run.py in debug mode with the reloader off
+        started = start_app(QLIPPY_RELOAD='false')
+        for name in ('qlippy-maintenance', 'qlippy-backup', 'db-writer'):
+            self.assertIn(name, started['threads'])
+        self.assertTrue(started['space_writers'])
+
+    def test_reloader_watcher_starts_no_background_threads(self):
+        # run.py with the reloader: this process only watches files
+        started = start_app(QLIPPY_RELOAD='true')
+        for name in ('qlippy-maintenance', 'qlippy-backup', 'db-writer'):
+            self.assertNotIn(name, started['threads'])
+
+
+if __name__ == '__main__':
+    unittest.main()
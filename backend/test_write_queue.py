@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the group-commit writer (write_queue.py)
+Run with: python -m pytest test_write_queue.py
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
+
+from write_queue import WriteQueue, WriteQueueTimeout
+
+Base = declarative_base()
+
+
+class Row(Base):
+    __tablename__ = 'rows'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True, nullable=False)
+
+
+def add_row(session, name):
+    session.add(Row(name=name))
+    return name
+
+
+class WriteQueueTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        engine = create_engine(f'sqlite:///{self.path}')
+        Base.metadata.create_all(engine)
+        self.session = scoped_session(sessionmaker(bind=engine))
+        app = SimpleNamespace(app_context=nullcontext)
+        self.writer = WriteQueue(app, SimpleNamespace(session=self.session), window_seconds=0.05, timeout=0.2)
+
+    def tearDown(self):
+        self.writer.stop()
+        self.session.remove()
+        os.unlink(self.path)
+
+    def names(self):
+        names = sorted(name for (name,) in self.session.query(Row.name))
+        self.session.remove()
+        return names
+
+    def test_failed_mutation_fails_only_its_own_caller(self):
+        # Queued before the writer starts so all four land in one batch
+        futures = [self.writer.submit(add_row, self.session, name) for name in ('a', 'b', 'a', 'c')]
+        self.writer.start()
+
+        self.assertEqual(futures[0].result(timeout=5), 'a')
+        self.assertEqual(futures[1].result(timeout=5), 'b')
+        self.assertIsNotNone(futures[2].exception(timeout=5))  # The duplicate, not whoever flushed after it
+        self.assertEqual(futures[3].result(timeout=5), 'c')
+        self.assertEqual(self.names(), ['a', 'b', 'c'])
+        report = self.writer.report()
+        self.assertEqual(report['failed'], 1)
+        self.assertEqual(report['replays'], 1)
+
+    def test_failure_is_reported_to_the_mutation_that_raised(self):
+        def explode(session):
+            add_row(session, 'x')
+            raise RuntimeError('boom')
+
+        futures = [
+            self.writer.submit(add_row, self.session, 'a'),
+            self.writer.submit(explode, self.session),
+            self.writer.submit(add_row, self.session, 'b')
+        ]
+        self.writer.start()
+
+        self.assertEqual(futures[0].result(timeout=5), 'a')
+        self.assertIsInstance(futures[1].exception(timeout=5), RuntimeError)
+        self.assertEqual(futures[2].result(timeout=5), 'b')
+        self.assertEqual(self.names(), ['a', 'b'])
+
+    def test_write_that_never_started_is_cancelled_on_timeout(self):
+        release = threading.Event()
+
+        def block(session):
+            release.wait(5)
+
+        self.writer.start()
+        blocker = self.writer.submit(block, self.session)
+        time.sleep(0.1)  # Let the writer pick up the blocking job
+        with self.assertRaises(WriteQueueTimeout):
+            self.writer.run(add_row, self.session, 'late')
+        release.set()
+        blocker.result(timeout=5)
+
+        self.writer.run(add_row, self.session, 'next')  # Drains the queue behind the cancelled write
+        self.assertEqual(self.names(), ['next'])
+        self.assertEqual(self.writer.report()['timeouts'], 1)
+
+    def test_run_starts_a_writer_that_was_never_started(self):
+        self.assertEqual(self.writer.run(add_row, self.session, 'a'), 'a')
+        self.assertEqual(self.names(), ['a'])
+
+    def test_write_that_started_is_waited_for_past_the_timeout(self):
+        def slow(session):
+            time.sleep(0.4)
+            return add_row(session, 'slow')
+
+        self.writer.start()
+        self.assertEqual(self.writer.run(slow, self.session), 'slow')
+        self.assertEqual(self.names(), ['slow'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+"""
+Voice-turn tracing for the Qlippy backend.
+Each stage of a voice turn (hotword.js, the voice server, this API and the
+TTS daemon) reports spans tagged with the turn's trace id. The collector
+keeps recent turns in memory for per-turn waterfalls and per-stage latency
+percentiles, and appends every span to a JSON-lines log.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from logging.handlers import RotatingFileHandler
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = 'X-Qlippy-Trace-Id'
+MAX_SPANS_PER_TRACE = 500
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def parse_span(data):
+    """Validate a span from a client. Raises ValueError if malformed."""
+    if not isinstance(data, dict):
+        raise ValueError('Span must be an object')
+    trace_id, name = data.get('trace_id'), data.get('name')
+    if not isinstance(trace_id, str) or not trace_id or len(trace_id) > 64:
+        raise ValueError('Span needs a trace_id of at most 64 characters')
+    if not isinstance(name, str) or not name or len(name) > 100:
+        raise ValueError('Span needs a name of at most 100 characters')
+    try:
+        start = float(data['start'])
+        duration = float(data.get('duration_ms', 0))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Span needs a numeric start (epoch ms) and duration_ms')
+    if duration < 0:
+        raise ValueError('duration_ms must not be negative')
+    attrs = data.get('attrs') or {}
+    if not isinstance(attrs, dict):
+        raise ValueError('attrs must be an object')
+    return {
+        'trace_id': trace_id,
+        'name': name,
+        'service': str(data.get('service') or 'unknown'),
+        'start': start,
+        'duration_ms': round(duration, 3),
+        'attrs': attrs
+    }
+
+
+class TraceCollector:
+    def __init__(self, max_traces=200, samples_per_stage=1000, log_path=None):
+        self.max_traces = max_traces
+        self.samples_per_stage = samples_per_stage
+        self.spans_received = 0
+        self._lock = threading.Lock()
+        self._traces = OrderedDict()  # trace id -> spans, oldest first
+        self._stages = {}  # span name -> recent durations in ms
+        self._log = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            self._log = logging.getLogger('qlippy.traces')
+            self._log.propagate = False
+            self._log.setLevel(logging.INFO)
+            if not self._log.handlers:
+                handler = RotatingFileHandler(log_path, maxBytes=5 * 1024 * 1024, backupCount=2)
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self._log.addHandler(handler)
+
+    def add(self, spans):
+        with self._lock:
+            for span in spans:
+                trace = self._traces.pop(span['trace_id'], [])
+                if len(trace) < MAX_SPANS_PER_TRACE:
+                    trace.append(span)
+                # Re-inserting keeps the most recently active turns at the end
+                self._traces[span['trace_id']] = trace
+                if span['name'] not in self._stages:
+                    self._stages[span['name']] = deque(maxlen=self.samples_per_stage)
+                self._stages[span['name']].append(span['duration_ms'])
+                self.spans_received += 1
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        if self._log:
+            for span in spans:
+                self._log.info(json.dumps(span))
+
+    def record(self, trace_id, name, start, duration_ms, service='backend', **attrs):
+        self.add([{
+            'trace_id': trace_id,
+            'name': name,
+            'service': service,
+            'start': start,
+            'duration_ms': round(duration_ms, 3),
+            'attrs': attrs
+        }])
+
+    def waterfall(self, trace_id):
+        """Spans of one turn ordered by start, with offsets from the first span, or None"""
+        with self._lock:
+            spans = list(self._traces.get(trace_id, ()))
+        if not spans:
+            return None
+        spans.sort(key=lambda span: span['start'])
+        origin = spans[0]['start']
+        end = max(span['start'] + span['duration_ms'] for span in spans)
+        return {
+            'trace_id': trace_id,
+            'start': origin,
+            'total_ms': round(end - origin, 3),
+            'spans': [
+                {**span, 'offset_ms': round(span['start'] - origin, 3)}
+                for span in spans
+            ]
+        }
+
+    def recent(self, limit=20):
+        with self._lock:
+            trace_ids = list(self._traces)[-limit:]
+        summaries = []
+        for trace_id in reversed(trace_ids):
+            waterfall = self.waterfall(trace_id)
+            if waterfall:
+                summaries.append({
+                    'trace_id': trace_id,
+                    'start': waterfall['start'],
+                    'total_ms': waterfall['total_ms'],
+                    'spans': len(waterfall['spans']),
+                    'services': sorted({span['service'] for span in waterfall['spans']})
+                })
+        return summaries
+
+    def stage_stats(self):
+        with self._lock:
+            stages = {name: sorted(durations) for name, durations in self._stages.items()}
+        return {
+            name: {
+                'count': len(durations),
+                'p50_ms': _percentile(durations, 0.50),
+                'p95_ms': _percentile(durations, 0.95),
+                'p99_ms': _percentile(durations, 0.99),
+                'max_ms': durations[-1]
+            }
+            for name, durations in sorted(stages.items())
+        }
+
+    def render_waterfall(self, trace_id, width=60):
+        """Plain-text waterfall of one turn, one bar per span"""
+        waterfall = self.waterfall(trace_id)
+        if waterfall is None:
+            return None
+        scale = width / max(waterfall['total_ms'], 1)
+        label_width = max(len(f"{span['service']}:{span['name']}") for span in waterfall['spans'])
+        lines = [f"trace {trace_id}  total {waterfall['total_ms']:.1f}ms"]
+        for span in waterfall['spans']:
+            label = f"{span['service']}:{span['name']}"
+            offset = int(span['offset_ms'] * scale)
+            bar = '#' * max(1, int(span['duration_ms'] * scale))
+            lines.append(f"{label:<{label_width}}  {' ' * offset}{bar}  {span['duration_ms']:.1f}ms @ {span['offset_ms']:.1f}ms")
+        return '\n'.join(lines) + '\n'
+
+
+def init_tracing(app):
+    """Create the span collector and trace API requests that carry a trace id"""
+    log_path = None
+    if app.config['TRACE_LOG_ENABLED']:
+        log_path = os.path.join(app.instance_path, app.config['TRACE_LOG_FILE'])
+    collector = TraceCollector(
+        max_traces=app.config['TRACE_MAX_TURNS'],
+        log_path=log_path
+    )
+    app.extensions['tracing'] = collector
+
+    @app.before_request
+    def start_trace_span():
+        trace_id = request.headers.get(TRACE_HEADER)
+        if trace_id and len(trace_id) <= 64:
+            g.trace_id = trace_id
+            g.trace_started = (time.time() * 1000, time.perf_counter())
+
+    @app.after_request
+    def finish_trace_span(response):
+        started = g.pop('trace_started', None)
+        if started is None:
+            return response
+        wall_start, perf_start = started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        collector.record(
+            g.trace_id,
+            f'api {request.method} {route}',
+            wall_start,
+            (time.perf_counter() - perf_start) * 1000,
+            status=response.status_code
+        )
+        response.headers[TRACE_HEADER] = g.trace_id
+        return response
+
+    return collector
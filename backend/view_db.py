@@ -61,6 +61,27 @@ def view_database():
         
         print()
     
+    # Storage and maintenance figures
+    page_size = cursor.execute("PRAGMA page_size;").fetchone()[0]
+    page_count = cursor.execute("PRAGMA page_count;").fetchone()[0]
+    freelist_count = cursor.execute("PRAGMA freelist_count;").fetchone()[0]
+    auto_vacuum = cursor.execute("PRAGMA auto_vacuum;").fetchone()[0]
+    journal_mode = cursor.execute("PRAGMA journal_mode;").fetchone()[0]
+    wal_path = db_path + '-wal'
+    wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    
+    print("💾 STORAGE")
+    print("-" * 40)
+    print(f"  File size: {os.path.getsize(db_path)} bytes ({page_count} pages of {page_size} bytes)")
+    print(f"  Free pages: {freelist_count} ({freelist_count * page_size} bytes reclaimable)")
+    print(f"  Auto-vacuum: {({0: 'none', 1: 'full', 2: 'incremental'}).get(auto_vacuum, auto_vacuum)}")
+    print(f"  Journal mode: {journal_mode} (WAL file: {wal_size} bytes)")
+    if auto_vacuum != 2:
+        print("  Tip: run 'python maintenance.py --enable-incremental-vacuum' with the server stopped")
+        print("       so background maintenance can reclaim free pages.")
+    print("  Live maintenance stats: GET http://localhost:5001/api/maintenance")
+    print()
+    
     conn.close()
     print("=" * 60)
     print("Database viewer completed!")
@@ -0,0 +1,221 @@
+"""
+Single-writer group commit for the Qlippy backend.
+When enabled, write routes hand their mutation to one writer thread instead
+of committing on the request thread. The writer takes whatever has queued
+up (waiting at most a short window for more), runs the mutations in one
+transaction and commits once, then resolves each caller's future. Writers
+never contend for the SQLite lock and share one fsync per batch.
+
+Each mutation is flushed on its own, so a mutation that raises (or whose
+changes violate a constraint) fails only its own caller: the batch is
+rolled back and replayed without it. If the final commit fails, every
+mutation is committed on its own instead. Mutations must therefore only
+touch the database through the session, so running them again is safe.
+
+A caller waits at most the timeout for its mutation to start. A mutation
+that hasn't started by then is cancelled and raises WriteQueueTimeout, so
+it can never commit after its caller gave up; one that has started is
+waited for until it commits.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from maintenance import is_reloader_parent
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueTimeout(Exception):
+    """Raised when a mutation waited too long to start; it was cancelled and never ran"""
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'kwargs', 'future')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class WriteQueue:
+    def __init__(self, app, db, window_seconds=0.002, max_batch=64, timeout=10.0):
+        self.app = app
+        self.db = db
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'writes': 0,
+            'failed': 0,
+            'batches': 0,
+            'largest_batch': 0,
+            'replays': 0,
+            'timeouts': 0,
+            'commit_ms_total': 0.0
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=self.timeout)
+            self._thread = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue a mutation; the future resolves to its return value once committed"""
+        job = _Job(fn, args, kwargs)
+        self._queue.put(job)
+        return job.future
+
+    def run(self, fn, *args, **kwargs):
+        """Queue a mutation and wait for its commit. Raises WriteQueueTimeout if it didn't start in time."""
+        # Started here too, so a process that skipped start() at init can't queue writes nobody runs
+        self.start()
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                with self._lock:
+                    self.stats['timeouts'] += 1
+                raise WriteQueueTimeout(f'The database writer is busy; the write was not applied (waited {self.timeout}s)')
+            # Already running: it may still commit, so wait for the outcome
+            return future.result()
+
+    def _next_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window_seconds
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)  # Stop after this batch
+                break
+            batch.append(job)
+        return batch
+
+    def _loop(self):
+        with self.app.app_context():
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                batch = [job for job in self._next_batch(job) if job.future.set_running_or_notify_cancel()]
+                try:
+                    self._commit(batch)
+                except Exception as e:
+                    logger.exception("Writer failed a batch of %d", len(batch))
+                    for job in batch:
+                        if not job.future.done():
+                            job.future.set_exception(e)
+                finally:
+                    self.db.session.remove()
+
+    def _commit(self, batch):
+        session = self.db.session
+        while batch:
+            results, failed = [], None
+            for job in batch:
+                try:
+                    results.append(job.fn(*job.args, **job.kwargs))
+                    # Flush now so an error surfaces on the mutation that caused it, not a later one
+                    session.flush()
+                except Exception as e:
+                    failed = (job, e)
+                    break
+
+            if failed is not None:
+                # Undo the whole batch and replay it without the failing mutation
+                session.rollback()
+                job, error = failed
+                job.future.set_exception(error)
+                batch = [other for other in batch if other is not job]
+                with self._lock:
+                    self.stats['failed'] += 1
+                    self.stats['replays'] += 1 if batch else 0
+                continue
+
+            started = time.perf_counter()
+            try:
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                if len(batch) == 1:
+                    batch[0].future.set_exception(e)
+                    with self._lock:
+                        self.stats['failed'] += 1
+                    return
+                # Commit each mutation on its own so only those that can't commit fail
+                with self._lock:
+                    self.stats['replays'] += 1
+                for job in batch:
+                    self._commit([job])
+                return
+            with self._lock:
+                self.stats['writes'] += len(batch)
+                self.stats['batches'] += 1
+                self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+                self.stats['commit_ms_total'] += (time.perf_counter() - started) * 1000
+            for job, result in zip(batch, results):
+                job.future.set_result(result)
+            return
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        batches = stats['batches']
+        commit_ms_total = stats.pop('commit_ms_total')
+        return {
+            **stats,
+            'queued': self._queue.qsize(),
+            'mean_batch_size': round(stats['writes'] / batches, 2) if batches else 0.0,
+            'mean_commit_ms': round(commit_ms_total / batches, 3) if batches else 0.0
+        }
+
+
+def init_write_queue(app, db):
+    """Start the group-commit writer if WRITE_QUEUE_ENABLED is set"""
+    if not app.config['WRITE_QUEUE_ENABLED']:
+        return None
+
+    writer = WriteQueue(
+        app,
+        db,
+        window_seconds=app.config['WRITE_QUEUE_WINDOW_MS'] / 1000.0,
+        max_batch=app.config['WRITE_QUEUE_MAX_BATCH'],
+        timeout=app.config['WRITE_QUEUE_TIMEOUT']
+    )
+    app.extensions['write_queue'] = writer
+    if not is_reloader_parent(app):
+        writer.start()
+    return writer
+
+
+def write(app, db, fn, *args, **kwargs):
+    """
+    Run a mutation and commit it: through the writer when the queue is
+    enabled, otherwise on the calling thread. Returns the mutation's result.
+    """
+    writer = app.extensions.get('write_queue')
+    if writer is not None:
+        return writer.run(fn, *args, **kwargs)
+    result = fn(*args, **kwargs)
+    db.session.commit()
+    return result
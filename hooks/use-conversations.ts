@@ -9,7 +9,7 @@ interface UseConversationsReturn {
   loadConversations: () => Promise<void>;
   createConversation: (title?: string, folder?: string) => Promise<Conversation>;
   loadConversation: (conversationId: string) => Promise<void>;
-  addMessage: (conversationId: string, role: 'user' | 'assistant', content: string) => Promise<Message>;
+  addMessage: (conversationId: string, role: 'user' | 'assistant', content: string, attachmentIds?: string[]) => Promise<Message>;
   updateConversation: (conversationId: string, updates: { title?: string; folder?: string }) => Promise<void>;
   deleteConversation: (conversationId: string) => Promise<void>;
   setActiveConversation: (conversation: Conversation | null) => void;
@@ -87,12 +87,13 @@ export function useConversations(): UseConversationsReturn {
   const addMessage = useCallback(async (
     conversationId: string,
     role: 'user' | 'assistant',
-    content: string
+    content: string,
+    attachmentIds: string[] = []
   ): Promise<Message> => {
     console.log('Adding message:', { conversationId, role, contentLength: content.length });
     try {
       console.log('Calling qlippyAPI.addMessage...');
-      const message = await qlippyAPI.addMessage(conversationId, role, content);
+      const message = await qlippyAPI.addMessage(conversationId, role, content, attachmentIds);
       console.log('Message added successfully:', message);
       
       // Update active conversation with new message
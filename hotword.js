@@ -4,6 +4,8 @@ const { PvRecorder } = require('@picovoice/pvrecorder-node');
 const { spawn } = require('child_process');
 const { Porcupine } = require('@picovoice/porcupine-node');
 const fs = require('fs');
+const http = require('http');
+const crypto = require('crypto');
 
 // Load environment variables from .env file
 require('dotenv').config();
@@ -20,13 +22,87 @@ let isRecording = false;
 let ffmpegProcess = null;
 let recordingTimeout = null;
 let isSpeaking = false;
+let currentTurn = null; // Trace of the voice turn being recorded
 
 // Audio recording settings
 const MAX_RECORDING_DURATION = 10000; // 10 seconds
 const outputPath = path.join(app.getPath('temp'), 'recording.wav');
 
+// Voice server (server.py) and backend (span collector)
+const VOICE_SERVER_PORT = 8000;
+const BACKEND_PORT = 5001;
+const TRACE_HEADER = 'X-Qlippy-Trace-Id';
+const FFMPEG_EXIT_TIMEOUT = 2000;
+const TRANSCRIBE_TIMEOUT = 60000;
+
 // Wake word responses removed - avatar only shows without spoken greeting
 
+// Ask the voice server to load its speech model now, so it is ready by the
+// time the user finishes speaking. Fire and forget: recording never waits on it.
+const warmUpVoiceServer = () => {
+  const req = http.request({
+    hostname: '127.0.0.1',
+    port: VOICE_SERVER_PORT,
+    path: '/warmup',
+    method: 'POST',
+    timeout: 2000
+  }, (res) => res.resume());
+
+  req.on('error', (err) => {
+    console.log('Voice server warm-up skipped:', err.message);
+  });
+  req.on('timeout', () => req.destroy());
+  req.end();
+};
+
+// One voice turn (wake word to end of the spoken reply) is traced under one id.
+// Each stage records spans; the voice server reports its own under the same id,
+// and the backend collector builds the waterfall (GET /api/traces/<id>).
+const nowMs = () => performance.timeOrigin + performance.now();
+
+class TurnTrace {
+  constructor() {
+    this.id = crypto.randomUUID();
+    this.spans = [];
+    this.open = new Map(); // span name -> start time
+  }
+
+  start(name) {
+    this.open.set(name, nowMs());
+  }
+
+  end(name, attrs = {}) {
+    if (!this.open.has(name)) return;
+    this.add(name, this.open.get(name), nowMs(), attrs);
+    this.open.delete(name);
+  }
+
+  add(name, start, end, attrs = {}, service = 'hotword') {
+    this.spans.push({ trace_id: this.id, name, service, start, duration_ms: end - start, attrs });
+  }
+
+  // Fire and forget, like the warm-up: tracing never holds up a turn
+  flush() {
+    if (!this.spans.length) return;
+    const body = JSON.stringify({ spans: this.spans });
+    this.spans = [];
+    const req = http.request({
+      hostname: '127.0.0.1',
+      port: BACKEND_PORT,
+      path: '/api/traces',
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(body) },
+      timeout: 2000
+    }, (res) => res.resume());
+
+    req.on('error', (err) => {
+      console.log('Trace spans not sent:', err.message);
+    });
+    req.on('timeout', () => req.destroy());
+    req.end(body);
+  }
+}
+
 // Function to list available audio devices
 async function listAudioDevices() {
   return new Promise((resolve, reject) => {
@@ -363,6 +439,10 @@ const startRecording = async () => {
       stopRecording();
     });
 
+    if (!currentTurn) currentTurn = new TurnTrace(); // Started from the UI, not the wake word
+    currentTurn.end('wake');
+    currentTurn.start('record');
+
     // Set timeout to stop recording
     recordingTimeout = setTimeout(() => {
       console.log('Recording timeout reached');
@@ -378,11 +458,31 @@ const startRecording = async () => {
   }
 };
 
+// Send the recording to the voice server; resolves with the transcription
+const transcribeRecording = async (filePath, traceId) => {
+  const form = new FormData();
+  form.append('file', new Blob([fs.readFileSync(filePath)], { type: 'audio/wav' }), 'recording.wav');
+  const response = await fetch(`http://127.0.0.1:${VOICE_SERVER_PORT}/transcribe?wait=true`, {
+    method: 'POST',
+    headers: { [TRACE_HEADER]: traceId },
+    body: form,
+    signal: AbortSignal.timeout(TRANSCRIBE_TIMEOUT)
+  });
+  const result = await response.json();
+  if (!response.ok || result.status !== 'done') {
+    throw new Error(result.message || result.detail || `HTTP ${response.status}`);
+  }
+  return result.transcription;
+};
+
 const stopRecording = async () => {
   if (!isRecording) return;
   
   console.log('Stopping recording...');
   isRecording = false;
+  const turn = currentTurn || new TurnTrace();
+  currentTurn = null;
+  turn.end('record');
   if (appWindow) {
     appWindow.webContents.send('recording-stopped');
   }
@@ -393,32 +493,38 @@ const stopRecording = async () => {
     recordingTimeout = null;
   }
 
-  // Stop ffmpeg
+  // Stop ffmpeg and wait for it to finish writing the file
+  turn.start('record.finalize');
   if (ffmpegProcess) {
     console.log('Stopping ffmpeg process...');
-    ffmpegProcess.stdin.write('q');
-    ffmpegProcess.kill();
+    const ffmpeg = ffmpegProcess;
     ffmpegProcess = null;
+    const exited = ffmpeg.exitCode !== null
+      ? Promise.resolve()
+      : new Promise(resolve => ffmpeg.once('close', resolve));
+    ffmpeg.stdin.write('q');
+    ffmpeg.kill();
+    await Promise.race([exited, new Promise(resolve => setTimeout(resolve, FFMPEG_EXIT_TIMEOUT))]);
   }
 
-  // Wait a bit for the file to be fully written
-  await new Promise(resolve => setTimeout(resolve, 1000));
-
   // Verify the recording file exists and has content
   if (!fs.existsSync(outputPath)) {
     console.error('Recording file does not exist');
     if (appWindow) {
       appWindow.webContents.send('recording-error', 'Recording failed - no output file');
     }
+    turn.flush();
     return;
   }
 
   const stats = fs.statSync(outputPath);
+  turn.end('record.finalize', { bytes: stats.size });
   if (stats.size === 0) {
     console.error('Recording file is empty');
     if (appWindow) {
       appWindow.webContents.send('recording-error', 'Recording failed - empty file');
     }
+    turn.flush();
     return;
   }
 
@@ -427,19 +533,17 @@ const stopRecording = async () => {
     appWindow.webContents.send('processing-complete');
   }
 
-  // TODO: Add actual Whisper processing here
-  // For now, simulate processing and send a voice command to the main app
-  setTimeout(async () => {
-    const simulatedTranscription = "Hello, this is a simulated voice command";
-    
-    // Send voice command to main app
-    if (appWindow) {
-      appWindow.webContents.send('voice-command', simulatedTranscription);
-    }
-    
-    const response = "I heard you! This is a simulated response. We'll connect this to the actual LLM processing soon.";
-    await speakResponse(response);
-  }, 1000);
+  turn.start('transcribe');
+  let transcription;
+  try {
+    transcription = await transcribeRecording(outputPath, turn.id);
+    turn.end('transcribe');
+  } catch (error) {
+    // Keep the assistant usable without the voice server running
+    console.log('Voice server transcription failed, using simulated text:', error.message);
+    turn.end('transcribe', { error: error.message });
+    transcription = "Hello, this is a simulated voice command";
+  }
 
   // Clean up recording file
   try {
@@ -447,9 +551,113 @@ const stopRecording = async () => {
   } catch (error) {
     console.error('Error cleaning up recording file:', error);
   }
+
+  // Send voice command to main app
+  if (appWindow) {
+    appWindow.webContents.send('voice-command', transcription);
+  }
+
+  const response = "I heard you! This is a simulated response. We'll connect this to the actual LLM processing soon.";
+
+  await speakResponse(response, turn);
+  turn.flush();
 };
 
-const speakResponse = async (text) => {
+// Text-to-speech runs in one long-lived lib/tts.py daemon, so each reply
+// skips Python startup and engine initialization
+let ttsDaemon = null;
+let ttsNextId = 0;
+const ttsPending = new Map(); // request id -> { resolve }
+
+const startTTSDaemon = () => {
+  const child = spawn('python3', [
+    path.join(__dirname, 'lib', 'tts.py'),
+    '--daemon',
+    '--cache-dir', path.join(app.getPath('userData'), 'tts-cache')
+  ]);
+  let buffered = '';
+
+  child.stdout.on('data', (data) => {
+    buffered += data.toString();
+    const lines = buffered.split('\n');
+    buffered = lines.pop();
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      let event;
+      try {
+        event = JSON.parse(line);
+      } catch (error) {
+        console.error('TTS daemon sent invalid output:', line);
+        continue;
+      }
+      if (event.event === 'ready') {
+        console.log(`TTS daemon ready (engine init ${event.init_ms}ms)`);
+      }
+      const pending = ttsPending.get(event.id);
+      if (pending && event.event === 'started' && pending.onStarted) {
+        pending.onStarted(event);
+      }
+      if (pending && ['done', 'cancelled', 'error'].includes(event.event)) {
+        ttsPending.delete(event.id);
+        pending.resolve(event);
+      }
+    }
+  });
+
+  child.stderr.on('data', (data) => {
+    console.error(`TTS error: ${data}`);
+  });
+
+  const fail = (message) => {
+    if (ttsDaemon === child) ttsDaemon = null;
+    for (const [id, pending] of ttsPending) {
+      pending.resolve({ event: 'error', id, message });
+    }
+    ttsPending.clear();
+  };
+  child.on('error', (error) => fail(error.message));
+  child.stdin.on('error', (error) => fail(error.message));
+  child.on('close', (code) => fail(`TTS daemon exited with code ${code}`));
+
+  return child;
+};
+
+const sendToTTSDaemon = (request) => {
+  if (!ttsDaemon) {
+    ttsDaemon = startTTSDaemon();
+  }
+  ttsDaemon.stdin.write(JSON.stringify(request) + '\n');
+};
+
+// Barge-in: cut off whatever Qlippy is saying and drop queued replies
+const stopSpeaking = () => {
+  if (ttsDaemon && isSpeaking) {
+    sendToTTSDaemon({ cmd: 'stop' });
+  }
+};
+
+// Fallback when the daemon cannot run: one process per utterance
+const speakOnce = (text) => new Promise((resolve) => {
+  const pythonProcess = spawn('python3', [
+    path.join(__dirname, 'lib', 'tts.py'),
+    '--',
+    text
+  ]);
+  pythonProcess.stderr.on('data', (data) => {
+    console.error(`TTS error: ${data}`);
+  });
+  pythonProcess.on('error', (error) => resolve({ event: 'error', message: error.message }));
+  pythonProcess.on('close', (code) => resolve(code === 0 ? { event: 'done' } : { event: 'error', message: 'TTS failed' }));
+});
+
+const speakWithDaemon = (text, traceId, onStarted) => new Promise((resolve) => {
+  const id = String(++ttsNextId);
+  ttsPending.set(id, { resolve, onStarted });
+  sendToTTSDaemon({ cmd: 'speak', id, text, trace_id: traceId });
+});
+
+// turn (optional) is the TurnTrace of the voice turn this reply answers
+const speakResponse = async (text, turn) => {
   if (isSpeaking) return;
   
   try {
@@ -457,36 +665,27 @@ const speakResponse = async (text) => {
     if (appWindow) {
       appWindow.webContents.send('speaking-started');
     }
-    
-    // Use Python pyttsx3 for TTS
-    const pythonProcess = spawn('python3', [
-      path.join(__dirname, 'lib', 'tts.py'),
-      text
-    ]);
-    
-    pythonProcess.stderr.on('data', (data) => {
-      console.error(`TTS error: ${data}`);
-    });
-    
-    pythonProcess.on('error', (error) => {
-      console.error('TTS error:', error);
-      isSpeaking = false;
-      if (appWindow) {
-        appWindow.webContents.send('speaking-error', error.message);
-      }
+
+    const requested = nowMs();
+    let result = await speakWithDaemon(text, turn && turn.id, (event) => {
+      if (turn) turn.add('tts.first_audio', requested, nowMs(), { cached: event.cached, queue_wait_ms: event.wait_ms }, 'tts');
     });
-    
-    pythonProcess.on('close', (code) => {
-      console.log('TTS completed with code:', code);
-      isSpeaking = false;
-      if (appWindow) {
-        if (code === 0) {
-          appWindow.webContents.send('speaking-complete');
-        } else {
-          appWindow.webContents.send('speaking-error', 'TTS failed');
-        }
+    if (result.event === 'error' && !ttsDaemon) {
+      console.error('TTS daemon unavailable, falling back to one-shot TTS:', result.message);
+      result = await speakOnce(text);
+    }
+    if (turn) turn.add('tts.speak', requested, nowMs(), { result: result.event }, 'tts');
+
+    console.log('TTS finished:', result.event);
+    isSpeaking = false;
+    if (appWindow) {
+      if (result.event === 'error') {
+        appWindow.webContents.send('speaking-error', result.message || 'TTS failed');
+      } else {
+        // A cancelled (interrupted) reply still ends normally for the UI
+        appWindow.webContents.send('speaking-complete');
       }
-    });
+    }
     
   } catch (error) {
     console.error('Failed to start TTS:', error);
@@ -505,6 +704,11 @@ const handleWakeWord = async () => {
   mainWindow.setPosition(screenWidth - 200, 100);
   mainWindow.show();
   mainWindow.webContents.send('wake-word-detected');
+
+  stopSpeaking();
+  warmUpVoiceServer();
+  currentTurn = new TurnTrace();
+  currentTurn.start('wake'); // Until the microphone is recording
   
   // Start recording immediately (no spoken greeting)
   startRecording();
@@ -558,6 +762,10 @@ const updateTrayMenu = () => {
 
 const cleanup = () => {
   stopVoiceDetection();
+  if (ttsDaemon) {
+    ttsDaemon.stdin.end(); // The daemon quits when stdin closes
+    ttsDaemon = null;
+  }
   if (porcupine) {
     porcupine.release();
     porcupine = null;
@@ -572,6 +780,7 @@ const cleanup = () => {
 app.on('ready', () => {
   createWindow();
   createTray();
+  ttsDaemon = startTTSDaemon(); // Initialize the speech engine before the first reply
   startVoiceDetection(); // Start listening by default
 });
 
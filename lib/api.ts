@@ -3,12 +3,23 @@
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5001/api';
 
+export interface Attachment {
+  id: string;
+  message_id: string | null;
+  sha256: string;
+  filename: string;
+  content_type: string;
+  size: number;
+  created_at: string;
+}
+
 export interface Message {
   id: string;
   role: 'user' | 'assistant';
   content: string;
   timestamp: string;
   conversation_id: string;
+  attachments?: Attachment[];
 }
 
 export interface Conversation {
@@ -36,6 +47,16 @@ export interface SearchResult {
   total_results: number;
 }
 
+export interface TitleSuggestions {
+  prefix: string;
+  conversations: {
+    id: string;
+    title: string;
+    last_updated: string;
+  }[];
+  terms: string[];
+}
+
 export interface Plugin {
   id: string;
   name: string;
@@ -134,14 +155,28 @@ class QlippyAPI {
   async addMessage(
     conversationId: string,
     role: 'user' | 'assistant',
-    content: string
+    content: string,
+    attachmentIds: string[] = []
   ): Promise<Message> {
     return this.request(`/conversations/${conversationId}/messages`, {
       method: 'POST',
-      body: JSON.stringify({ role, content }),
+      body: JSON.stringify({ role, content, attachment_ids: attachmentIds }),
     });
   }
 
+  // Attachments (the file is streamed as the raw request body)
+  async uploadAttachment(file: File): Promise<Attachment> {
+    return this.request(`/attachments?filename=${encodeURIComponent(file.name)}`, {
+      method: 'POST',
+      headers: { 'Content-Type': file.type || 'application/octet-stream' },
+      body: file,
+    });
+  }
+
+  attachmentUrl(attachmentId: string): string {
+    return `${this.baseUrl}/attachments/${attachmentId}`;
+  }
+
   async updateMessage(messageId: string, content: string): Promise<Message> {
     return this.request(`/messages/${messageId}`, {
       method: 'PUT',
@@ -192,6 +227,11 @@ class QlippyAPI {
     return this.request(`/search?q=${encodeURIComponent(query)}`);
   }
 
+  // Title autocomplete (cheap enough to call on every keystroke)
+  async suggestTitles(prefix: string, limit: number = 8): Promise<TitleSuggestions> {
+    return this.request(`/search/suggest?prefix=${encodeURIComponent(prefix)}&limit=${limit}`);
+  }
+
   // Space management
   async getSpaces(): Promise<Space[]> {
     return this.request('/spaces');
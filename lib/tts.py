@@ -1,5 +1,64 @@
-import pyttsx3
+"""
+Qlippy text-to-speech.
+
+One-shot:  python tts.py [--] 'text to speak'    # -- before text that starts with "-"
+Streamed:  llm-command | python tts.py --stream
+Daemon:    python tts.py --daemon [--socket /tmp/qlippy-tts.sock] [--cache-dir DIR]
+
+The daemon keeps one initialized pyttsx3 engine and reads newline-delimited
+JSON requests from stdin (or from clients of a Unix socket):
+
+    {"cmd": "speak", "id": "1", "text": "Hello", "interrupt": false}
+    {"cmd": "stream", "id": "r1", "text": "Partial repl"}   # reply still being generated
+    {"cmd": "stream", "id": "r1", "text": "y. More.", "end": true}
+    {"cmd": "stop"}                       # barge-in: cut off speech, drop the queue
+    {"cmd": "set", "rate": 170, "voice": "<voice id>"}
+    {"cmd": "voices"}
+    {"cmd": "prewarm", "phrases": ["Sorry, I didn't catch that."]}
+    {"cmd": "ping"}
+    {"cmd": "quit"}
+
+and writes JSON events to stdout (or to every socket client): ready, queued,
+started, done, cancelled, first_audio, voices, pong and error. Speak requests
+are queued and spoken in order; "set" applies to everything queued after it.
+A "trace_id" on a speak or stream request is echoed on its events, so the
+caller can attribute speech timings to a voice turn.
+
+Streamed text is cut at sentence boundaries and each sentence is spoken as
+soon as it is complete, so speech starts while the rest of the reply is
+still being generated.
+
+With a cache directory, phrases that come up again (and a pre-warm list) are
+rendered to audio files in idle time; later requests for them are played
+straight from disk without running the synthesizer. A render is abandoned
+at the next word as soon as a request arrives, and retried once idle again.
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
 import sys
+import threading
+import time
+from collections import deque
+
+import pyttsx3
+
+from tts_cache import TTSCache, play_file
+
+CACHE_MAX_CHARS = 200  # Longer text is almost never repeated word for word
+CACHE_AFTER_REPEATS = 2  # Render a phrase to the cache once it has been spoken this often
+
+
+class _RenderInterrupted(RuntimeError):
+    """A cache render was stopped part-way for a request; its partial file is discarded"""
+
+
+def _trace_fields(trace_id):
+    return {"trace_id": trace_id} if trace_id else {}
+
 
 def speak(text, rate=150):
     try:
@@ -12,11 +71,555 @@ def speak(text, rate=150):
         print(f"Error: {str(e)}", file=sys.stderr)
         return False
 
+
+class SentenceSplitter:
+    """Cuts incrementally arriving text into sentences"""
+
+    # Sentence-ending punctuation, closing quotes/brackets, then whitespace
+    BOUNDARY = re.compile(r"[.!?…]+[\"')\]”’]*\s+|\n\s*\n")
+    ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "approx", "no", "fig"}
+    MAX_CHARS = 250  # Longer runs without a full stop are cut at a clause boundary
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        """Add a fragment; returns the sentences it completed"""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in self.BOUNDARY.finditer(self.buffer):
+            if self._is_abbreviation(self.buffer[start:match.start()]):
+                continue
+            sentences.append(self.buffer[start:match.end()].strip())
+            start = match.end()
+        self.buffer = self.buffer[start:]
+
+        while len(self.buffer) > self.MAX_CHARS:
+            cut = max(self.buffer.rfind(mark, 0, self.MAX_CHARS) for mark in (", ", "; ", ": ", " "))
+            if cut <= 0:
+                cut = self.MAX_CHARS - 1
+            sentences.append(self.buffer[:cut + 1].strip())
+            self.buffer = self.buffer[cut + 1:]
+        return [sentence for sentence in sentences if sentence]
+
+    def flush(self):
+        """The unfinished last sentence, once no more text is coming"""
+        remainder, self.buffer = self.buffer.strip(), ""
+        return [remainder] if remainder else []
+
+    def _is_abbreviation(self, sentence):
+        words = sentence.split()
+        if not words:
+            return False
+        last = words[-1].lower()
+        # "Dr. Smith", "e.g. this", or an initial like "J. Doe"
+        return last in self.ABBREVIATIONS or (len(last) == 1 and last.isalpha())
+
+
+class _Stream:
+    def __init__(self, stream_id, trace_id=None):
+        self.id = stream_id
+        self.trace_id = trace_id
+        self.splitter = SentenceSplitter()
+        self.received_at = time.perf_counter()
+        self.sentences = 0
+        self.pending = 0  # Sentences queued or being spoken
+        self.ended = False
+        self.first_audio_ms = None
+        self.cancelled = False
+
+
+class TTSDaemon:
+    """Speaks on the calling (main) thread; requests arrive from reader threads"""
+
+    def __init__(self, rate=150, voice=None, cache=None, prewarm=()):
+        started = time.perf_counter()
+        self.engine = pyttsx3.init()
+        self.engine.setProperty('rate', rate)
+        if voice:
+            self.engine.setProperty('voice', voice)
+        self.engine.connect('started-utterance', self._on_utterance_started)
+        # Checked between words so a stop cuts speech off mid-sentence
+        self.engine.connect('started-word', self._on_word)
+        self.init_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        self._inbox = deque()
+        self._cond = threading.Condition()
+        self._streams = {}
+        self._cancelled_streams = set()
+        self._current = None
+        self._cancel = threading.Event()
+        self._sinks = []
+        self._sinks_lock = threading.Lock()
+        self._next_id = 0
+
+        self.cache = cache
+        self._seen = {}  # cache key -> times spoken live
+        self._to_render = deque()  # (key, text, voice, rate, volume), rendered when idle
+        self._rendering = False
+        self._render_stopped = False
+        if cache:
+            self._queue_renders(prewarm)
+
+    # Events
+
+    def add_sink(self, callback):
+        """callback(event) receives every event as a dict"""
+        with self._sinks_lock:
+            self._sinks.append(callback)
+
+    def remove_sink(self, callback):
+        with self._sinks_lock:
+            if callback in self._sinks:
+                self._sinks.remove(callback)
+
+    def emit(self, event, **fields):
+        message = dict(event=event, **fields)
+        with self._sinks_lock:
+            for callback in list(self._sinks):
+                try:
+                    callback(message)
+                except OSError:
+                    self._sinks.remove(callback)
+
+    # Requests (any thread)
+
+    def handle(self, message):
+        try:
+            request = json.loads(message)
+            command = request["cmd"]
+        except (ValueError, KeyError, TypeError):
+            self.emit("error", message=f"Invalid request: {message.strip()[:200]}")
+            return True
+
+        if command == "stop":
+            self.interrupt()
+        elif command == "speak":
+            if not request.get("text"):
+                self.emit("error", id=request.get("id"), message="Nothing to speak")
+                return True
+            if request.get("interrupt"):
+                self.interrupt()
+            if request.get("id") is None:
+                request["id"] = self._new_id()
+            request["queued_at"] = time.perf_counter()
+            with self._cond:
+                self._inbox.append(request)
+                position = sum(1 for item in self._inbox if item["cmd"] == "speak")
+                self._cond.notify()
+            self.emit("queued", id=request["id"], position=position)
+        elif command == "stream":
+            self._stream(request)
+        elif command == "ping":
+            self.emit("pong", speaking=self._current is not None, queued=len(self._inbox),
+                      cache=self.cache.stats() if self.cache else None)
+        elif command in ("set", "voices", "prewarm", "quit"):
+            # Engine calls stay on the speaking thread, in order with queued speech
+            with self._cond:
+                self._inbox.append(request)
+                self._cond.notify()
+        else:
+            self.emit("error", message=f"Unknown command '{command}'")
+        return command != "quit"
+
+    def _new_id(self):
+        self._next_id += 1
+        return str(self._next_id)
+
+    def _stream(self, request):
+        stream_id = request.get("id")
+        if stream_id is None:
+            self.emit("error", message="stream requests need an id")
+            return
+        if request.get("interrupt"):
+            self.interrupt()
+
+        with self._cond:
+            if stream_id in self._cancelled_streams:
+                # Barged in on: ignore the rest of this reply
+                if request.get("end"):
+                    self._cancelled_streams.discard(stream_id)
+                return
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                stream = self._streams[stream_id] = _Stream(stream_id, request.get("trace_id"))
+            sentences = stream.splitter.feed(request.get("text", ""))
+            if request.get("end"):
+                sentences += stream.splitter.flush()
+                stream.ended = True
+            for sentence in sentences:
+                self._inbox.append({
+                    "cmd": "speak",
+                    "id": f"{stream_id}#{stream.sentences}",
+                    "text": sentence,
+                    "stream": stream_id,
+                    "trace_id": stream.trace_id,
+                    "queued_at": time.perf_counter()
+                })
+                stream.sentences += 1
+                stream.pending += 1
+            self._cond.notify()
+            finished = stream.ended and stream.pending == 0
+        if finished:
+            self._finish_stream(stream)
+
+    def _finish_stream(self, stream):
+        with self._cond:
+            self._streams.pop(stream.id, None)
+        self.emit(
+            "cancelled" if stream.cancelled else "done",
+            id=stream.id,
+            sentences=stream.sentences,
+            time_to_first_audio_ms=stream.first_audio_ms,
+            duration_ms=round((time.perf_counter() - stream.received_at) * 1000, 1),
+            **_trace_fields(stream.trace_id)
+        )
+
+    def interrupt(self):
+        """Cut off the current utterance and drop queued ones"""
+        with self._cond:
+            dropped = [item for item in self._inbox if item["cmd"] == "speak"]
+            self._inbox = deque(item for item in self._inbox if item["cmd"] != "speak")
+            streams = list(self._streams.values())
+            for stream in streams:
+                stream.cancelled = True
+                if not stream.ended:
+                    self._cancelled_streams.add(stream.id)
+            self._streams.clear()
+            if self._current is not None:
+                self._cancel.set()
+        for item in dropped:
+            if "stream" not in item:
+                self.emit("cancelled", id=item["id"], started=False, **_trace_fields(item.get("trace_id")))
+        for stream in streams:
+            self.emit("cancelled", id=stream.id, sentences=stream.sentences,
+                      time_to_first_audio_ms=stream.first_audio_ms, **_trace_fields(stream.trace_id))
+
+    # Engine callbacks (speaking thread)
+
+    def _on_word(self, name, location, length):
+        if self._cancel.is_set():
+            self.engine.stop()
+        elif self._rendering and self._inbox:
+            # Idle-time cache render: give way to the request that just arrived
+            self._render_stopped = True
+            self.engine.stop()
+
+    def _on_utterance_started(self, name):
+        if self._current is not None:
+            self._started(self._current)
+
+    def _started(self, request, cached=False):
+        stream = self._streams.get(request.get("stream"))
+        if stream is not None and stream.first_audio_ms is None:
+            stream.first_audio_ms = round((time.perf_counter() - stream.received_at) * 1000, 1)
+            self.emit("first_audio", id=stream.id, time_to_first_audio_ms=stream.first_audio_ms,
+                      **_trace_fields(request.get("trace_id")))
+        self.emit("started", id=request["id"], cached=cached,
+                  wait_ms=round((time.perf_counter() - request["queued_at"]) * 1000, 1),
+                  **_trace_fields(request.get("trace_id")))
+
+    def _complete(self, request, cancelled):
+        """Report a finished utterance, and its stream once the stream's last sentence is spoken"""
+        duration_ms = round((time.perf_counter() - request["queued_at"]) * 1000, 1)
+        if "stream" not in request:
+            self.emit("cancelled" if cancelled else "done", id=request["id"], started=True, duration_ms=duration_ms,
+                      **_trace_fields(request.get("trace_id")))
+            return
+        with self._cond:
+            stream = self._streams.get(request["stream"])
+            if stream is None:
+                return
+            stream.pending -= 1
+            finished = stream.ended and stream.pending == 0
+        if finished:
+            self._finish_stream(stream)
+
+    # Speaking (main thread)
+
+    def run(self):
+        self.emit("ready", init_ms=self.init_ms)
+        while True:
+            with self._cond:
+                while not self._inbox and not self._to_render:
+                    self._cond.wait()
+                request = self._inbox.popleft() if self._inbox else None
+                if request and request["cmd"] == "speak":
+                    # Under the same lock as interrupt(), so a stop arriving now cancels this request
+                    self._cancel.clear()
+                    self._current = request
+
+            if request is None:
+                # Nothing to say: render a cache entry
+                self._render_next()
+                continue
+
+            command = request["cmd"]
+            if command == "quit":
+                return
+            try:
+                if command == "speak":
+                    self._speak(request)
+                elif command == "set":
+                    if "rate" in request:
+                        self.engine.setProperty('rate', int(request["rate"]))
+                    if "voice" in request:
+                        self.engine.setProperty('voice', request["voice"])
+                    if "volume" in request:
+                        self.engine.setProperty('volume', float(request["volume"]))
+                    self.emit("settings", rate=self.engine.getProperty('rate'),
+                              voice=self.engine.getProperty('voice'))
+                elif command == "prewarm":
+                    if self.cache:
+                        self._queue_renders(request.get("phrases", []))
+                elif command == "voices":
+                    self.emit("voices", voices=[
+                        {"id": voice.id, "name": voice.name, "languages": [str(l) for l in voice.languages]}
+                        for voice in self.engine.getProperty('voices')
+                    ])
+            except Exception as e:
+                self.emit("error", id=request.get("id"), message=str(e))
+            finally:
+                with self._cond:
+                    self._current = None
+
+    def _speak(self, request):
+        if self._cancel.is_set():
+            self._complete(request, cancelled=True)
+            return
+
+        if self.cache and len(request["text"]) <= CACHE_MAX_CHARS:
+            key = self._cache_key(request["text"])
+            path = self.cache.get(key)
+            if path:
+                self._started(request, cached=True)
+                play_file(path, self._cancel)
+                self._complete(request, cancelled=self._cancel.is_set())
+                return
+            self._seen[key] = self._seen.get(key, 0) + 1
+            if self._seen[key] == CACHE_AFTER_REPEATS:
+                self._queue_renders([request["text"]])
+            if len(self._seen) > 10000:
+                self._seen.clear()
+
+        self.engine.say(request["text"], request["id"])
+        self.engine.runAndWait()
+        self._complete(request, cancelled=self._cancel.is_set())
+
+    # Cache (speaking thread)
+
+    def _voice_settings(self):
+        return (self.engine.getProperty('voice'), self.engine.getProperty('rate'),
+                round(float(self.engine.getProperty('volume')), 2))
+
+    def _cache_key(self, text):
+        return TTSCache.key(text, *self._voice_settings())
+
+    def _queue_renders(self, phrases):
+        """Render phrases with the current voice settings once the daemon is idle"""
+        voice, rate, volume = self._voice_settings()
+        with self._cond:
+            for text in phrases:
+                text = text.strip()
+                key = TTSCache.key(text, voice, rate, volume)
+                if text and len(text) <= CACHE_MAX_CHARS and key not in self.cache:
+                    self._to_render.append((key, text, voice, rate, volume))
+            self._cond.notify()
+
+    def _render_next(self):
+        with self._cond:
+            if not self._to_render:
+                return
+            entry = self._to_render.popleft()
+        key, text, voice, rate, volume = entry
+        if key in self.cache:
+            return
+
+        current = self._voice_settings()
+
+        def render(path):
+            self.engine.setProperty('voice', voice)
+            self.engine.setProperty('rate', rate)
+            self.engine.setProperty('volume', volume)
+            self._rendering, self._render_stopped = True, False
+            try:
+                self.engine.save_to_file(text, path)
+                self.engine.runAndWait()
+            finally:
+                self._rendering = False
+                self.engine.setProperty('voice', current[0])
+                self.engine.setProperty('rate', current[1])
+                self.engine.setProperty('volume', current[2])
+            if self._render_stopped:
+                raise _RenderInterrupted()
+
+        started = time.perf_counter()
+        try:
+            self.cache.put(key, render)
+        except _RenderInterrupted:
+            with self._cond:
+                self._to_render.appendleft(entry)
+            return
+        except Exception as e:
+            self.emit("error", message=f"Could not cache '{text[:40]}': {e}")
+            return
+        self.emit("cached", text=text, render_ms=round((time.perf_counter() - started) * 1000, 1))
+
+
+def open_cache(directory, max_mb):
+    if not directory:
+        return None
+    if not TTSCache.available():
+        print("No audio player found (afplay, paplay, aplay or ffplay); TTS cache disabled", file=sys.stderr)
+        return None
+    return TTSCache(directory, int(max_mb * 1024 * 1024))
+
+
+def read_phrases(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def speak_stream(fragments, rate=150, voice=None, on_event=None):
+    """
+    Speak an iterable of text fragments (e.g. LLM output as it is generated),
+    starting with the first complete sentence. Returns the final event, which
+    includes time_to_first_audio_ms.
+    """
+    daemon = TTSDaemon(rate=rate, voice=voice)
+    result = {}
+
+    def sink(event):
+        if on_event:
+            on_event(event)
+        if event.get("id") == "reply" and event["event"] in ("done", "cancelled"):
+            result.update(event)
+            daemon.handle('{"cmd": "quit"}')
+
+    def feed():
+        for fragment in fragments:
+            daemon.handle(json.dumps({"cmd": "stream", "id": "reply", "text": fragment}))
+        daemon.handle(json.dumps({"cmd": "stream", "id": "reply", "text": "", "end": True}))
+
+    daemon.add_sink(sink)
+    threading.Thread(target=feed, daemon=True).start()
+    daemon.run()
+    return result
+
+
+def read_stdin_fragments():
+    """Yield stdin text as soon as it arrives, not line by line"""
+    while True:
+        data = os.read(sys.stdin.fileno(), 4096)
+        if not data:
+            return
+        yield data.decode("utf-8", errors="replace")
+
+
+def read_lines(daemon, stream, on_eof):
+    for line in stream:
+        if line.strip() and not daemon.handle(line):
+            break
+    on_eof()
+
+
+def serve_socket(daemon, path, stop):
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen()
+
+    def client(connection):
+        stream = connection.makefile("r", encoding="utf-8")
+        write = lambda event: connection.sendall((json.dumps(event) + "\n").encode("utf-8"))
+        daemon.add_sink(write)
+        try:
+            read_lines(daemon, stream, on_eof=lambda: None)
+        except OSError:
+            pass
+        finally:
+            daemon.remove_sink(write)
+            connection.close()
+
+    def accept():
+        while not stop.is_set():
+            connection, _ = server.accept()
+            threading.Thread(target=client, args=(connection,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server
+
+
+def write_stdout(event):
+    sys.stdout.write(json.dumps(event) + "\n")
+    sys.stdout.flush()
+
+
+def run_daemon(args):
+    daemon = TTSDaemon(
+        rate=args.rate,
+        voice=args.voice,
+        cache=open_cache(args.cache_dir, args.cache_mb),
+        prewarm=read_phrases(args.prewarm)
+    )
+    stop = threading.Event()
+
+    def quit_daemon():
+        # stdin closed (the parent exited): finish the current utterance, then quit
+        daemon.handle('{"cmd": "quit"}')
+
+    if args.socket:
+        server = serve_socket(daemon, args.socket, stop)
+    else:
+        daemon.add_sink(write_stdout)
+        threading.Thread(target=read_lines, args=(daemon, sys.stdin, quit_daemon), daemon=True).start()
+
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if args.socket:
+            server.close()
+            if os.path.exists(args.socket):
+                os.unlink(args.socket)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python tts.py 'text to speak'", file=sys.stderr)
+    parser = argparse.ArgumentParser(description="Qlippy text-to-speech")
+    parser.add_argument("text", nargs="*", help="text to speak once and exit (put -- before text starting with '-')")
+    parser.add_argument("--daemon", action="store_true", help="keep running and read JSON requests")
+    parser.add_argument("--socket", help="Unix socket to listen on instead of stdin/stdout (daemon mode)")
+    parser.add_argument("--stream", action="store_true", help="speak stdin sentence by sentence as it arrives")
+    parser.add_argument("--rate", type=int, default=150, help="words per minute")
+    parser.add_argument("--voice", help="voice id")
+    parser.add_argument("--cache-dir", default=os.environ.get("QLIPPY_TTS_CACHE_DIR"),
+                        help="cache synthesized audio here (daemon mode)")
+    parser.add_argument("--cache-mb", type=float, default=float(os.environ.get("QLIPPY_TTS_CACHE_MB", 50)),
+                        help="size budget of the audio cache")
+    parser.add_argument("--prewarm", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_phrases.txt"),
+                        help="phrases to render into the cache at startup, one per line")
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon(args)
+        sys.exit(0)
+
+    if args.stream:
+        result = speak_stream(read_stdin_fragments(), rate=args.rate, voice=args.voice)
+        print(f"Time to first audio: {result.get('time_to_first_audio_ms')} ms", file=sys.stderr)
+        sys.exit(0)
+
+    text = " ".join(args.text)
+    if not text:
+        print("Usage: python tts.py [--] 'text to speak'", file=sys.stderr)
         sys.exit(1)
-    
-    text = sys.argv[1]
-    success = speak(text)
-    sys.exit(0 if success else 1) 
\ No newline at end of file
+
+    success = speak(text, args.rate)
+    sys.exit(0 if success else 1)
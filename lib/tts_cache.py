@@ -0,0 +1,143 @@
+"""
+On-disk cache of synthesized speech for lib/tts.py.
+Files are content-addressed by text, voice, rate and volume, and the least
+recently used ones are evicted once the cache grows past its size budget.
+Cache hits are played with the platform's audio player, without the
+speech synthesizer.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+# NSSpeechSynthesizer always renders AIFF; espeak and SAPI render WAV
+AUDIO_EXTENSION = ".aiff" if sys.platform == "darwin" else ".wav"
+
+
+def player_command(path):
+    """Command that plays an audio file, or None if no player is installed"""
+    if sys.platform == "darwin":
+        return ["afplay", path]
+    for command in (["paplay", path], ["aplay", "-q", path], ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", path]):
+        if shutil.which(command[0]):
+            return command
+    return None
+
+
+def play_file(path, cancel):
+    """Play an audio file to the end, or until the cancel event is set. Returns False if cut off."""
+    player = subprocess.Popen(player_command(path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    while player.poll() is None:
+        if cancel.wait(0.02):
+            player.terminate()
+            player.wait()
+            return False
+    return player.returncode == 0
+
+
+class TTSCache:
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = {}  # key -> [size, last used]
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def available():
+        return player_command("") is not None
+
+    @staticmethod
+    def key(text, voice, rate, volume):
+        identity = json.dumps([" ".join(text.split()), voice, rate, volume])
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + AUDIO_EXTENSION)
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            key, extension = os.path.splitext(name)
+            path = os.path.join(self.directory, name)
+            if extension != AUDIO_EXTENSION:
+                # Leftover from an interrupted render
+                if extension == ".partial":
+                    os.unlink(path)
+                continue
+            stat = os.stat(path)
+            self._index[key] = [stat.st_size, stat.st_mtime]
+
+    def get(self, key):
+        """Path of the cached audio for a key, or None"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            path = self.path(key)
+            try:
+                # mtime doubles as the LRU timestamp across restarts
+                os.utime(path)
+            except FileNotFoundError:
+                del self._index[key]
+                self.misses += 1
+                return None
+            entry[1] = time.time()
+            self.hits += 1
+            return path
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def put(self, key, render):
+        """Render audio for a key with render(path) and add it to the cache"""
+        partial = os.path.join(self.directory, key + ".partial")
+        try:
+            render(partial)
+            size = os.path.getsize(partial)
+        except (OSError, RuntimeError):
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+        if size == 0:
+            os.unlink(partial)
+            return None
+        path = self.path(key)
+        os.replace(partial, path)
+        with self._lock:
+            self._index[key] = [size, time.time()]
+            self._evict()
+        return path
+
+    def _evict(self):
+        total = sum(size for size, _ in self._index.values())
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self.path(key))
+            except FileNotFoundError:
+                pass
+            del self._index[key]
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": sum(size for size, _ in self._index.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
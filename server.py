@@ -1,16 +1,149 @@
-from fastapi import FastAPI, WebSocket, UploadFile, File
+from fastapi import FastAPI, WebSocket, UploadFile, File, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-import whisper
 import numpy as np
-import subprocess
-import tempfile
 import os
 import json
 from typing import Optional
 import asyncio
+import tempfile
+import time
+import uuid
 import wave
+from collections import deque
+from contextlib import asynccontextmanager
+from asr_pool import TranscriptionPool, PoolSaturated, default_replicas
+from audio import PCMBuffer, prepare_for_model, amplitude_stats
+from asr_engines import create_engine
+from vad import create_vad
+from trace_client import Trace, now_ms
+
+# Audio settings (clients stream 16-bit little-endian mono PCM at any rate)
+SAMPLE_RATE = 16000
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 192000
+FRAME_MS = 30
+AUDIO_GAIN = float(os.environ.get("QLIPPY_AUDIO_GAIN", 2.0))
+QUIET_AMPLITUDE = 100
+
+# Segmentation settings
+SILENCE_RMS_THRESHOLD = float(os.environ.get("QLIPPY_SILENCE_RMS", 200))
+MIN_SILENCE_MS = int(os.environ.get("QLIPPY_MIN_SILENCE_MS", 500))
+MIN_SPEECH_MS = 200
+PREROLL_MS = 200
+MAX_SEGMENT_SECONDS = 30  # Whisper's context window
+
+# File upload settings
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+UPLOAD_READ_SECONDS = 5  # Audio read from disk per segmenter step
+UPLOAD_PARALLEL_SEGMENTS = int(os.environ.get("QLIPPY_UPLOAD_PARALLEL", 0))  # 0: two per worker
+MAX_UPLOAD_JOBS = 50  # Finished jobs kept for the status endpoint
+
+# Voice-activity detection settings (vad: energy or webrtc)
+VAD_ENGINE = os.environ.get("QLIPPY_VAD", "energy")
+VAD_MAX_ZCR = float(os.environ.get("QLIPPY_VAD_MAX_ZCR", 0.35))
+VAD_AGGRESSIVENESS = int(os.environ.get("QLIPPY_VAD_AGGRESSIVENESS", 2))
+
+# Worker pool settings
+ASR_REPLICAS = int(os.environ.get("QLIPPY_ASR_REPLICAS", 0)) or default_replicas()
+ASR_MAX_QUEUE = int(os.environ.get("QLIPPY_ASR_MAX_QUEUE", 32))
+ASR_JOB_TIMEOUT = float(os.environ.get("QLIPPY_ASR_JOB_TIMEOUT", 60))
+ASR_MAX_BATCH = int(os.environ.get("QLIPPY_ASR_MAX_BATCH", 4))
+ASR_BATCH_DELAY_MS = float(os.environ.get("QLIPPY_ASR_BATCH_DELAY_MS", 5))
+
+# Model lifecycle settings
+ASR_PRELOAD = os.environ.get("QLIPPY_ASR_PRELOAD", "true").lower() == "true"
+ASR_IDLE_UNLOAD_SECONDS = float(os.environ.get("QLIPPY_ASR_IDLE_UNLOAD_SECONDS", 900))  # 0 keeps the model loaded
+
+# ASR engine settings (engine: whisper, faster-whisper or stub)
+ASR_ENGINE = os.environ.get("QLIPPY_ASR_ENGINE", "whisper")
+ASR_MODEL = os.environ.get("QLIPPY_ASR_MODEL", "base")
+ASR_COMPUTE_TYPE = os.environ.get("QLIPPY_ASR_COMPUTE_TYPE", "int8")
+ASR_THREADS = int(os.environ.get("QLIPPY_ASR_THREADS", 0)) or max(1, (os.cpu_count() or 1) // ASR_REPLICAS)
+ASR_BEAM_SIZE = int(os.environ.get("QLIPPY_ASR_BEAM_SIZE", 1))
+
+engine = create_engine(
+    ASR_ENGINE,
+    model_size=ASR_MODEL,
+    compute_type=ASR_COMPUTE_TYPE,
+    threads=ASR_THREADS,
+    beam_size=ASR_BEAM_SIZE
+)
+
+
+def load_engine():
+    print(f"Loading {engine.name} model ({engine.model_size})...")
+    engine.load()
+    print(f"{engine.name} model loaded!")
+    return engine
+
+
+def run_transcription(engine, job):
+    """Transcribe (int16 samples, sample rate) with the ASR engine (runs in a pool worker)"""
+    samples, sample_rate = job
+    return engine.transcribe(prepare_for_model(samples, sample_rate, AUDIO_GAIN))
+
+
+def run_transcription_batch(engine, jobs):
+    """Transcribe a micro-batch of (int16 samples, sample rate) jobs in one engine call"""
+    return engine.transcribe_batch([
+        prepare_for_model(samples, sample_rate, AUDIO_GAIN) for samples, sample_rate in jobs
+    ])
+
+
+pool = TranscriptionPool(
+    load_engine,
+    run_transcription,
+    run_batch=run_transcription_batch if engine.supports_batching else None,
+    replicas=ASR_REPLICAS,
+    max_queue=ASR_MAX_QUEUE,
+    job_timeout=ASR_JOB_TIMEOUT,
+    max_batch_size=ASR_MAX_BATCH,
+    batch_delay=ASR_BATCH_DELAY_MS / 1000,
+    idle_timeout=ASR_IDLE_UNLOAD_SECONDS or None
+)
+
+
+# Recent seconds of compute per second of audio, to estimate what trimming saved
+recent_rtf = deque(maxlen=50)
+
+
+def estimated_rtf():
+    if not recent_rtf:
+        return None
+    return sorted(recent_rtf)[len(recent_rtf) // 2]
+
+
+async def warm_up():
+    try:
+        await pool.warm_up()
+    except Exception as e:
+        print(f"Failed to load {engine.name} model: {e}")
+
+
+warm_up_task = None
+
+
+def start_warm_up():
+    """Warm the model up in the background, unless a warm-up is already running"""
+    global warm_up_task
+    if warm_up_task is None or warm_up_task.done():
+        warm_up_task = asyncio.create_task(warm_up())
+    return warm_up_task
+
+
+@asynccontextmanager
+async def lifespan(app):
+    pool.start()
+    # Load in the background so /health answers (with ready: false) while the model loads
+    if ASR_PRELOAD:
+        start_warm_up()
+    yield
+    if warm_up_task:
+        warm_up_task.cancel()
+    await pool.stop()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for local development
 app.add_middleware(
@@ -21,128 +154,489 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Whisper model
-print("Loading Whisper model...")
-model = whisper.load_model("base")
-print("Whisper model loaded!")
+
+class Segment:
+    def __init__(self, index, start, end, audio):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.audio = audio
+        self.closed_at_ms = now_ms()  # When the pause ended it, for queue-wait spans
+
+
+class SilenceSegmenter:
+    """Cuts a stream of PCM16 audio into speech segments at pauses"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, vad=None):
+        self.sample_rate = sample_rate
+        self.vad = vad or create_vad("energy", sample_rate=sample_rate, rms_threshold=SILENCE_RMS_THRESHOLD)
+        self.frame_len = sample_rate * FRAME_MS // 1000
+        self.preroll_frames = PREROLL_MS // FRAME_MS
+        self.min_silence_frames = MIN_SILENCE_MS // FRAME_MS
+        self.min_speech_frames = MIN_SPEECH_MS // FRAME_MS
+        self.max_samples = MAX_SEGMENT_SECONDS * sample_rate
+        self.buffer = PCMBuffer(sample_rate * 10)
+        self._analyzed = 0
+        self._segment_start = None
+        self._last_end = 0
+        self._speech_frames = 0
+        self._silence_run = 0
+        self._next_index = 0
+        self.max_amplitude = 0
+        self.abs_sum = 0
+        self.speech_samples = 0
+        self.analysis_seconds = 0.0
+
+    def feed(self, data):
+        """Add raw PCM16 bytes, returning any segments closed by a pause"""
+        self.buffer.append(data)
+        frame_count = (self.buffer.end - self._analyzed) // self.frame_len
+        if frame_count == 0:
+            return []
+        frames = self.buffer.view(self._analyzed, self._analyzed + frame_count * self.frame_len)
+        frames = frames.reshape(frame_count, self.frame_len)
+
+        # Vectorized per-frame loudness and speech labels
+        started = time.perf_counter()
+        max_amplitude, abs_sum = amplitude_stats(frames)
+        self.max_amplitude = max(self.max_amplitude, max_amplitude)
+        self.abs_sum += abs_sum
+        speech = self.vad.is_speech(frames)
+        self.analysis_seconds += time.perf_counter() - started
+
+        segments = []
+        for is_speech in speech:
+            segment = self._push(is_speech)
+            if segment is not None:
+                segments.append(segment)
+
+        # Release audio that no segment can reach any more
+        keep_from = self._segment_start
+        if keep_from is None:
+            keep_from = self._analyzed - self.preroll_frames * self.frame_len
+        if keep_from - self.buffer.offset >= self.sample_rate * 5:
+            self.buffer.discard_before(keep_from)
+        return segments
+
+    def flush(self):
+        """Close the segment in progress at end of stream"""
+        if self._segment_start is None:
+            return []
+        segment = self._close(self.buffer.end)
+        return [segment] if segment is not None else []
+
+    def _push(self, is_speech):
+        frame_start = self._analyzed
+        self._analyzed += self.frame_len
+        if self._segment_start is None:
+            if not is_speech:
+                return None
+            # Start with a short pre-roll so the first syllable is not clipped
+            self._segment_start = max(frame_start - self.preroll_frames * self.frame_len, self._last_end, self.buffer.offset)
+
+        if is_speech:
+            self._speech_frames += 1
+            self._silence_run = 0
+        else:
+            self._silence_run += 1
+
+        if self._silence_run >= self.min_silence_frames or self._analyzed - self._segment_start >= self.max_samples:
+            return self._close(self._analyzed)
+        return None
+
+    def _close(self, end):
+        # Drop trailing silence beyond the pre-roll length
+        end -= max(0, self._silence_run - self.preroll_frames) * self.frame_len
+        start, speech_frames = self._segment_start, self._speech_frames
+        self._segment_start = None
+        self._last_end = end
+        self._speech_frames = 0
+        self._silence_run = 0
+
+        # Ignore clicks and blips that are too short to be speech
+        if speech_frames < self.min_speech_frames:
+            return None
+
+        segment = Segment(
+            self._next_index,
+            start / self.sample_rate,
+            end / self.sample_rate,
+            self.buffer.view(start, end)
+        )
+        self._next_index += 1
+        self.speech_samples += end - start
+        return segment
+
+    def metrics(self):
+        return {
+            "max_amplitude": self.max_amplitude,
+            "mean_amplitude": int(self.abs_sum / self.buffer.end) if self.buffer.end else 0,
+            "duration": self.buffer.end / self.sample_rate,
+            "sample_rate": self.sample_rate
+        }
+
+    def vad_report(self, rtf=None):
+        """How much audio the VAD kept away from the model, and the compute that saved"""
+        total = self.buffer.end / self.sample_rate
+        speech = self.speech_samples / self.sample_rate
+        removed = total - speech
+        return {
+            "vad": self.vad.name,
+            "audio_seconds": round(total, 3),
+            "speech_seconds": round(speech, 3),
+            "removed_seconds": round(removed, 3),
+            "removed_percent": round(100 * removed / total, 1) if total else 0.0,
+            "estimated_seconds_saved": round(removed * rtf, 3) if rtf is not None else None,
+            "analysis_ms": round(self.analysis_seconds * 1000, 3)
+        }
+
+    def trace_vad(self, trace, start_ms):
+        """Record the frame analysis time (spread over the stream) as one span"""
+        report = self.vad_report()
+        trace.add(
+            "asr.vad", start_ms, start_ms + report["analysis_ms"],
+            vad=report["vad"], audio_seconds=report["audio_seconds"], removed_percent=report["removed_percent"]
+        )
+
 
 @app.websocket("/ws/record")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    Streaming transcription. The client sends binary frames of 16-bit mono PCM
+    (at ?sample_rate=, default 16 kHz) and the text message "stop" when done. Each segment closed by a
+    pause is transcribed right away and pushed as a "partial" message; "final"
+    carries the full transcription once the stream ends. Spans are reported
+    for the voice turn given as ?trace_id=.
+    """
     await websocket.accept()
-    
+    trace = Trace(websocket.query_params.get("trace_id"))
+    stream_started = now_ms()
+    stop_received = None
+
+    sample_rate = int(websocket.query_params.get("sample_rate", SAMPLE_RATE))
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        await websocket.send_json({
+            "status": "error",
+            "message": f"Unsupported sample rate {sample_rate}"
+        })
+        await websocket.close()
+        return
+
+    segmenter = SilenceSegmenter(sample_rate, create_vad(
+        VAD_ENGINE,
+        sample_rate=sample_rate,
+        rms_threshold=SILENCE_RMS_THRESHOLD,
+        max_zcr=VAD_MAX_ZCR,
+        aggressiveness=VAD_AGGRESSIVENESS
+    ))
+    pending_segments = asyncio.Queue()
+    transcripts = []
+
+    async def transcribe_segments():
+        # Runs alongside the receive loop so partials arrive while the user talks
+        while True:
+            segment = await pending_segments.get()
+            if segment is None:
+                return
+            started = time.perf_counter()
+            text = await pool.transcribe((segment.audio, sample_rate))
+            recent_rtf.append((time.perf_counter() - started) / max(segment.end - segment.start, 0.1))
+            trace.add("asr.segment", segment.closed_at_ms, segment=segment.index,
+                      audio_seconds=round(segment.end - segment.start, 3))
+            if not text:
+                continue
+            transcripts.append({"index": segment.index, "start": segment.start, "end": segment.end, "text": text})
+            await websocket.send_json({
+                "status": "partial",
+                "segment": segment.index,
+                "start": round(segment.start, 3),
+                "end": round(segment.end, 3),
+                "transcription": text,
+                "text_so_far": " ".join(t["text"] for t in transcripts)
+            })
+
+    transcriber = asyncio.create_task(transcribe_segments())
+
     try:
-        # Create a temporary file for the recording
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-            temp_path = temp_file.name
-            
-            # Start FFmpeg process for recording
-            ffmpeg_cmd = [
-                'ffmpeg',
-                '-f', 'avfoundation',
-                '-i', ':0',  # Use built-in microphone
-                '-acodec', 'pcm_s16le',
-                '-ar', '16000',
-                '-ac', '1',
-                '-af', 'volume=2.0',
-                '-y',
-                temp_path
-            ]
-            
-            # Start recording
-            process = subprocess.Popen(
-                ffmpeg_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            await websocket.send_json({"status": "recording", "message": "Recording started"})
-            
-            # Wait for stop signal
-            while True:
-                try:
-                    data = await websocket.receive_text()
-                    if data == "stop":
-                        break
-                except Exception as e:
-                    print(f"Error receiving websocket data: {e}")
-                    break
-            
-            # Stop recording
-            process.terminate()
-            process.wait()
-            
-            # Verify the recording
-            try:
-                with wave.open(temp_path, 'rb') as wav_file:
-                    frames = wav_file.readframes(wav_file.getnframes())
-                    audio_data = np.frombuffer(frames, dtype=np.int16)
-                    max_amplitude = np.max(np.abs(audio_data))
-                    mean_amplitude = np.mean(np.abs(audio_data))
-                    
-                    await websocket.send_json({
-                        "status": "processing",
-                        "message": "Processing audio...",
-                        "metrics": {
-                            "max_amplitude": int(max_amplitude),
-                            "mean_amplitude": int(mean_amplitude),
-                            "duration": wav_file.getnframes() / wav_file.getframerate()
-                        }
-                    })
-                    
-                    # Check if audio is too quiet (lowered threshold for better detection)
-                    if max_amplitude < 100:  # More reasonable threshold for normal speech
-                        await websocket.send_json({
-                            "status": "error",
-                            "message": "Audio too quiet - please speak louder"
-                        })
-                        return
-                
-                # Transcribe with Whisper
-                result = model.transcribe(
-                    temp_path,
-                    language="en",
-                    initial_prompt="The following is a voice command or message:",
-                    condition_on_previous_text=False
-                )
-                
-                transcription = result["text"].strip()
-                if transcription:
-                    await websocket.send_json({
-                        "status": "success",
-                        "message": "Transcription complete",
-                        "transcription": transcription
-                    })
-                else:
-                    await websocket.send_json({
-                        "status": "error",
-                        "message": "No speech detected"
-                    })
-                    
-            except Exception as e:
-                await websocket.send_json({
-                    "status": "error",
-                    "message": f"Error processing audio: {str(e)}"
-                })
-            
-            # Cleanup
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-                
+        await websocket.send_json({"status": "recording", "message": "Recording started"})
+
+        # Receive audio until the client says stop
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                transcriber.cancel()
+                return
+            if message.get("bytes"):
+                for segment in segmenter.feed(message["bytes"]):
+                    pending_segments.put_nowait(segment)
+            elif message.get("text") == "stop":
+                break
+
+        stop_received = now_ms()
+        trace.add("asr.stream", stream_started, stop_received, sample_rate=sample_rate)
+        for segment in segmenter.flush():
+            pending_segments.put_nowait(segment)
+        pending_segments.put_nowait(None)
+
+        metrics = segmenter.metrics()
+        await websocket.send_json({
+            "status": "processing",
+            "message": "Processing audio...",
+            "metrics": metrics
+        })
+        await transcriber
+        vad_report = segmenter.vad_report(estimated_rtf())
+
+        # Check if audio is too quiet (lowered threshold for better detection)
+        if not transcripts and metrics["max_amplitude"] * AUDIO_GAIN < QUIET_AMPLITUDE:
+            await websocket.send_json({
+                "status": "error",
+                "message": "Audio too quiet - please speak louder",
+                "vad": vad_report
+            })
+        elif transcripts:
+            await websocket.send_json({
+                "status": "final",
+                "message": "Transcription complete",
+                "transcription": " ".join(t["text"] for t in transcripts),
+                "segments": transcripts,
+                "metrics": metrics,
+                "vad": vad_report
+            })
+        else:
+            await websocket.send_json({
+                "status": "error",
+                "message": "No speech detected",
+                "vad": vad_report
+            })
+
+    except PoolSaturated as e:
+        transcriber.cancel()
+        await websocket.send_json({
+            "status": "error",
+            "message": f"Server busy: {str(e)}"
+        })
+
     except Exception as e:
+        transcriber.cancel()
         await websocket.send_json({
             "status": "error",
             "message": f"Server error: {str(e)}"
         })
-    
+
     finally:
-        await websocket.close()
+        if stop_received is not None:
+            # End of speech to the last message: what the user waits for
+            trace.add("asr.finalize", stop_received, segments=len(transcripts))
+        segmenter.trace_vad(trace, stream_started)
+        trace.send()
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
+
+class FileTranscription:
+    """A POST /transcribe job: segments an uploaded WAV from disk and transcribes the pieces in parallel"""
+
+    def __init__(self, path, filename, duration, trace=None):
+        self.id = uuid.uuid4().hex
+        self.trace = trace or Trace(None)
+        self.path = path
+        self.filename = filename
+        self.duration = duration
+        self.status = "queued"
+        self.error = None
+        self.read_seconds = 0.0
+        self.segments_found = 0
+        self.segments_done = 0  # Transcribed, including silent ones that produced no text
+        self.segments = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    async def run(self):
+        self.status = "running"
+        self.started_at = time.time()
+        started_ms = now_ms()
+        try:
+            await self._transcribe()
+            self.status = "done"
+        except PoolSaturated as e:
+            self.status, self.error = "error", f"Server busy: {str(e)}"
+        except Exception as e:
+            self.status, self.error = "error", f"Server error: {str(e)}"
+        finally:
+            self.finished_at = time.time()
+            os.unlink(self.path)
+            self.trace.add("asr.transcribe_file", started_ms, status=self.status,
+                           audio_seconds=round(self.duration, 3), segments=len(self.segments))
+            self.trace.send()
+
+    async def _transcribe(self):
+        with wave.open(self.path, "rb") as wav_file:
+            sample_rate = wav_file.getframerate()
+            channels = wav_file.getnchannels()
+            segmenter = SilenceSegmenter(sample_rate, create_vad(
+                VAD_ENGINE,
+                sample_rate=sample_rate,
+                rms_threshold=SILENCE_RMS_THRESHOLD,
+                max_zcr=VAD_MAX_ZCR,
+                aggressiveness=VAD_AGGRESSIVENESS
+            ))
+            # Bounded fan-out: reading pauses while the pool is saturated, so memory stays flat
+            slots = asyncio.Semaphore(UPLOAD_PARALLEL_SEGMENTS or pool.replicas * 2)
+            tasks = []
+
+            async def transcribe_segment(segment):
+                try:
+                    text = await pool.transcribe((segment.audio, sample_rate))
+                    self.segments_done += 1
+                    self.trace.add("asr.segment", segment.closed_at_ms, segment=segment.index,
+                                   audio_seconds=round(segment.end - segment.start, 3))
+                    if text:
+                        self.segments.append({
+                            "index": segment.index,
+                            "start": round(segment.start, 3),
+                            "end": round(segment.end, 3),
+                            "text": text
+                        })
+                finally:
+                    slots.release()
+
+            async def schedule(segments):
+                for segment in segments:
+                    await slots.acquire()
+                    self.segments_found += 1
+                    tasks.append(asyncio.create_task(transcribe_segment(segment)))
+
+            try:
+                while True:
+                    data = await asyncio.to_thread(wav_file.readframes, sample_rate * UPLOAD_READ_SECONDS)
+                    if not data:
+                        break
+                    if channels > 1:
+                        # Downmix interleaved channels to mono
+                        frames = np.frombuffer(data, dtype="<i2").reshape(-1, channels)
+                        data = frames.mean(axis=1).astype("<i2").tobytes()
+                    await schedule(segmenter.feed(data))
+                    self.read_seconds = segmenter.buffer.end / sample_rate
+                await schedule(segmenter.flush())
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+            finally:
+                segmenter.trace_vad(self.trace, self.started_at * 1000)
+
+        self.segments.sort(key=lambda segment: segment["index"])
+
+    def describe(self):
+        read_fraction = self.read_seconds / self.duration if self.duration else 1.0
+        done = self.segments_done
+        end = self.finished_at or time.time()
+        result = {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "duration": round(self.duration, 3),
+            "progress": round(read_fraction * (done / self.segments_found if self.segments_found else 1.0), 3),
+            "segments_found": self.segments_found,
+            "segments_done": done,
+            "elapsed": round(end - self.started_at, 3) if self.started_at else 0.0
+        }
+        if self.status == "done":
+            result["transcription"] = " ".join(segment["text"] for segment in self.segments)
+            result["segments"] = self.segments
+            result["speedup"] = round(self.duration / result["elapsed"], 1) if result["elapsed"] else None
+        elif self.status == "error":
+            result["message"] = self.error
+        return result
+
+
+upload_jobs = {}
+
+
+def prune_upload_jobs():
+    finished = [job for job in upload_jobs.values() if job.finished_at]
+    for job in sorted(finished, key=lambda job: job.finished_at)[:max(0, len(upload_jobs) - MAX_UPLOAD_JOBS)]:
+        del upload_jobs[job.id]
+
+
+@app.post("/transcribe", status_code=202)
+async def transcribe_file(
+    response: Response,
+    file: UploadFile = File(...),
+    wait: bool = False,
+    x_qlippy_trace_id: Optional[str] = Header(None)
+):
+    """
+    Transcribe an uploaded 16-bit PCM WAV file (mono or stereo, any rate).
+    Returns a job id right away; poll GET /transcribe/{job_id} for progress
+    and the result, or pass ?wait=true to get the result in the response.
+    Spans are reported for the voice turn in the X-Qlippy-Trace-Id header.
+    """
+    trace = Trace(x_qlippy_trace_id)
+    received = now_ms()
+    # Copy the upload to our own temp file in chunks; the upload is closed once this request ends
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as target:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            await asyncio.to_thread(target.write, chunk)
+    trace.add("asr.upload", received, bytes=os.path.getsize(target.name))
+
+    try:
+        with wave.open(target.name, "rb") as wav_file:
+            if wav_file.getsampwidth() != 2:
+                raise ValueError("expected 16-bit PCM")
+            if not MIN_SAMPLE_RATE <= wav_file.getframerate() <= MAX_SAMPLE_RATE:
+                raise ValueError(f"unsupported sample rate {wav_file.getframerate()}")
+            duration = wav_file.getnframes() / wav_file.getframerate()
+    except (wave.Error, EOFError, ValueError) as e:
+        os.unlink(target.name)
+        raise HTTPException(status_code=400, detail=f"Invalid WAV file: {str(e)}")
+
+    job = FileTranscription(target.name, file.filename, duration, trace)
+    prune_upload_jobs()
+    upload_jobs[job.id] = job
+    job.task = asyncio.create_task(job.run())
+    if wait:
+        # A client that hangs up does not cancel the job; its result stays available
+        await asyncio.shield(job.task)
+        response.status_code = 200
+    return job.describe()
+
+
+@app.get("/transcribe/{job_id}")
+async def transcription_status(job_id: str):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Transcription job not found")
+    return job.describe()
+
+
+@app.post("/warmup")
+async def warmup():
+    """
+    Start loading the model if it is not loaded (e.g. on wake-word detection),
+    so it is ready by the time the user finishes speaking. Returns right away.
+    """
+    start_warm_up()
+    return {"status": "ok", "asr_state": pool.state}
+
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "ready": pool.state == "ready",
+        "asr_state": pool.state,
+        "asr_engine": engine.describe(),
+        "asr_pool": pool.stats(),
+        "vad": VAD_ENGINE,
+        "estimated_rtf": round(estimated_rtf(), 3) if recent_rtf else None
+    }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -15,8 +15,11 @@ brew install ffmpeg
 # Install Python dependencies
 echo "Installing Python dependencies..."
 pip install openai-whisper
+pip install faster-whisper  # optional int8 CPU engine (QLIPPY_ASR_ENGINE=faster-whisper)
+pip install webrtcvad  # optional model-based VAD (QLIPPY_VAD=webrtc)
 pip install fastapi
 pip install "uvicorn[standard]"
+pip install python-multipart  # file uploads (POST /transcribe)
 pip install numpy
 pip install torch
 pip install websockets
@@ -9,15 +9,146 @@ import sys
 import subprocess
 import signal
 import time
+import socket
+import json
+import logging
 import threading
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
+BACKEND_HEALTH_URL = "http://localhost:5001/api/health"
+FRONTEND_PORT = 3000
+
+# Child log settings
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+LOG_LINES_PER_SECOND = 200
+
+# Restart settings
+RESTART_BACKOFF_INITIAL = 1.0
+RESTART_BACKOFF_MAX = 30.0
+RESTART_STABLE_SECONDS = 60
+MAX_RESTARTS = 10
+
+class ManagedProcess:
+    """A supervised child process whose output is drained into a rotating log file"""
+    
+    def __init__(self, name, command, cwd, log_dir, env=None):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.env = env
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF_INITIAL
+        self.next_restart_at = None
+        self.recent_lines = deque(maxlen=20)
+        self.suppressed_lines = 0
+        self._rate_window = 0
+        self._rate_count = 0
+        self._rate_lock = threading.Lock()
+        
+        # One rotating log file per child
+        self.log_path = log_dir / f"{name}.log"
+        self.logger = logging.getLogger(f"qlippy.{name}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(self.log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+            
+    def start(self):
+        """Spawn the process and start draining its output"""
+        self.process = subprocess.Popen(
+            self.command,
+            cwd=self.cwd,
+            env=self.env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            errors="replace"
+        )
+        self.started_at = time.time()
+        self.next_restart_at = None
+        for stream, label in ((self.process.stdout, "out"), (self.process.stderr, "err")):
+            threading.Thread(
+                target=self._pump,
+                args=(stream, label),
+                name=f"{self.name}-{label}-pump",
+                daemon=True
+            ).start()
+        return self.process
+        
+    def _pump(self, stream, label):
+        """Read lines until EOF so the child never blocks on a full pipe"""
+        for line in iter(stream.readline, ""):
+            line = line.rstrip("\n")
+            self.recent_lines.append(line)
+            if self._allow_line():
+                self.logger.info("[%s:%s] %s", self.name, label, line)
+        stream.close()
+        
+    def _allow_line(self):
+        """Per-second rate limit for log writes; dropped lines are counted"""
+        with self._rate_lock:
+            window = int(time.time())
+            if window != self._rate_window:
+                if self.suppressed_lines:
+                    self.logger.info("[%s] ... %d lines suppressed (rate limit)", self.name, self.suppressed_lines)
+                    self.suppressed_lines = 0
+                self._rate_window = window
+                self._rate_count = 0
+            self._rate_count += 1
+            if self._rate_count > LOG_LINES_PER_SECOND:
+                self.suppressed_lines += 1
+                return False
+            return True
+            
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+        
+    def uptime(self):
+        if not self.is_running():
+            return 0.0
+        return time.time() - self.started_at
+        
+    def stop(self):
+        if self.is_running():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                
+    def status(self):
+        return {
+            "name": self.name,
+            "pid": self.process.pid if self.process else None,
+            "running": self.is_running(),
+            "uptime_seconds": round(self.uptime(), 1),
+            "restarts": self.restarts,
+            "exit_code": self.process.returncode if self.process else None,
+            "next_restart_in": round(max(0.0, self.next_restart_at - time.time()), 1) if self.next_restart_at else None,
+            "log_file": str(self.log_path)
+        }
+
 class QlippyStarter:
     def __init__(self):
         self.script_dir = Path(__file__).parent.absolute()
         self.backend_dir = self.script_dir / "backend"
         self.frontend_dir = self.script_dir
+        self.log_dir = self.script_dir / "logs"
+        self.status_file = self.log_dir / "supervisor.json"
         self.processes = []
+        self.start_time = time.perf_counter()
+        self.timeline = []
         
     def check_dependencies(self):
         """Check if all required dependencies are available"""
@@ -43,13 +174,22 @@ class QlippyStarter:
         print("✅ All dependencies found")
         return True
         
+    def mark(self, event):
+        """Record a startup milestone for the timeline"""
+        self.timeline.append((time.perf_counter() - self.start_time, event))
+        
+    def print_timeline(self):
+        """Print where startup time went"""
+        print("\n⏱️  Startup timeline:")
+        previous = 0.0
+        for elapsed, event in self.timeline:
+            print(f"   {elapsed * 1000:8.0f} ms  (+{(elapsed - previous) * 1000:6.0f} ms)  {event}")
+            previous = elapsed
+            
     def start_backend(self):
         """Start the Flask backend server"""
         print("🚀 Starting Backend Server...")
         
-        # Change to backend directory
-        os.chdir(self.backend_dir)
-        
         # Get Python executable from virtual environment
         if os.name == 'nt':  # Windows
             python_path = self.backend_dir / "venv" / "Scripts" / "python.exe"
@@ -61,27 +201,12 @@ class QlippyStarter:
             return None
             
         try:
-            # Start the backend server
-            process = subprocess.Popen(
-                [str(python_path), "run.py"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # Wait a moment for the server to start
-            time.sleep(2)
-            
-            # Check if process is still running
-            if process.poll() is None:
-                print("✅ Backend server started successfully")
-                return process
-            else:
-                stdout, stderr = process.communicate()
-                print(f"❌ Backend server failed to start:")
-                print(f"STDOUT: {stdout}")
-                print(f"STDERR: {stderr}")
-                return None
+            # Run without the auto-reloader so the app is only built once
+            env = dict(os.environ, QLIPPY_RELOAD="false")
+            process = ManagedProcess("backend", [str(python_path), "run.py"], self.backend_dir, self.log_dir, env=env)
+            process.start()
+            self.mark("backend process spawned")
+            return process
                 
         except Exception as e:
             print(f"❌ Failed to start backend server: {e}")
@@ -91,67 +216,100 @@ class QlippyStarter:
         """Start the Next.js frontend server"""
         print("🚀 Starting Frontend Server...")
         
-        # Change back to frontend directory
-        os.chdir(self.frontend_dir)
-        
         try:
             # Start the frontend server
-            process = subprocess.Popen(
-                ["npm", "run", "dev"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # Wait a moment for the server to start
-            time.sleep(3)
-            
-            # Check if process is still running
-            if process.poll() is None:
-                print("✅ Frontend server started successfully")
-                return process
-            else:
-                stdout, stderr = process.communicate()
-                print(f"❌ Frontend server failed to start:")
-                print(f"STDOUT: {stdout}")
-                print(f"STDERR: {stderr}")
-                return None
+            process = ManagedProcess("frontend", ["npm", "run", "dev"], self.frontend_dir, self.log_dir)
+            process.start()
+            self.mark("frontend process spawned")
+            return process
                 
         except Exception as e:
             print(f"❌ Failed to start frontend server: {e}")
             return None
             
-    def wait_for_backend(self, timeout=30):
-        """Wait for backend to be ready"""
-        print("⏳ Waiting for backend to be ready...")
+    def wait_until_ready(self, name, process, probe, timeout=30):
+        """Poll probe() with exponential backoff until it succeeds or the process exits"""
+        delay = 0.02
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if not process.is_running():
+                print(f"❌ {name} server failed to start (see {process.log_path}):")
+                for line in process.recent_lines:
+                    print(f"   {line}")
+                return False
+            if probe():
+                self.mark(f"{name.lower()} ready")
+                print(f"✅ {name} is ready!")
+                return True
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            
+        print(f"❌ {name} failed to start within timeout")
+        return False
         
-        import requests
+    def backend_healthy(self):
+        """True once the backend health endpoint answers"""
+        try:
+            with urllib.request.urlopen(BACKEND_HEALTH_URL, timeout=1) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+            
+    def frontend_listening(self):
+        """True once the Next.js dev server accepts connections"""
+        try:
+            with socket.create_connection(("localhost", FRONTEND_PORT), timeout=0.5):
+                return True
+        except OSError:
+            return False
+            
+    def supervise(self):
+        """Restart crashed children with exponential backoff. Returns False once one gives up."""
+        now = time.time()
+        for process in self.processes:
+            if process.is_running():
+                # Reset the backoff once a child has stayed up for a while
+                if process.uptime() >= RESTART_STABLE_SECONDS:
+                    process.backoff = RESTART_BACKOFF_INITIAL
+                continue
+                
+            if process.next_restart_at is None:
+                if process.restarts >= MAX_RESTARTS:
+                    print(f"❌ {process.name} crashed {process.restarts} times, giving up (see {process.log_path})")
+                    return False
+                process.next_restart_at = now + process.backoff
+                print(f"⚠️  {process.name} exited with code {process.process.returncode}, restarting in {process.backoff:.0f}s")
+                process.backoff = min(process.backoff * 2, RESTART_BACKOFF_MAX)
+            elif now >= process.next_restart_at:
+                process.restarts += 1
+                process.start()
+                print(f"🔁 {process.name} restarted (restart #{process.restarts})")
+        return True
         
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                response = requests.get("http://localhost:5001/api/health", timeout=1)
-                if response.status_code == 200:
-                    print("✅ Backend is ready!")
-                    return True
-            except:
-                pass
-            time.sleep(1)
-            
-        print("❌ Backend failed to start within timeout")
-        return False
+    def write_status(self):
+        """Write per-child uptime and restart counts for external inspection"""
+        status = {
+            "updated_at": time.time(),
+            "processes": [process.status() for process in self.processes]
+        }
+        tmp_path = self.status_file.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(status, indent=2))
+        os.replace(tmp_path, self.status_file)
         
+    def print_status(self, signum=None, frame=None):
+        """Print per-child uptime and restart counts"""
+        print("\n📊 Process status:")
+        for process in self.processes:
+            status = process.status()
+            state = "running" if status["running"] else "stopped"
+            print(f"   {status['name']:<10} {state:<8} pid={status['pid']} uptime={status['uptime_seconds']}s restarts={status['restarts']}")
+            
     def cleanup(self, signum=None, frame=None):
         """Clean up processes on exit"""
         print("\n🛑 Shutting down servers...")
         
         for process in self.processes:
-            if process and process.poll() is None:
-                process.terminate()
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    process.kill()
+            process.stop()
                     
         print("✅ All servers stopped")
         sys.exit(0)
@@ -164,46 +322,55 @@ class QlippyStarter:
         # Check dependencies
         if not self.check_dependencies():
             sys.exit(1)
+        self.mark("dependencies checked")
             
         # Set up signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self.cleanup)
         signal.signal(signal.SIGTERM, self.cleanup)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.print_status)
+        
+        self.log_dir.mkdir(exist_ok=True)
         
         try:
-            # Start backend
+            # Launch both servers at once; neither needs the other to boot
             backend_process = self.start_backend()
             if not backend_process:
                 sys.exit(1)
             self.processes.append(backend_process)
             
-            # Wait for backend to be ready
-            if not self.wait_for_backend():
-                self.cleanup()
-                sys.exit(1)
-                
-            # Start frontend
             frontend_process = self.start_frontend()
             if not frontend_process:
                 self.cleanup()
                 sys.exit(1)
             self.processes.append(frontend_process)
             
+            # Wait for both to be ready in parallel
+            print("⏳ Waiting for servers to be ready...")
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                backend_ready = pool.submit(self.wait_until_ready, "Backend", backend_process, self.backend_healthy)
+                frontend_ready = pool.submit(self.wait_until_ready, "Frontend", frontend_process, self.frontend_listening)
+                ready = backend_ready.result() and frontend_ready.result()
+            if not ready:
+                self.cleanup()
+                sys.exit(1)
+            
+            self.print_timeline()
             print("\n🎉 Qlippy is now running!")
             print("📍 Frontend: http://localhost:3000")
             print("🔗 Backend API: http://localhost:5001/api")
             print("💾 Database: SQLite (backend/instance/qlippy.db)")
+            print(f"📝 Logs: {self.log_dir} (status: {self.status_file.name})")
             print("\nPress Ctrl+C to stop all servers\n")
             
-            # Keep the main thread alive
+            # Supervise children until shutdown
             while True:
                 time.sleep(1)
                 
-                # Check if any process has died
-                for i, process in enumerate(self.processes):
-                    if process and process.poll() is not None:
-                        print(f"❌ Process {i} has stopped unexpectedly")
-                        self.cleanup()
-                        sys.exit(1)
+                if not self.supervise():
+                    self.cleanup()
+                    sys.exit(1)
+                self.write_status()
                         
         except KeyboardInterrupt:
             self.cleanup()
@@ -0,0 +1,92 @@
+"""
+Span reporting for voice-turn tracing.
+The voice server records spans against the trace id the client sent and
+hands them to a background thread that posts them to the backend's
+collector (POST /api/traces), so a slow or missing collector never delays
+a transcription.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+
+TRACE_HEADER = "X-Qlippy-Trace-Id"
+COLLECTOR_URL = os.environ.get("QLIPPY_TRACE_COLLECTOR_URL", "http://127.0.0.1:5001/api/traces")  # empty: don't send
+MAX_PENDING_BATCHES = 100
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+class Trace:
+    """Spans of one voice turn; every method is a no-op without a trace id"""
+
+    def __init__(self, trace_id, service="voice-server"):
+        self.trace_id = trace_id[:64] if trace_id else None
+        self.service = service
+        self.spans = []
+
+    def __bool__(self):
+        return self.trace_id is not None
+
+    def add(self, name, start_ms, end_ms=None, **attrs):
+        if self.trace_id is None:
+            return
+        self.spans.append({
+            "trace_id": self.trace_id,
+            "name": name,
+            "service": self.service,
+            "start": round(start_ms, 3),
+            "duration_ms": round((end_ms if end_ms is not None else now_ms()) - start_ms, 3),
+            "attrs": attrs
+        })
+
+    def send(self):
+        """Queue the recorded spans for the collector"""
+        if self.spans:
+            reporter.submit(self.spans)
+            self.spans = []
+
+
+class SpanReporter:
+    def __init__(self, url):
+        self.url = url
+        self.dropped = 0
+        self._outbox = queue.Queue(maxsize=MAX_PENDING_BATCHES)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, spans):
+        if not self.url:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-reporter", daemon=True)
+                self._thread.start()
+        try:
+            self._outbox.put_nowait(list(spans))
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def _run(self):
+        while True:
+            spans = self._outbox.get()
+            request = urllib.request.Request(
+                self.url,
+                data=json.dumps({"spans": spans}).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST"
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=2) as response:
+                    response.read()
+            except OSError:
+                # Collector not running: tracing is best effort
+                self.dropped += len(spans)
+
+
+reporter = SpanReporter(COLLECTOR_URL)
@@ -0,0 +1,81 @@
+"""
+Voice-activity detection for the Qlippy voice server.
+A VAD labels each fixed-length PCM16 frame as speech or not; the segmenter
+uses those labels to trim silence, split at pauses and drop silent
+recordings before they reach the ASR model.
+
+- energy: frame RMS plus zero-crossing rate, vectorized over every frame
+- webrtc: WebRTC's GMM voice detector (pip install webrtcvad), gated by energy
+"""
+
+import numpy as np
+
+from audio import frame_rms, frame_zcr
+
+
+class VAD:
+    name = "base"
+
+    def __init__(self, sample_rate=16000, rms_threshold=200, max_zcr=0.35, aggressiveness=2):
+        self.sample_rate = sample_rate
+        self.rms_threshold = rms_threshold
+        self.max_zcr = max_zcr
+        self.aggressiveness = aggressiveness
+
+    def is_speech(self, frames):
+        """Boolean array, one entry per row of a (frames, frame_len) int16 array"""
+        raise NotImplementedError
+
+    def describe(self):
+        return {"vad": self.name, "rms_threshold": self.rms_threshold}
+
+
+class EnergyVAD(VAD):
+    """
+    Loud frames are speech unless they cross zero like broadband noise does
+    (fan hiss, keyboard clatter); voiced speech sits well below max_zcr.
+    """
+    name = "energy"
+
+    def is_speech(self, frames):
+        return (frame_rms(frames) >= self.rms_threshold) & (frame_zcr(frames) <= self.max_zcr)
+
+    def describe(self):
+        return dict(super().describe(), max_zcr=self.max_zcr)
+
+
+class WebRTCVAD(VAD):
+    name = "webrtc"
+    SAMPLE_RATES = (8000, 16000, 32000, 48000)
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        import webrtcvad
+
+        self.model = webrtcvad.Vad(self.aggressiveness)
+
+    def is_speech(self, frames):
+        # Cheap energy gate first so the model only sees frames that could be speech
+        speech = frame_rms(frames) >= self.rms_threshold
+        if self.sample_rate not in self.SAMPLE_RATES:
+            return speech
+        for i in np.flatnonzero(speech):
+            speech[i] = self.model.is_speech(frames[i].astype("<i2").tobytes(), self.sample_rate)
+        return speech
+
+    def describe(self):
+        return dict(super().describe(), aggressiveness=self.aggressiveness)
+
+
+VADS = {
+    EnergyVAD.name: EnergyVAD,
+    WebRTCVAD.name: WebRTCVAD
+}
+
+
+def create_vad(name, **options):
+    try:
+        vad_class = VADS[name]
+    except KeyError:
+        raise ValueError(f"Unknown VAD '{name}' (choose from {', '.join(VADS)})")
+    return vad_class(**options)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Qlippy Voice Client
+Streams a WAV file to the voice server's /ws/record websocket the way a
+microphone client would, and prints partial and final transcripts.
+
+Usage: python voice_client.py recording.wav [--url ws://127.0.0.1:8000/ws/record] [--realtime]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import wave
+
+import websockets
+
+CHUNK_MS = 100
+
+
+def read_wav(path):
+    """Return (pcm16 bytes, sample rate) for a 16-bit mono WAV file"""
+    with wave.open(path, "rb") as wav_file:
+        if wav_file.getsampwidth() != 2 or wav_file.getnchannels() != 1:
+            raise ValueError(f"{path}: expected 16-bit mono PCM")
+        return wav_file.readframes(wav_file.getnframes()), wav_file.getframerate()
+
+
+async def stream_wav(path, url, realtime=False, on_message=None, on_stop=None):
+    """
+    Send a WAV file over /ws/record and return the server's last message.
+    on_stop() is called once the last audio and "stop" have been sent.
+    """
+    pcm, sample_rate = read_wav(path)
+    chunk_bytes = sample_rate * CHUNK_MS // 1000 * 2
+
+    async with websockets.connect(f"{url}?sample_rate={sample_rate}", max_size=None) as websocket:
+        last_message = json.loads(await websocket.recv())
+        if last_message["status"] == "error":
+            return last_message
+
+        async def send_audio():
+            for offset in range(0, len(pcm), chunk_bytes):
+                await websocket.send(pcm[offset:offset + chunk_bytes])
+                if realtime:
+                    await asyncio.sleep(CHUNK_MS / 1000)
+            await websocket.send("stop")
+            if on_stop:
+                on_stop()
+
+        sender = asyncio.create_task(send_audio())
+        async for raw in websocket:
+            last_message = json.loads(raw)
+            if on_message:
+                on_message(last_message)
+            if last_message["status"] in ("final", "error"):
+                break
+        await sender
+        return last_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a WAV file to the Qlippy voice server")
+    parser.add_argument("wav", help="16-bit mono WAV file")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/record")
+    parser.add_argument("--realtime", action="store_true", help="send audio at real-time speed")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def show(message):
+        elapsed = time.perf_counter() - started
+        if message["status"] == "partial":
+            print(f"[{elapsed:6.2f}s] partial #{message['segment']}: {message['transcription']}")
+        elif message["status"] == "final":
+            print(f"[{elapsed:6.2f}s] final: {message['transcription']}")
+        else:
+            print(f"[{elapsed:6.2f}s] {message['status']}: {message.get('message', '')}")
+
+    result = asyncio.run(stream_wav(args.wav, args.url, args.realtime, on_message=show))
+    sys.exit(0 if result["status"] == "final" else 1)
+
+
+if __name__ == "__main__":
+    main()